@@ -0,0 +1,196 @@
+"""在庫移動をもとにした分析（ABC 分析・消化率など）
+
+どの関数も conn を受け取り、集計は SQL 側の GROUP BY で 1 回で行う。
+"""
+
+# ABC 分析の区切り（出庫金額の累積構成比）
+ABC_A_SHARE = 0.80
+ABC_B_SHARE = 0.95
+
+# 集計の単位 → GROUP BY する列と表示用の列
+ABC_DIMENSIONS = {
+    "item": {
+        "label": "商品",
+        "group_by": "i.item_id",
+        "columns": "i.item_id AS item_id, i.name AS name, i.sku AS sku, i.size AS size, i.color AS color",
+    },
+    "size": {
+        "label": "サイズ",
+        "group_by": "COALESCE(i.size, '')",
+        "columns": "NULL AS item_id, COALESCE(i.size, '') AS name, NULL AS sku, i.size AS size, NULL AS color",
+    },
+    "color": {
+        "label": "色",
+        "group_by": "COALESCE(i.color, '')",
+        "columns": "NULL AS item_id, COALESCE(i.color, '') AS name, NULL AS sku, NULL AS size, i.color AS color",
+    },
+}
+
+
+def data_version(conn):
+    """集計結果のキャッシュキーに使う「データの版」
+
+    在庫移動の追加（最大 movement_id）と商品の更新（最大 updated_at）で変わる。
+    """
+    row = conn.execute(
+        """
+        SELECT
+            (SELECT MAX(movement_id) FROM STOCK_MOVEMENTS) AS last_movement_id,
+            (SELECT MAX(updated_at) FROM ITEMS) AS last_item_update
+        """
+    ).fetchone()
+    return (row[0], row[1])
+
+
+def abc_sell_through(conn, start, end, dimension="item"):
+    """期間 [start, end) の ABC 分類と消化率を返す
+
+    - out_value    : 出庫数 × 標準価格（base_price）
+    - abc_class    : out_value の累積構成比で A（〜80%）/ B（〜95%）/ C
+    - sell_through : 出庫数 ÷ 入庫数（入庫がなければ None）
+    start / end は "YYYY-MM-DD HH:MM:SS" 形式の文字列。
+    """
+    dim = ABC_DIMENSIONS[dimension]
+
+    # まず索引（movement_type, created_at, item_id, quantity）だけで商品ごとに集計し、
+    # ITEMS との結合は集計後の商品数分だけにする
+    rows = conn.execute(
+        f"""
+        WITH per_item AS (
+            SELECT
+                item_id,
+                SUM(CASE WHEN movement_type = 'OUT' THEN quantity ELSE 0 END) AS out_qty,
+                SUM(CASE WHEN movement_type = 'IN' THEN quantity ELSE 0 END) AS in_qty
+            FROM STOCK_MOVEMENTS
+            WHERE movement_type IN ('IN', 'OUT')
+              AND created_at >= ?
+              AND created_at < ?
+            GROUP BY item_id
+        )
+        SELECT
+            {dim["columns"]},
+            SUM(p.out_qty) AS out_qty,
+            SUM(p.in_qty) AS in_qty,
+            SUM(p.out_qty * COALESCE(i.base_price, 0)) AS out_value
+        FROM per_item p
+        JOIN ITEMS i ON i.item_id = p.item_id
+        GROUP BY {dim["group_by"]}
+        ORDER BY out_value DESC
+        """,
+        (start, end),
+    ).fetchall()
+
+    total_value = sum(row["out_value"] for row in rows)
+
+    results = []
+    cumulative = 0
+    for row in rows:
+        cumulative += row["out_value"]
+        share = cumulative / total_value if total_value else 1.0
+        # 自分を足す前の累積が区切り未満なら上位クラスに入れる
+        previous_share = (cumulative - row["out_value"]) / total_value if total_value else 1.0
+        if total_value and previous_share < ABC_A_SHARE:
+            abc_class = "A"
+        elif total_value and previous_share < ABC_B_SHARE:
+            abc_class = "B"
+        else:
+            abc_class = "C"
+
+        results.append({
+            "item_id": row["item_id"],
+            "name": row["name"],
+            "sku": row["sku"],
+            "size": row["size"],
+            "color": row["color"],
+            "out_qty": row["out_qty"],
+            "in_qty": row["in_qty"],
+            "out_value": row["out_value"],
+            "cumulative_share": round(share * 100, 1),
+            "abc_class": abc_class,
+            "sell_through": (
+                round(row["out_qty"] / row["in_qty"] * 100, 1) if row["in_qty"] else None
+            ),
+        })
+
+    return results
+
+
+def supplier_summaries(conn):
+    """仕入先一覧：仕入先ごとに入庫数合計・取扱商品数・最終入荷日を付けて新しい順に返す
+
+    集計は索引 idx_stock_movements_supplier（supplier_id, movement_type, created_at,
+    item_id, quantity）だけを 1 回なめて行う（テーブル本体は読まない）。
+    一覧をストリーミング描画できるよう、fetchall() せずに cursor のまま返す。
+    """
+    return conn.execute(
+        """
+        SELECT
+            s.supplier_id,
+            s.name,
+            s.phone,
+            s.email,
+            s.address,
+            s.note,
+            s.created_at,
+            COALESCE(st.in_qty, 0) AS in_qty,
+            COALESCE(st.item_count, 0) AS item_count,
+            st.last_delivery_at
+        FROM SUPPLIERS s
+        LEFT JOIN (
+            SELECT
+                supplier_id,
+                SUM(quantity) AS in_qty,
+                COUNT(DISTINCT item_id) AS item_count,
+                MAX(created_at) AS last_delivery_at
+            FROM STOCK_MOVEMENTS
+            WHERE supplier_id IS NOT NULL
+              AND movement_type = 'IN'
+            GROUP BY supplier_id
+        ) st ON st.supplier_id = s.supplier_id
+        ORDER BY s.supplier_id DESC
+        """
+    )
+
+
+def supplier_monthly(conn, supplier_id):
+    """仕入先 1 件の月別入庫（数量・金額・入荷回数・商品数）を新しい月から返す"""
+    return conn.execute(
+        """
+        SELECT
+            substr(m.created_at, 1, 7) AS month,
+            SUM(m.quantity) AS in_qty,
+            SUM(m.quantity * COALESCE(i.base_price, 0)) AS in_value,
+            COUNT(*) AS deliveries,
+            COUNT(DISTINCT m.item_id) AS item_count
+        FROM STOCK_MOVEMENTS m
+        LEFT JOIN ITEMS i ON i.item_id = m.item_id
+        WHERE m.supplier_id = ?
+          AND m.movement_type = 'IN'
+        GROUP BY month
+        ORDER BY month DESC
+        """,
+        (supplier_id,),
+    ).fetchall()
+
+
+def supplier_items(conn, supplier_id):
+    """仕入先 1 件から入荷した商品ごとの入庫数合計・最終入荷日"""
+    return conn.execute(
+        """
+        SELECT
+            m.item_id,
+            i.name,
+            i.sku,
+            i.size,
+            i.color,
+            SUM(m.quantity) AS in_qty,
+            MAX(m.created_at) AS last_delivery_at
+        FROM STOCK_MOVEMENTS m
+        LEFT JOIN ITEMS i ON i.item_id = m.item_id
+        WHERE m.supplier_id = ?
+          AND m.movement_type = 'IN'
+        GROUP BY m.item_id
+        ORDER BY last_delivery_at DESC
+        """,
+        (supplier_id,),
+    ).fetchall()
@@ -1,1181 +1,3431 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
-import sqlite3
-from datetime import datetime
-from functools import wraps
-from werkzeug.security import check_password_hash, generate_password_hash
-
-
-# ==== 設定 ====
-DB_NAME = "cloth_stock.db"   # DBファイル名
-
-# 在庫アラートのしきい値（この数以下なら要注意表示）
-LOW_STOCK_THRESHOLD = 5
-
-app = Flask(__name__)
-app.secret_key = "change_this_secret_key"  # 適当な長めの文字列でOK
-
-
-# ==== DB接続用ヘルパー ====
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # 行を dict 風に扱えるようにする
-    return conn
-
-def ensure_users_table():
-    """USERS テーブルと admin ユーザーを保証する"""
-    conn = get_db_connection()
-
-    # USERS テーブルが無ければ作る
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS USERS (
-            user_id       INTEGER PRIMARY KEY AUTOINCREMENT,
-            username      TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            created_at    TEXT NOT NULL,
-            role          TEXT
-        );
-        """
-    )
-
-    # admin ユーザーが 1 件もなければ作る（パスワード: testpass）
-    row = conn.execute(
-        "SELECT COUNT(*) AS cnt FROM USERS WHERE username = 'admin'"
-    ).fetchone()
-
-    if row["cnt"] == 0:
-        conn.execute(
-            """
-            INSERT INTO USERS (username, password_hash, created_at, role)
-            VALUES (?, ?, datetime('now','localtime'), ?)
-            """,
-            ("admin", generate_password_hash("testpass"), "admin"),
-        )
-
-    conn.commit()
-    conn.close()
-
-
-def ensure_base_tables():
-    """在庫管理で使う基本テーブル（ITEMS/CATEGORIES/SUPPLIERS/STOCK_MOVEMENTS）を作成"""
-    conn = get_db_connection()
-
-    # カテゴリ
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS CATEGORIES (
-            category_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name        TEXT NOT NULL,
-            description TEXT,
-            created_at  TEXT NOT NULL
-        );
-        """
-    )
-
-    # 商品
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS ITEMS (
-            item_id     INTEGER PRIMARY KEY AUTOINCREMENT,
-            name        TEXT NOT NULL,
-            sku         TEXT,
-            category_id INTEGER,
-            base_price  INTEGER,
-            size        TEXT,
-            color       TEXT,
-            material    TEXT,
-            note        TEXT,
-            created_at  TEXT NOT NULL,
-            updated_at  TEXT NOT NULL,
-            is_active   INTEGER NOT NULL DEFAULT 1
-        );
-        """
-    )
-
-    # 仕入先
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS SUPPLIERS (
-            supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name        TEXT NOT NULL,
-            phone       TEXT,
-            email       TEXT,
-            address     TEXT,
-            note        TEXT,
-            created_at  TEXT NOT NULL
-        );
-        """
-    )
-
-    # 在庫移動
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS STOCK_MOVEMENTS (
-            movement_id   INTEGER PRIMARY KEY AUTOINCREMENT,
-            item_id       INTEGER NOT NULL,
-            movement_type TEXT    NOT NULL,
-            quantity      INTEGER NOT NULL,
-            supplier_id   INTEGER,
-            memo          TEXT,
-            created_at    TEXT NOT NULL
-        );
-        """
-    )
-
-    conn.commit()
-    conn.close()
-
-
-# ==== ログイン必須デコレーター ====
-def login_required(view_func):
-    @wraps(view_func)
-    def wrapped(*args, **kwargs):
-        if not session.get("user_id"):
-            flash("ログインしてください。", "error")
-            from flask import request
-            return redirect(url_for("login", next=request.path))
-        return view_func(*args, **kwargs)
-    return wrapped
-
-
-# ==== ログイン ====
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    if request.method == "POST":
-        username = request.form.get("username", "").strip()
-        password = request.form.get("password", "")
-
-        error = None
-
-        # 入力チェック
-        if not username or not password:
-            error = "ユーザー名とパスワードを入力してください。"
-        else:
-            # DB からユーザー情報取得（role も含める）
-            conn = get_db_connection()
-            user = conn.execute(
-                "SELECT user_id, username, password_hash, role FROM USERS WHERE username = ?",
-                (username,),
-            ).fetchone()
-            conn.close()
-
-            # ユーザーが存在しない or パスワード不一致
-            if user is None or not check_password_hash(user["password_hash"], password):
-                error = "ユーザー名またはパスワードが違います。"
-
-        if error:
-            flash(error, "error")
-        else:
-            # ログイン成功
-            session.clear()
-            session["user_id"] = user["user_id"]
-            session["username"] = user["username"]
-            session["role"] = user["role"] or "staff"   # 念のためデフォルトstaff
-            flash("ログインしました。", "success")
-
-            next_url = request.args.get("next")
-            return redirect(next_url or url_for("item_list"))
-
-    # GET のときはログイン画面を表示
-    return render_template("login.html")
-
-
-def admin_required(view_func):
-    @wraps(view_func)
-    def wrapped(*args, **kwargs):
-        # まだログインしてない
-        if not session.get("user_id"):
-            flash("ログインしてください。", "error")
-            return redirect(url_for("login", next=request.path))
-
-        # role が admin 以外
-        if session.get("role") != "admin":
-            flash("この操作を行う権限がありません。", "error")
-            return redirect(url_for("item_list"))
-
-        # OK のときだけ本来の処理へ
-        return view_func(*args, **kwargs)
-    return wrapped
-
-
-# ==== ログアウト ====
-@app.route("/logout")
-def logout():
-    session.clear()
-    flash("ログアウトしました。", "success")
-    return redirect(url_for("login"))
-
-
-# ==== トップページ：とりあえず商品一覧へリダイレクト ====
-@app.route("/")
-@login_required
-def index():
-    return redirect(url_for("item_list"))
-
-
-# ==== 商品一覧 ====
-@app.route("/items")
-@login_required
-def item_list():
-    conn = get_db_connection()
-
-    # フィルタ用カテゴリ一覧（プルダウン用）
-    categories = conn.execute(
-        "SELECT category_id, name FROM CATEGORIES ORDER BY name"
-    ).fetchall()
-
-    # クエリパラメータから category_id を取得（例: /items?category_id=1）
-    selected_category_id = request.args.get("category_id", type=int)
-
-    params = []
-    where_clause = ""
-    if selected_category_id:
-        where_clause = "WHERE i.category_id = ?"
-        params.append(selected_category_id)
-
-    # 在庫数を集計しながら商品一覧を取得
-    items = conn.execute(
-        f"""
-        SELECT
-            i.item_id,
-            i.name,
-            i.sku,
-            c.name AS category_name,
-            i.base_price,
-            i.size,
-            i.color,
-            i.material,
-            i.is_active,
-            COALESCE(
-                SUM(
-                    CASE
-                        WHEN m.movement_type = 'IN' THEN m.quantity
-                        WHEN m.movement_type = 'OUT' THEN -m.quantity
-                        WHEN m.movement_type = 'ADJUST' THEN m.quantity
-                        ELSE 0
-                    END
-                ),
-                0
-            ) AS stock_quantity
-        FROM ITEMS i
-        LEFT JOIN CATEGORIES c
-            ON i.category_id = c.category_id
-        LEFT JOIN STOCK_MOVEMENTS m
-            ON m.item_id = i.item_id
-        {where_clause}
-        GROUP BY
-            i.item_id, i.name, i.sku, i.base_price,
-            i.size, i.color, i.material, i.is_active,
-            c.name
-        ORDER BY i.item_id DESC
-        """,
-        params,
-    ).fetchall()
-
-    conn.close()
-    
-    return render_template(
-        "item_list.html",
-        items=items,
-        categories=categories,
-        selected_category_id=selected_category_id,
-        low_stock_threshold=LOW_STOCK_THRESHOLD,
-    )
-
-
-# ==== 商品登録（GET:フォーム表示 / POST:登録処理） ====
-@app.route("/items/new", methods=["GET", "POST"])
-@login_required
-def add_item():
-    conn = get_db_connection()
-
-    # プルダウン用にカテゴリ一覧を取得
-    categories = conn.execute(
-        "SELECT category_id, name FROM CATEGORIES ORDER BY name"
-    ).fetchall()
-
-    if request.method == "POST":
-        # フォームから取得
-        name = request.form.get("name", "").strip()
-        sku = request.form.get("sku", "").strip()
-        category_id = request.form.get("category_id") or None
-        base_price = request.form.get("base_price") or None
-        size = request.form.get("size", "").strip() or None
-        color = request.form.get("color", "").strip() or None
-        material = request.form.get("material", "").strip() or None
-        note = request.form.get("note", "").strip() or None
-        is_active = 1 if request.form.get("is_active") == "1" else 0
-
-        # 簡単なバリデーション
-        errors = []
-        if not name:
-            errors.append("商品名は必須です。")
-
-        base_price_int = None
-        if base_price:
-            try:
-                base_price_int = int(base_price)
-            except ValueError:
-                errors.append("標準価格は数字で入力してください。")
-
-        category_id_int = None
-        if category_id:
-            try:
-                category_id_int = int(category_id)
-            except ValueError:
-                errors.append("カテゴリIDが不正です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            # 入力内容を維持するため form=request.form を渡す
-            return render_template(
-                "add_item.html",
-                categories=categories,
-                form=request.form,
-            )
-
-        # 日付（created_at / updated_at）を現在時刻で設定
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        conn.execute(
-            """
-            INSERT INTO ITEMS
-                (name, sku, category_id, base_price, size, color, material, note,
-                 created_at, updated_at, is_active)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                name,
-                sku,
-                category_id_int,
-                base_price_int,
-                size,
-                color,
-                material,
-                note,
-                now,
-                now,
-                is_active,
-            ),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("商品を登録しました。", "success")
-        return redirect(url_for("item_list"))
-
-    # GETのときは空フォーム
-    conn.close()
-    return render_template(
-        "add_item.html",
-        categories=categories,
-        form={},
-    )
-
-
-# ==== 商品編集 ====
-@app.route("/items/<int:item_id>/edit", methods=["GET", "POST"])
-@login_required
-def edit_item(item_id):
-    conn = get_db_connection()
-
-    # 対象商品の取得
-    item = conn.execute(
-        "SELECT * FROM ITEMS WHERE item_id = ?",
-        (item_id,),
-    ).fetchone()
-
-    if item is None:
-        conn.close()
-        flash("指定された商品が見つかりません。", "error")
-        return redirect(url_for("item_list"))
-
-    # カテゴリ一覧（プルダウン用）
-    categories = conn.execute(
-        "SELECT category_id, name FROM CATEGORIES ORDER BY name"
-    ).fetchall()
-
-    if request.method == "POST":
-        # フォームから取得
-        name = request.form.get("name", "").strip()
-        sku = request.form.get("sku", "").strip()
-        category_id = request.form.get("category_id") or None
-        base_price = request.form.get("base_price") or None
-        size = request.form.get("size", "").strip() or None
-        color = request.form.get("color", "").strip() or None
-        material = request.form.get("material", "").strip() or None
-        note = request.form.get("note", "").strip() or None
-        is_active = 1 if request.form.get("is_active") == "1" else 0
-
-        errors = []
-        if not name:
-            errors.append("商品名は必須です。")
-
-        base_price_int = None
-        if base_price:
-            try:
-                base_price_int = int(base_price)
-            except ValueError:
-                errors.append("標準価格は数字で入力してください。")
-
-        category_id_int = None
-        if category_id:
-            try:
-                category_id_int = int(category_id)
-            except ValueError:
-                errors.append("カテゴリIDが不正です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            # 入力内容を維持して再表示
-            return render_template(
-                "edit_item.html",
-                categories=categories,
-                item_id=item_id,
-                form=request.form,
-            )
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        conn.execute(
-            """
-            UPDATE ITEMS
-            SET
-                name = ?,
-                sku = ?,
-                category_id = ?,
-                base_price = ?,
-                size = ?,
-                color = ?,
-                material = ?,
-                note = ?,
-                updated_at = ?,
-                is_active = ?
-            WHERE item_id = ?
-            """,
-            (
-                name,
-                sku,
-                category_id_int,
-                base_price_int,
-                size,
-                color,
-                material,
-                note,
-                now,
-                is_active,
-                item_id,
-            ),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("商品を更新しました。", "success")
-        return redirect(url_for("item_list"))
-
-    # GET のとき：現在値をフォーム用の dict に詰める
-    form_data = {
-        "name": item["name"],
-        "sku": item["sku"] or "",
-        "category_id": str(item["category_id"]) if item["category_id"] is not None else "",
-        "base_price": item["base_price"] if item["base_price"] is not None else "",
-        "size": item["size"] or "",
-        "color": item["color"] or "",
-        "material": item["material"] or "",
-        "note": item["note"] or "",
-        "is_active": "1" if item["is_active"] == 1 else "0",
-    }
-
-    conn.close()
-    return render_template(
-        "edit_item.html",
-        categories=categories,
-        item_id=item_id,
-        form=form_data,
-    )
-
-# ==== 商品ごとの在庫履歴 ====
-@app.route("/items/<int:item_id>/history")
-@login_required
-def item_history(item_id):
-    conn = get_db_connection()
-
-    # 商品情報
-    item = conn.execute(
-        """
-        SELECT
-            i.item_id,
-            i.name,
-            c.name AS category_name
-        FROM ITEMS i
-        LEFT JOIN CATEGORIES c ON i.category_id = c.category_id
-        WHERE i.item_id = ?
-        """,
-        (item_id,),
-    ).fetchone()
-
-    if item is None:
-        conn.close()
-        flash("指定された商品が見つかりません。", "error")
-        return redirect(url_for("item_list"))
-
-    # 在庫移動を取得（古い順）
-    movements = conn.execute(
-        """
-        SELECT
-            m.movement_id,
-            m.movement_type,
-            m.quantity,
-            m.memo,
-            m.created_at,
-            s.name AS supplier_name
-        FROM STOCK_MOVEMENTS m
-        LEFT JOIN SUPPLIERS s ON m.supplier_id = s.supplier_id
-        WHERE m.item_id = ?
-        ORDER BY m.created_at ASC, m.movement_id ASC
-        """,
-        (item_id,),
-    ).fetchall()
-    conn.close()
-
-    # Python側で在庫推移（残高）を計算
-    history = []
-    stock = 0
-    for m in movements:
-        if m["movement_type"] == "IN":
-            delta = m["quantity"]
-        elif m["movement_type"] == "OUT":
-            delta = -m["quantity"]
-        elif m["movement_type"] == "ADJUST":
-            # とりあえず「調整もプラスマイナス扱い」で
-            delta = m["quantity"]
-        else:
-            delta = 0
-
-        stock += delta
-
-        history.append({
-            "movement_id": m["movement_id"],
-            "created_at": m["created_at"],
-            "movement_type": m["movement_type"],
-            "quantity": m["quantity"],
-            "delta": delta,
-            "stock_after": stock,
-            "memo": m["memo"],
-            "supplier_name": m["supplier_name"],
-        })
-
-    return render_template(
-        "item_history.html",
-        item=item,
-        history=history,
-    )
-
-
-# ==== 商品削除 ====
-@app.route("/items/<int:item_id>/delete", methods=["POST"])
-@login_required
-@admin_required
-def delete_item(item_id):
-    conn = get_db_connection()
-
-    # 在庫移動で使用されているかチェック
-    count_row = conn.execute(
-        "SELECT COUNT(*) AS cnt FROM STOCK_MOVEMENTS WHERE item_id = ?",
-        (item_id,),
-    ).fetchone()
-
-    if count_row["cnt"] > 0:
-        conn.close()
-        flash("この商品は在庫移動の履歴があるため、削除できません。", "error")
-        return redirect(url_for("item_list"))
-
-    conn.execute(
-        "DELETE FROM ITEMS WHERE item_id = ?",
-        (item_id,),
-    )
-    conn.commit()
-    conn.close()
-
-    flash("商品を削除しました。", "success")
-    return redirect(url_for("item_list"))
-
-
-# ==== 仕入先一覧 ====
-@app.route("/suppliers")
-@login_required
-def supplier_list():
-    conn = get_db_connection()
-    suppliers = conn.execute(
-        """
-        SELECT
-            supplier_id,
-            name,
-            phone,
-            email,
-            address,
-            note,
-            created_at
-        FROM SUPPLIERS
-        ORDER BY supplier_id DESC
-        """
-    ).fetchall()
-    conn.close()
-    return render_template("supplier_list.html", suppliers=suppliers)
-
-
-# ==== 仕入先登録 ====
-@app.route("/suppliers/new", methods=["GET", "POST"])
-@login_required
-def add_supplier():
-    conn = get_db_connection()
-
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()
-        phone = request.form.get("phone", "").strip() or None
-        email = request.form.get("email", "").strip() or None
-        address = request.form.get("address", "").strip() or None
-        note = request.form.get("note", "").strip() or None
-
-        errors = []
-        if not name:
-            errors.append("仕入先名は必須です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            return render_template(
-                "add_supplier.html",
-                form=request.form,
-            )
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        conn.execute(
-            """
-            INSERT INTO SUPPLIERS
-                (name, phone, email, address, note, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (name, phone, email, address, note, now),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("仕入先を登録しました。", "success")
-        return redirect(url_for("supplier_list"))
-
-    conn.close()
-    return render_template(
-        "add_supplier.html",
-        form={},
-    )
-
-
-# ==== 仕入先編集 ====
-@app.route("/suppliers/<int:supplier_id>/edit", methods=["GET", "POST"])
-@login_required
-def edit_supplier(supplier_id):
-    conn = get_db_connection()
-
-    supplier = conn.execute(
-        """
-        SELECT supplier_id, name, phone, email, address, note, created_at
-        FROM SUPPLIERS
-        WHERE supplier_id = ?
-        """,
-        (supplier_id,),
-    ).fetchone()
-
-    if supplier is None:
-        conn.close()
-        flash("指定された仕入先が見つかりません。", "error")
-        return redirect(url_for("supplier_list"))
-
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()
-        phone = request.form.get("phone", "").strip() or None
-        email = request.form.get("email", "").strip() or None
-        address = request.form.get("address", "").strip() or None
-        note = request.form.get("note", "").strip() or None
-
-        errors = []
-        if not name:
-            errors.append("仕入先名は必須です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            return render_template(
-                "edit_supplier.html",
-                supplier_id=supplier_id,
-                form=request.form,
-            )
-
-        conn.execute(
-            """
-            UPDATE SUPPLIERS
-            SET name = ?, phone = ?, email = ?, address = ?, note = ?
-            WHERE supplier_id = ?
-            """,
-            (name, phone, email, address, note, supplier_id),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("仕入先を更新しました。", "success")
-        return redirect(url_for("supplier_list"))
-
-    # GET のとき既存データをフォームに詰める
-    form_data = {
-        "name": supplier["name"],
-        "phone": supplier["phone"] or "",
-        "email": supplier["email"] or "",
-        "address": supplier["address"] or "",
-        "note": supplier["note"] or "",
-    }
-    conn.close()
-    return render_template(
-        "edit_supplier.html",
-        supplier_id=supplier_id,
-        form=form_data,
-    )
-
-
-# ==== 仕入先削除 ====
-@app.route("/suppliers/<int:supplier_id>/delete", methods=["POST"])
-@login_required
-@admin_required
-def delete_supplier(supplier_id):
-    conn = get_db_connection()
-
-    # 在庫移動で使用されているかチェック
-    count_row = conn.execute(
-        "SELECT COUNT(*) AS cnt FROM STOCK_MOVEMENTS WHERE supplier_id = ?",
-        (supplier_id,),
-    ).fetchone()
-
-    if count_row["cnt"] > 0:
-        conn.close()
-        flash("この仕入先を使用している在庫移動があるため、削除できません。", "error")
-        return redirect(url_for("supplier_list"))
-
-    conn.execute(
-        "DELETE FROM SUPPLIERS WHERE supplier_id = ?",
-        (supplier_id,),
-    )
-    conn.commit()
-    conn.close()
-
-    flash("仕入先を削除しました。", "success")
-    return redirect(url_for("supplier_list"))
-
-
-# ==== カテゴリ一括登録 ====
-@app.route("/categories/bulk_new", methods=["GET", "POST"])
-@login_required
-@admin_required
-def bulk_add_categories():
-    conn = get_db_connection()
-
-    if request.method == "POST":
-        raw_text = request.form.get("lines", "")
-        lines = raw_text.splitlines()
-
-        inserted_count = 0
-        errors = []
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        for idx, line in enumerate(lines, start=1):
-            line = line.strip()
-            if not line:
-                continue  # 空行はスキップ
-
-            # 「カテゴリ名, 説明」形式を想定（カンマがなければ全部カテゴリ名）
-            parts = [p.strip() for p in line.split(",", 1)]
-            name = parts[0]
-            description = parts[1] if len(parts) > 1 and parts[1] else None
-
-            if not name:
-                errors.append(f"{idx}行目：カテゴリ名が空です。")
-                continue
-
-            conn.execute(
-                """
-                INSERT INTO CATEGORIES (name, description, created_at)
-                VALUES (?, ?, ?)
-                """,
-                (name, description, now),
-            )
-            inserted_count += 1
-
-        conn.commit()
-        conn.close()
-
-        if inserted_count > 0:
-            flash(f"{inserted_count}件のカテゴリを登録しました。", "success")
-        for e in errors:
-            flash(e, "error")
-
-        return redirect(url_for("category_list"))
-
-    conn.close()
-    return render_template("bulk_add_categories.html")
-
-
-# ==== カテゴリ一覧 ====
-@app.route("/categories")
-@login_required
-def category_list():
-    conn = get_db_connection()
-    categories = conn.execute(
-        """
-        SELECT
-            category_id,
-            name,
-            description,
-            created_at
-        FROM CATEGORIES
-        ORDER BY category_id DESC
-        """
-    ).fetchall()
-    conn.close()
-    return render_template("category_list.html", categories=categories)
-
-
-# ==== カテゴリ登録（GET:フォーム表示 / POST:登録処理） ====
-@app.route("/categories/new", methods=["GET", "POST"])
-@login_required
-def add_category():
-    conn = get_db_connection()
-
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()
-        description = request.form.get("description", "").strip() or None
-
-        errors = []
-        if not name:
-            errors.append("カテゴリ名は必須です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            return render_template(
-                "add_category.html",
-                form=request.form,
-            )
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        conn.execute(
-            """
-            INSERT INTO CATEGORIES
-                (name, description, created_at)
-            VALUES (?, ?, ?)
-            """,
-            (name, description, now),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("カテゴリを登録しました。", "success")
-        return redirect(url_for("category_list"))
-
-    conn.close()
-    return render_template(
-        "add_category.html",
-        form={},
-    )
-
-# ==== 在庫移動一覧 ====
-@app.route("/movements")
-@login_required
-def movement_list():
-    conn = get_db_connection()
-    movements = conn.execute(
-        """
-        SELECT
-            m.movement_id,
-            m.movement_type,
-            m.quantity,
-            m.memo,
-            m.created_at,
-            i.name AS item_name,
-            s.name AS supplier_name
-        FROM STOCK_MOVEMENTS m
-        LEFT JOIN ITEMS i ON m.item_id = i.item_id
-        LEFT JOIN SUPPLIERS s ON m.supplier_id = s.supplier_id
-        ORDER BY m.movement_id DESC
-        """
-    ).fetchall()
-    conn.close()
-    return render_template("stock_movement_list.html", movements=movements)
-
-
-# ==== 在庫移動登録（入庫・出庫・調整） ====
-@app.route("/movements/new", methods=["GET", "POST"])
-@login_required
-def add_movement():
-    conn = get_db_connection()
-
-    # プルダウン用に商品・仕入先を取得
-    items = conn.execute(
-        "SELECT item_id, name FROM ITEMS WHERE is_active = 1 ORDER BY name"
-    ).fetchall()
-
-    suppliers = conn.execute(
-        "SELECT supplier_id, name FROM SUPPLIERS ORDER BY name"
-    ).fetchall()
-
-    if request.method == "POST":
-        item_id = request.form.get("item_id") or None
-        movement_type = request.form.get("movement_type", "").strip()
-        quantity = request.form.get("quantity") or None
-        supplier_id = request.form.get("supplier_id") or None
-        memo = request.form.get("memo", "").strip() or None
-
-        errors = []
-
-        # 必須チェック
-        if not item_id:
-            errors.append("商品は必須です。")
-
-        if not movement_type:
-            errors.append("移動種別は必須です。")
-
-        qty_int = None
-        if quantity:
-            try:
-                qty_int = int(quantity)
-                if qty_int <= 0:
-                    errors.append("数量は1以上の整数で入力してください。")
-            except ValueError:
-                errors.append("数量は整数で入力してください。")
-        else:
-            errors.append("数量は必須です。")
-
-        item_id_int = None
-        if item_id:
-            try:
-                item_id_int = int(item_id)
-            except ValueError:
-                errors.append("商品IDが不正です。")
-
-        supplier_id_int = None
-        if supplier_id:
-            try:
-                supplier_id_int = int(supplier_id)
-            except ValueError:
-                errors.append("仕入先IDが不正です。")
-
-        # movement_type の簡易チェック
-        if movement_type not in ("IN", "OUT", "ADJUST"):
-            errors.append("移動種別が不正です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            return render_template(
-                "add_stock_movement.html",
-                items=items,
-                suppliers=suppliers,
-                form=request.form,
-            )
-
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        conn.execute(
-            """
-            INSERT INTO STOCK_MOVEMENTS
-                (item_id, movement_type, quantity, supplier_id, memo, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (item_id_int, movement_type, qty_int, supplier_id_int, memo, now),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("在庫移動を登録しました。", "success")
-        return redirect(url_for("movement_list"))
-
-    conn.close()
-    return render_template(
-        "add_stock_movement.html",
-        items=items,
-        suppliers=suppliers,
-        form={},
-    )
-
-# ==== 在庫クイック更新（商品一覧からの入出庫） ====
-@app.route("/movements/quick", methods=["POST"])
-@login_required
-def quick_movement():
-    conn = get_db_connection()
-
-    item_id = request.form.get("item_id") or None
-    movement_type = request.form.get("movement_type", "").strip()
-    quantity = request.form.get("quantity") or None
-    memo = request.form.get("memo", "").strip() or None
-
-    errors = []
-
-    # 必須チェック
-    if not item_id:
-        errors.append("商品IDが不正です。")
-
-    if not movement_type:
-        errors.append("移動種別は必須です。")
-
-    qty_int = None
-    if quantity:
-        try:
-            qty_int = int(quantity)
-            if qty_int <= 0:
-                errors.append("数量は1以上の整数で入力してください。")
-        except ValueError:
-            errors.append("数量は整数で入力してください。")
-    else:
-        errors.append("数量は必須です。")
-
-    if movement_type not in ("IN", "OUT", "ADJUST"):
-        errors.append("移動種別が不正です。")
-
-    # item_id 整数変換
-    item_id_int = None
-    if item_id:
-        try:
-            item_id_int = int(item_id)
-        except ValueError:
-            errors.append("商品IDが不正です。")
-
-    if errors:
-        for e in errors:
-            flash(e, "error")
-        conn.close()
-        return redirect(url_for("item_list"))
-
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # 仕入先はとりあえず None（必要ならフォームに追加も可）
-    conn.execute(
-        """
-        INSERT INTO STOCK_MOVEMENTS
-            (item_id, movement_type, quantity, supplier_id, memo, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (item_id_int, movement_type, qty_int, None, memo or None, now),
-    )
-    conn.commit()
-    conn.close()
-
-    flash("在庫を更新しました。", "success")
-    return redirect(url_for("item_list"))
-
-
-
-# ==== カテゴリ編集 ====
-@app.route("/categories/<int:category_id>/edit", methods=["GET", "POST"])
-@login_required
-def edit_category(category_id):
-    conn = get_db_connection()
-
-    category = conn.execute(
-        "SELECT category_id, name, description, created_at FROM CATEGORIES WHERE category_id = ?",
-        (category_id,),
-    ).fetchone()
-
-    if category is None:
-        conn.close()
-        flash("指定されたカテゴリが見つかりません。", "error")
-        return redirect(url_for("category_list"))
-
-    if request.method == "POST":
-        name = request.form.get("name", "").strip()
-        description = request.form.get("description", "").strip() or None
-
-        errors = []
-        if not name:
-            errors.append("カテゴリ名は必須です。")
-
-        if errors:
-            for e in errors:
-                flash(e, "error")
-            conn.close()
-            # 入力内容を維持して再表示
-            return render_template(
-                "edit_category.html",
-                category_id=category_id,
-                form=request.form,
-            )
-
-        conn.execute(
-            """
-            UPDATE CATEGORIES
-            SET name = ?, description = ?
-            WHERE category_id = ?
-            """,
-            (name, description, category_id),
-        )
-        conn.commit()
-        conn.close()
-
-        flash("カテゴリを更新しました。", "success")
-        return redirect(url_for("category_list"))
-
-    # GET のとき：現在の値をフォームに詰める
-    form_data = {
-        "name": category["name"],
-        "description": category["description"] or "",
-    }
-    conn.close()
-    return render_template(
-        "edit_category.html",
-        category_id=category_id,
-        form=form_data,
-    )
-
-
-# ==== カテゴリ削除 ====
-@app.route("/categories/<int:category_id>/delete", methods=["POST"])
-@login_required
-@admin_required
-def delete_category(category_id):
-    conn = get_db_connection()
-
-    # まずはこのカテゴリを使っている商品があるかチェック
-    count_row = conn.execute(
-        "SELECT COUNT(*) AS cnt FROM ITEMS WHERE category_id = ?",
-        (category_id,),
-    ).fetchone()
-
-    if count_row["cnt"] > 0:
-        conn.close()
-        flash("このカテゴリを使用している商品があるため、削除できません。", "error")
-        return redirect(url_for("category_list"))
-
-    # 商品に使われていなければ削除
-    conn.execute(
-        "DELETE FROM CATEGORIES WHERE category_id = ?",
-        (category_id,),
-    )
-    conn.commit()
-    conn.close()
-
-    flash("カテゴリを削除しました。", "success")
-    return redirect(url_for("category_list"))
-
-# ==== アプリ起動時に一度だけテーブル作成＆admin作成 ====
-ensure_base_tables()
-ensure_users_table()
-
-if __name__ == "__main__":
-    app.run(debug=True)
+import time
+
+# 起動時間の計測（startup_profile）の起点。flask・numpy・各モジュールの import も測るので最初に取る
+STARTUP_STARTED = time.perf_counter()
+
+from flask import (
+    Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response,
+    stream_with_context, stream_template, get_flashed_messages, g, has_request_context, send_file,
+)
+import click
+import csv
+import hmac
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from functools import wraps
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from analytics import (
+    ABC_DIMENSIONS,
+    abc_sell_through,
+    data_version,
+    supplier_items,
+    supplier_monthly,
+    supplier_summaries,
+)
+from backup import list_backups, run_backup, verify_backup
+from bulk_edit import apply_bulk_edit, parse_bulk_request, preview_bulk_edit
+from change_log import compact_change_log, fetch_changes, log_balance, log_row
+from forecast import FORECAST_CSV_COLUMNS, build_forecast
+from jobs import JOB_KINDS, JOB_STATUS_LABELS, JobRunner, purge_old_jobs, submit_job
+from kpi import ZERO, apply_delta, contribution, count_movement, load_dashboard, rebuild_kpis, track_items
+from lookup import LOOKUP_LIMIT, MAX_LOOKUP_LIMIT, search_by_name, search_items, selected_label
+from price_history import REVENUE_GROUPS, backfill_prices, price_history, record_prices, revenue_report
+from readmodel import ItemReadModel
+from row_cache import FragmentCache
+from stocktake import (
+    COUNT_MODES,
+    committed_rows,
+    count_uncounted,
+    summarize_variance,
+    variance_rows,
+)
+from tenants import (
+    DEFAULT_TENANT,
+    create_tenant,
+    cross_tenant_report,
+    hash_api_token,
+    is_valid_slug,
+    list_tenants,
+    tenant_db_path,
+)
+from timeseries import DOWNSAMPLE_METHODS, downsample, format_times, load_stock_series
+
+# import の終わり（startup_profile の imports_ms。total_ms はこのあとのモジュール本体も含む）
+IMPORTS_FINISHED = time.perf_counter()
+
+
+# ==== 設定 ====
+DB_NAME = "cloth_stock.db"   # DBファイル名（既定の店舗の DB。ユーザー・店舗の一覧もここ）
+
+# 既定以外の店舗の DB を置くディレクトリ（tenants.py 参照）
+TENANT_DB_DIR = "tenants"
+
+# 全店舗の横断集計で見る期間（日数）
+TENANT_REPORT_DAYS = 30
+
+# 在庫移動の種別（TRANSFER はロケーション間の移動）
+MOVEMENT_TYPES = ("IN", "OUT", "ADJUST", "TRANSFER")
+
+# 在庫アラートのしきい値（この数以下なら要注意表示）
+LOW_STOCK_THRESHOLD = 5
+
+# 一覧画面で最初にサーバー側描画する行数（続きは JSON で追加読み込み）
+ITEM_PAGE_SIZE = 100
+MOVEMENT_PAGE_SIZE = 100
+# JSON 行 API で 1 回に返せる最大行数
+MAX_PAGE_SIZE = 500
+
+# 変更フィード（/api/changes）で 1 回に返せる最大件数
+CHANGE_FEED_PAGE_SIZE = 500
+
+# バックアップ（backup.py）の保存先と設定
+BACKUP_DIR = "backups"
+BACKUP_KEEP = 14
+BACKUP_COMPRESS = True
+
+# 在庫のリアルタイム更新（SSE）
+# 1 本の接続は SSE_MAX_SECONDS で切り、ブラウザに Last-Event-ID 付きで再接続させる
+SSE_POLL_SECONDS = 1.0
+SSE_MAX_SECONDS = 25
+SSE_KEEPALIVE_SECONDS = 10
+SSE_BATCH_SIZE = 200
+# ワーカー（プロセス）ごとの同時接続数の上限。スレッドを SSE だけで使い切らないように
+SSE_MAX_STREAMS = 4
+
+# POS・EC サイトなどセッションを持たない連携先用の API トークン（未設定なら無効）
+API_TOKEN = os.environ.get("API_TOKEN")
+
+# 商品一覧の行キャッシュ（ワーカーごと）に保持する最大行数
+ITEM_ROW_CACHE_SIZE = 5000
+
+# レポートの集計結果キャッシュ（期間・条件ごと）に保持する最大件数
+REPORT_CACHE_SIZE = 64
+
+# ストリーミング描画（stream_page）で、この文字数まで溜めてから送る
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# バックグラウンドジョブ（jobs.py）：結果の保存先・全ワーカー合計の同時実行数・
+# 1 ジョブあたりの時間とメモリの上限・終わったジョブを残す日数
+# （メモリは import 済みのライブラリの分を除いた、処理そのものが使ってよい量）
+JOB_RESULT_DIR = "job_results"
+JOB_UPLOAD_DIR = os.path.join(JOB_RESULT_DIR, "uploads")   # 取り込むファイルの一時置き場
+JOB_MAX_CONCURRENCY = 2
+JOB_TIME_LIMIT_SECONDS = 300
+JOB_MEMORY_LIMIT_MB = 1024
+JOB_KEEP_DAYS = 7
+
+# 在庫推移グラフ：既定の期間（日）と、返す点数の既定値・上限（間引いてこの点数以下にする）
+STOCK_SERIES_DAYS = 90
+STOCK_SERIES_POINTS = 500
+MAX_STOCK_SERIES_POINTS = 5000
+
+app = Flask(__name__)
+app.secret_key = "change_this_secret_key"  # 適当な長めの文字列でOK
+
+# Jinja のコンパイル結果（バイトコード）の保存先。再起動してもテンプレートを解析し直さない
+# （起動したディレクトリによらず app.py と同じ場所に置く）
+TEMPLATE_CACHE_DIR = os.path.join(app.root_path, "template_cache")
+os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+# 起動の段階ごとの所要時間（ミリ秒）。run_startup() が記録する
+startup_profile = {}
+
+# 商品一覧の描画済み行（<td> 群）のキャッシュ
+item_row_cache = FragmentCache(max_entries=ITEM_ROW_CACHE_SIZE)
+
+# レポートの集計結果のキャッシュ（キーにデータの版を含めるので古い結果は使われない）
+report_cache = FragmentCache(max_entries=REPORT_CACHE_SIZE)
+
+# SSE の同時接続数の制限
+sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# 店舗ごとの商品の読み取りモデル（readmodel.py。ワーカーごと）
+read_models = {}
+read_models_lock = threading.Lock()
+
+# このワーカーでスキーマの更新（ensure_base_tables）が済んだ店舗
+migrated_tenants = set()
+tenant_migration_lock = threading.Lock()
+
+
+# ==== DB接続用ヘルパー ====
+def current_tenant():
+    """このリクエストの店舗（ログイン中のユーザー・API トークンの店舗。リクエスト外は既定の店舗）"""
+    if has_request_context():
+        return g.get("tenant") or session.get("tenant") or DEFAULT_TENANT
+    return DEFAULT_TENANT
+
+
+def tenant_db_file(tenant):
+    return tenant_db_path(tenant, DB_NAME, TENANT_DB_DIR)
+
+
+def connect_tenant_db(tenant):
+    conn = sqlite3.connect(tenant_db_file(tenant))
+    conn.row_factory = sqlite3.Row  # 行を dict 風に扱えるようにする
+    # WAL にして、読み取り（バックアップのコピーなど）と書き込みが互いに待たないようにする
+    # （DB ファイルに記録されるので、2 回目以降の接続では何もしない）
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def get_db_connection(tenant=None):
+    """店舗の DB に接続する（tenant を省略するとこのリクエストの店舗）
+
+    店舗ごとに別のファイルなので、ロックも店舗ごとに分かれる。
+    ほかのワーカーがあとから作った店舗は、最初に接続するときにスキーマを作る。
+    """
+    tenant = tenant or current_tenant()
+    if tenant not in migrated_tenants:
+        migrate_tenant(tenant)
+    return connect_tenant_db(tenant)
+
+
+def get_main_db_connection():
+    """ユーザー（USERS）・店舗の一覧（TENANTS）を置いている既定の DB に接続する"""
+    return connect_tenant_db(DEFAULT_TENANT)
+
+
+def migrate_tenant(tenant):
+    with tenant_migration_lock:
+        if tenant not in migrated_tenants:
+            ensure_base_tables(tenant)
+            migrated_tenants.add(tenant)
+
+
+def migrate_all_tenants():
+    """登録済みの全店舗の DB にスキーマの更新を流す"""
+    conn = get_main_db_connection()
+    tenants = list_tenants(conn)
+    conn.close()
+    for tenant in tenants:
+        migrate_tenant(tenant["slug"])
+    return tenants
+
+
+def ensure_users_table():
+    """USERS・TENANTS・JOBS テーブルと admin ユーザーを保証する"""
+    conn = get_main_db_connection()
+
+    # USERS テーブルが無ければ作る
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS USERS (
+            user_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+            username      TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            created_at    TEXT NOT NULL,
+            role          TEXT
+        );
+        """
+    )
+
+    # admin ユーザーが 1 件もなければ作る（パスワード: testpass）
+    row = conn.execute(
+        "SELECT COUNT(*) AS cnt FROM USERS WHERE username = 'admin'"
+    ).fetchone()
+
+    if row["cnt"] == 0:
+        conn.execute(
+            """
+            INSERT INTO USERS (username, password_hash, created_at, role)
+            VALUES (?, ?, datetime('now','localtime'), ?)
+            """,
+            ("admin", generate_password_hash("testpass"), "admin"),
+        )
+
+    # 店舗の一覧（tenants.py 参照）。既存のユーザーは既定の店舗に所属させる
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS TENANTS (
+            slug           TEXT PRIMARY KEY,
+            name           TEXT NOT NULL,
+            api_token_hash TEXT UNIQUE,
+            created_at     TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO TENANTS (slug, name, created_at)
+        VALUES (?, ?, datetime('now','localtime'))
+        """,
+        (DEFAULT_TENANT, "本店"),
+    )
+    if add_column_if_missing(conn, "USERS", "tenant", "TEXT"):
+        conn.execute("UPDATE USERS SET tenant = ?", (DEFAULT_TENANT,))
+
+    # バックグラウンドジョブ（jobs.py 参照）。全店舗分を 1 つの待ち行列で扱う
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS JOBS (
+            job_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+            tenant      TEXT NOT NULL,
+            kind        TEXT NOT NULL,
+            params      TEXT NOT NULL,
+            status      TEXT NOT NULL DEFAULT 'queued',
+            created_by  TEXT,
+            created_at  TEXT NOT NULL,
+            started_at  TEXT,
+            finished_at TEXT,
+            worker_pid  INTEGER,
+            result_path TEXT,
+            result_rows INTEGER,
+            error       TEXT
+        );
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON JOBS (status, job_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON JOBS (tenant, job_id)"
+    )
+
+    conn.commit()
+    conn.close()
+
+
+def ensure_base_tables(tenant=DEFAULT_TENANT):
+    """在庫管理で使う基本テーブル（ITEMS/CATEGORIES/SUPPLIERS/STOCK_MOVEMENTS）を店舗の DB に作成"""
+    if tenant != DEFAULT_TENANT:
+        os.makedirs(TENANT_DB_DIR, exist_ok=True)
+    conn = connect_tenant_db(tenant)
+
+    # カテゴリ
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS CATEGORIES (
+            category_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name        TEXT NOT NULL,
+            description TEXT,
+            created_at  TEXT NOT NULL
+        );
+        """
+    )
+
+    # 商品
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ITEMS (
+            item_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+            name        TEXT NOT NULL,
+            sku         TEXT,
+            category_id INTEGER,
+            base_price  INTEGER,
+            size        TEXT,
+            color       TEXT,
+            material    TEXT,
+            note        TEXT,
+            created_at  TEXT NOT NULL,
+            updated_at  TEXT NOT NULL,
+            is_active   INTEGER NOT NULL DEFAULT 1
+        );
+        """
+    )
+
+    # 仕入先
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS SUPPLIERS (
+            supplier_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name        TEXT NOT NULL,
+            phone       TEXT,
+            email       TEXT,
+            address     TEXT,
+            note        TEXT,
+            created_at  TEXT NOT NULL
+        );
+        """
+    )
+
+    # 在庫移動
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS STOCK_MOVEMENTS (
+            movement_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id       INTEGER NOT NULL,
+            movement_type TEXT    NOT NULL,
+            quantity      INTEGER NOT NULL,
+            supplier_id   INTEGER,
+            memo          TEXT,
+            created_at    TEXT NOT NULL,
+            location_id    INTEGER,
+            to_location_id INTEGER
+        );
+        """
+    )
+
+    # 店舗・倉庫
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS LOCATIONS (
+            location_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name        TEXT NOT NULL,
+            note        TEXT,
+            created_at  TEXT NOT NULL
+        );
+        """
+    )
+
+    # ロケーションが 1 件もなければ既定のロケーションを作る
+    row = conn.execute("SELECT COUNT(*) AS cnt FROM LOCATIONS").fetchone()
+    if row["cnt"] == 0:
+        conn.execute(
+            "INSERT INTO LOCATIONS (name, created_at) VALUES (?, datetime('now','localtime'))",
+            ("本店",),
+        )
+    default_location_id = get_default_location_id(conn)
+
+    # ロケーション対応前の DB には列を追加し、既存の移動は既定のロケーションとみなす
+    if add_column_if_missing(conn, "STOCK_MOVEMENTS", "location_id", "INTEGER"):
+        conn.execute(
+            "UPDATE STOCK_MOVEMENTS SET location_id = ?",
+            (default_location_id,),
+        )
+    add_column_if_missing(conn, "STOCK_MOVEMENTS", "to_location_id", "INTEGER")
+
+    # ダッシュボードの KPI カウンター（kpi.py 参照）。残高を作り直すときに数え直すので先に作る
+    kpi_exist = table_exists(conn, "KPI_COUNTERS")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS KPI_COUNTERS (
+            name  TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS KPI_DAILY (
+            day           TEXT NOT NULL,
+            movement_type TEXT NOT NULL,
+            quantity      INTEGER NOT NULL DEFAULT 0,
+            movements     INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, movement_type)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    # 商品 × ロケーションごとの在庫残高（在庫移動の登録時に同じトランザクションで更新）
+    balances_exist = table_exists(conn, "STOCK_BALANCES")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS STOCK_BALANCES (
+            item_id          INTEGER NOT NULL,
+            location_id      INTEGER NOT NULL,
+            quantity         INTEGER NOT NULL DEFAULT 0,
+            last_movement_id INTEGER,
+            PRIMARY KEY (item_id, location_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    if not balances_exist:
+        rebuild_stock_balances(conn)
+
+    # 価格の履歴（price_history.py 参照）。作った直後は今の価格を登録日時から有効として入れる
+    prices_exist = table_exists(conn, "ITEM_PRICES")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ITEM_PRICES (
+            item_id        INTEGER NOT NULL,
+            effective_from TEXT NOT NULL,
+            price          INTEGER,
+            PRIMARY KEY (item_id, effective_from)
+        ) WITHOUT ROWID;
+        """
+    )
+    if not prices_exist:
+        backfill_prices(conn)
+
+    # 変更ログ（POS・EC サイト連携用の差分フィード。change_log.py 参照）
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS CHANGE_LOG (
+            seq        INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity     TEXT NOT NULL,
+            entity_key TEXT NOT NULL,
+            op         TEXT NOT NULL,
+            payload    TEXT,
+            created_at TEXT NOT NULL
+        );
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_change_log_entity
+            ON CHANGE_LOG (entity, entity_key, seq)
+        """
+    )
+
+    # アプリ内部の状態（キー・値）
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS APP_STATE (
+            key   TEXT PRIMARY KEY,
+            value TEXT
+        );
+        """
+    )
+
+    # 在庫僅少のしきい値を変えたときも数え直す（残高を作り直したときは済んでいる）
+    threshold_row = conn.execute(
+        "SELECT value FROM KPI_COUNTERS WHERE name = 'low_stock_threshold'"
+    ).fetchone()
+    if balances_exist and (not kpi_exist or threshold_row is None
+                           or threshold_row["value"] != LOW_STOCK_THRESHOLD):
+        rebuild_kpis(conn, LOW_STOCK_THRESHOLD)
+
+    # 棚卸（stocktake.py 参照）
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS STOCKTAKES (
+            stocktake_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location_id  INTEGER NOT NULL,
+            status       TEXT NOT NULL DEFAULT 'open',
+            note         TEXT,
+            created_by   TEXT,
+            created_at   TEXT NOT NULL,
+            committed_at TEXT
+        );
+        """
+    )
+    # 数えた数量。snapshot_movement_id は数えた時点の最大 movement_id、
+    # book_quantity / movement_id は確定時の帳簿在庫と登録した ADJUST
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS STOCKTAKE_COUNTS (
+            stocktake_id         INTEGER NOT NULL,
+            item_id              INTEGER NOT NULL,
+            counted_quantity     INTEGER NOT NULL,
+            snapshot_movement_id INTEGER NOT NULL,
+            counted_at           TEXT NOT NULL,
+            book_quantity        INTEGER,
+            movement_id          INTEGER,
+            PRIMARY KEY (stocktake_id, item_id)
+        ) WITHOUT ROWID;
+        """
+    )
+
+    # 商品ごとの在庫集計・履歴表示用
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stock_movements_item
+            ON STOCK_MOVEMENTS (item_id, created_at, movement_id)
+        """
+    )
+
+    # 種別・期間での集計用（需要予測など）。item_id / quantity まで含めて
+    # テーブル本体を読まずに済むようにする
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stock_movements_type_created
+            ON STOCK_MOVEMENTS (movement_type, created_at, item_id, quantity)
+        """
+    )
+
+    # 仕入先ごとの入荷実績（一覧の集計・詳細の月別集計・削除チェック）用
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_stock_movements_supplier
+            ON STOCK_MOVEMENTS (supplier_id, movement_type, created_at, item_id, quantity)
+        """
+    )
+
+    # 分析レポートのキャッシュキー（最終更新日時）用
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_updated ON ITEMS (updated_at)"
+    )
+
+    # 商品名（＝同じ商品のサイズ・色違いをまとめる単位）での検索用
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_name ON ITEMS (name)"
+    )
+
+    # カテゴリでの絞り込み用
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_category ON ITEMS (category_id)"
+    )
+
+    # 入力補完（lookup.py）の前方一致用。商品は有効なものだけの部分索引
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_active_name ON ITEMS (name) WHERE is_active = 1"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_items_active_sku ON ITEMS (sku) WHERE is_active = 1"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_suppliers_name ON SUPPLIERS (name)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_categories_name ON CATEGORIES (name)"
+    )
+
+    conn.commit()
+    conn.close()
+
+
+def table_exists(conn, table):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (table,),
+    ).fetchone()
+    return row is not None
+
+
+def add_column_if_missing(conn, table, column, column_type):
+    """列がなければ追加する。追加したときだけ True を返す"""
+    columns = [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column in columns:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    return True
+
+
+def get_default_location_id(conn):
+    """既定のロケーション（いちばん最初に作ったもの）"""
+    row = conn.execute("SELECT MIN(location_id) AS location_id FROM LOCATIONS").fetchone()
+    return row["location_id"]
+
+
+def rebuild_stock_balances(conn):
+    """STOCK_BALANCES を在庫移動の全履歴から作り直す（初回作成時・修復用）
+
+    KPI のカウンターも残高から数えているので、同じトランザクションで数え直す
+    （commit は呼び出し側）。
+    """
+    conn.execute("DELETE FROM STOCK_BALANCES")
+    conn.execute(
+        """
+        INSERT INTO STOCK_BALANCES (item_id, location_id, quantity, last_movement_id)
+        SELECT item_id, location_id, SUM(delta), MAX(movement_id)
+        FROM (
+            SELECT
+                item_id,
+                location_id,
+                movement_id,
+                CASE
+                    WHEN movement_type = 'IN' THEN quantity
+                    WHEN movement_type = 'OUT' THEN -quantity
+                    WHEN movement_type = 'ADJUST' THEN quantity
+                    WHEN movement_type = 'TRANSFER' THEN -quantity
+                    ELSE 0
+                END AS delta
+            FROM STOCK_MOVEMENTS
+            UNION ALL
+            SELECT item_id, to_location_id, movement_id, quantity
+            FROM STOCK_MOVEMENTS
+            WHERE movement_type = 'TRANSFER'
+        )
+        WHERE location_id IS NOT NULL
+        GROUP BY item_id, location_id
+        """
+    )
+    rebuild_kpis(conn, LOW_STOCK_THRESHOLD)
+
+
+def apply_balance_delta(conn, item_id, location_id, delta, movement_id):
+    conn.execute(
+        """
+        INSERT INTO STOCK_BALANCES (item_id, location_id, quantity, last_movement_id)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (item_id, location_id) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            last_movement_id = excluded.last_movement_id
+        """,
+        (item_id, location_id, delta, movement_id),
+    )
+
+
+def record_movement(
+    conn,
+    item_id,
+    movement_type,
+    quantity,
+    location_id,
+    supplier_id=None,
+    memo=None,
+    to_location_id=None,
+    now=None,
+):
+    """在庫移動を 1 件登録し、ロケーション別の残高・KPI・変更ログも更新する（commit は呼び出し側）
+
+    TRANSFER は location_id から to_location_id への移動で、
+    移動の行と両ロケーションの残高更新を同じトランザクションで書く。
+    全体の在庫数は変わらない（一覧などの集計では 0 扱い）。
+    """
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    cur = conn.execute(
+        """
+        INSERT INTO STOCK_MOVEMENTS
+            (item_id, movement_type, quantity, supplier_id, memo, created_at,
+             location_id, to_location_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (item_id, movement_type, quantity, supplier_id, memo, now,
+         location_id, to_location_id),
+    )
+    movement_id = cur.lastrowid
+
+    with track_items(conn, [item_id], LOW_STOCK_THRESHOLD):
+        if movement_type == "TRANSFER":
+            apply_balance_delta(conn, item_id, location_id, -quantity, movement_id)
+            apply_balance_delta(conn, item_id, to_location_id, quantity, movement_id)
+        else:
+            delta = -quantity if movement_type == "OUT" else quantity
+            apply_balance_delta(conn, item_id, location_id, delta, movement_id)
+    count_movement(conn, now, movement_type, quantity)
+
+    log_balance(conn, item_id, location_id, movement_id)
+    if movement_type == "TRANSFER":
+        log_balance(conn, item_id, to_location_id, movement_id)
+
+    return movement_id
+
+
+# ==== 大きな一覧のストリーミング描画 ====
+def stream_page(template_name, conn, **context):
+    """テンプレートを描画しながら少しずつ送る
+
+    行は fetchall() せずに cursor（またはジェネレーター）のまま context に渡し、
+    テンプレートの for で 1 行ずつ読ませる。行数が増えてもワーカーのメモリは増えず、
+    先頭（ナビバーなど）はすぐに届く。conn は送り終わったとき（切断されたときも）に閉じる。
+    """
+    # 送信を始めるとセッションのクッキーは変えられないので、
+    # フラッシュメッセージは先に取り出しておく（base.html はこの結果を使う）
+    get_flashed_messages(with_categories=True)
+    chunks = stream_template(template_name, **context)
+
+    def generate():
+        try:
+            buffer = []
+            size = 0
+            for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield "".join(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield "".join(buffer)
+        finally:
+            conn.close()
+
+    return Response(
+        generate(),
+        mimetype="text/html",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+
+# ==== ログイン必須デコレーター ====
+def login_required(view_func):
+    @wraps(view_func)
+    def wrapped(*args, **kwargs):
+        if not session.get("user_id"):
+            flash("ログインしてください。", "error")
+            from flask import request
+            return redirect(url_for("login", next=request.path))
+        return view_func(*args, **kwargs)
+    return wrapped
+
+
+# ==== JSON API 用：ログインしていなければ 401 を返す ====
+def api_login_required(view_func):
+    @wraps(view_func)
+    def wrapped(*args, **kwargs):
+        if not session.get("user_id") and not has_valid_api_token():
+            return jsonify({"error": "login required"}), 401
+        return view_func(*args, **kwargs)
+    return wrapped
+
+
+def has_valid_api_token():
+    """Authorization: Bearer <トークン> が付いているか
+
+    API_TOKEN は既定の店舗、TENANTS.api_token_hash に登録したトークンはその店舗として扱う。
+    """
+    auth = request.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return False
+    token = auth[len("Bearer "):]
+
+    if API_TOKEN and hmac.compare_digest(token, API_TOKEN):
+        g.tenant = DEFAULT_TENANT
+        return True
+
+    conn = get_main_db_connection()
+    row = conn.execute(
+        "SELECT slug FROM TENANTS WHERE api_token_hash = ?",
+        (hash_api_token(token),),
+    ).fetchone()
+    conn.close()
+    if row is None:
+        return False
+    g.tenant = row["slug"]
+    return True
+
+
+# ==== DB のロック待ちがタイムアウトしたとき（SQLITE_BUSY） ====
+@app.errorhandler(sqlite3.OperationalError)
+def handle_db_busy(error):
+    """書き込みが混み合って "database is locked" になったら 500 ではなく 503 を返す
+
+    ブラウザ・連携先には Retry-After で少し待って再送してもらう。
+    （load_test.py はこの 503 を SQLITE_BUSY として数える）
+    それ以外の OperationalError はそのまま 500 にする。
+    """
+    message = str(error)
+    if "locked" not in message and "busy" not in message:
+        raise error
+
+    if request.path.startswith("/api/"):
+        response = jsonify({"error": "database busy"})
+    else:
+        response = Response(
+            "只今混み合っています。少し待ってからもう一度お試しください。",
+            mimetype="text/plain",
+        )
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+# ==== ログイン ====
+@app.route("/login", methods=["GET", "POST"])
+def login():
+    if request.method == "POST":
+        username = request.form.get("username", "").strip()
+        password = request.form.get("password", "")
+
+        error = None
+
+        # 入力チェック
+        if not username or not password:
+            error = "ユーザー名とパスワードを入力してください。"
+        else:
+            # DB からユーザー情報取得（role・所属店舗も含める）
+            conn = get_main_db_connection()
+            user = conn.execute(
+                """
+                SELECT u.user_id, u.username, u.password_hash, u.role,
+                       t.slug AS tenant, t.name AS tenant_name
+                FROM USERS u
+                JOIN TENANTS t ON t.slug = COALESCE(u.tenant, ?)
+                WHERE u.username = ?
+                """,
+                (DEFAULT_TENANT, username),
+            ).fetchone()
+            conn.close()
+
+            # ユーザーが存在しない or パスワード不一致
+            if user is None or not check_password_hash(user["password_hash"], password):
+                error = "ユーザー名またはパスワードが違います。"
+
+        if error:
+            flash(error, "error")
+        else:
+            # ログイン成功
+            session.clear()
+            session["user_id"] = user["user_id"]
+            session["username"] = user["username"]
+            session["role"] = user["role"] or "staff"   # 念のためデフォルトstaff
+            session["tenant"] = user["tenant"]
+            session["tenant_name"] = user["tenant_name"]
+            flash("ログインしました。", "success")
+
+            next_url = request.args.get("next")
+            return redirect(next_url or url_for("item_list"))
+
+    # GET のときはログイン画面を表示
+    return render_template("login.html")
+
+
+def admin_required(view_func):
+    @wraps(view_func)
+    def wrapped(*args, **kwargs):
+        # まだログインしてない
+        if not session.get("user_id"):
+            flash("ログインしてください。", "error")
+            return redirect(url_for("login", next=request.path))
+
+        # role が admin 以外
+        if session.get("role") != "admin":
+            flash("この操作を行う権限がありません。", "error")
+            return redirect(url_for("item_list"))
+
+        # OK のときだけ本来の処理へ
+        return view_func(*args, **kwargs)
+    return wrapped
+
+
+# ==== ログアウト ====
+@app.route("/logout")
+def logout():
+    session.clear()
+    flash("ログアウトしました。", "success")
+    return redirect(url_for("login"))
+
+
+# ==== トップページ：ダッシュボード ====
+@app.route("/")
+@login_required
+def index():
+    """KPI_COUNTERS / KPI_DAILY を読むだけなので、データ量に関係なく軽い"""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())   # 今週の月曜日
+
+    conn = get_db_connection()
+    dashboard = load_dashboard(conn, today.isoformat(), week_start.isoformat())
+    conn.close()
+
+    return render_template(
+        "dashboard.html",
+        dashboard=dashboard,
+        today=today,
+        week_start=week_start,
+        low_stock_threshold=LOW_STOCK_THRESHOLD,
+    )
+
+
+# ==== 商品一覧 ====
+def item_read_model(conn):
+    """このリクエストの店舗の読み取りモデルを、DB の変更（CHANGE_LOG）に追いつかせて返す
+
+    商品名・カテゴリ名・現在庫はここから読むので、一覧や履歴の表示で JOIN しない。
+    ワーカーで最初に使うときだけ全件を読み込み、以降は新しい変更の行だけを当てる。
+    """
+    tenant = current_tenant()
+    model = read_models.get(tenant)
+    if model is None:
+        with read_models_lock:
+            model = read_models.setdefault(tenant, ItemReadModel())
+    model.refresh(conn)
+    return model
+
+
+@app.route("/items")
+@login_required
+def item_list():
+    conn = get_db_connection()
+
+    # フィルタ用カテゴリ一覧（プルダウン用）
+    categories = conn.execute(
+        "SELECT category_id, name FROM CATEGORIES ORDER BY name"
+    ).fetchall()
+
+    # 在庫数を表示するロケーション（プルダウン用）
+    locations = conn.execute(
+        "SELECT location_id, name FROM LOCATIONS ORDER BY location_id"
+    ).fetchall()
+
+    # クエリパラメータから category_id / location_id を取得（例: /items?category_id=1）
+    selected_category_id = request.args.get("category_id", type=int)
+    selected_location_id = request.args.get("location_id", type=int)
+
+    # 最初の 1 画面分だけサーバー側で描画し、続きはスクロールに合わせて
+    # /api/items/rows から取得する
+    # 在庫のリアルタイム更新は、読み取りモデルが反映済みの変更（high_water_mark）の次から受け取る。
+    # 描画する行より前に取っておけば、その間の変更も取りこぼさない（同じ残高が 2 回届くだけ）
+    model = item_read_model(conn)
+    balance_since = model.high_water_mark
+    items = model.item_page(
+        category_id=selected_category_id,
+        location_id=selected_location_id,
+        limit=ITEM_PAGE_SIZE,
+    )
+
+    conn.close()
+
+    # 行ごとに描画済み HTML をキャッシュから取得（変更のあった行だけ再描画）
+    role = session.get("role")
+    rows = [(item, render_item_row(item, role, selected_location_id)) for item in items]
+
+    return render_template(
+        "item_list.html",
+        rows=rows,
+        row_start=0,
+        next_before_id=next_cursor(items, "item_id", ITEM_PAGE_SIZE),
+        categories=categories,
+        selected_category_id=selected_category_id,
+        locations=locations,
+        selected_location_id=selected_location_id,
+        low_stock_threshold=LOW_STOCK_THRESHOLD,
+        balance_since=balance_since,
+    )
+
+
+# ==== 商品一覧の続き（JSON） ====
+@app.route("/api/items/rows")
+@api_login_required
+def api_item_rows():
+    category_id = request.args.get("category_id", type=int)
+    location_id = request.args.get("location_id", type=int)
+    before_id = request.args.get("before_id", type=int)
+    row_start = request.args.get("start", default=0, type=int)
+    limit = clamp_page_size(request.args.get("limit", type=int), ITEM_PAGE_SIZE)
+
+    conn = get_db_connection()
+    items = item_read_model(conn).item_page(
+        category_id=category_id,
+        location_id=location_id,
+        before_id=before_id,
+        limit=limit,
+    )
+    conn.close()
+
+    role = session.get("role")
+    rows = [(item, render_item_row(item, role, location_id)) for item in items]
+
+    return jsonify({
+        "html": render_template(
+            "item_list_rows.html",
+            rows=rows,
+            row_start=row_start,
+            low_stock_threshold=LOW_STOCK_THRESHOLD,
+        ),
+        "count": len(rows),
+        "next_before_id": next_cursor(items, "item_id", limit),
+    })
+
+
+def next_cursor(rows, id_column, limit):
+    """1 ページ分埋まっていれば最後の行の ID を次の before_id として返す"""
+    if len(rows) < limit:
+        return None
+    return rows[-1][id_column]
+
+
+def clamp_page_size(limit, default):
+    if not limit or limit <= 0:
+        return default
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def render_item_row(item, role, location_id=None):
+    """商品一覧の 1 行分（No. 以外のセル）を行キャッシュ経由で描画する
+
+    キーは (店舗, item_id, 更新日時, 在庫バージョン, カテゴリ名, 閲覧者の role, 表示ロケーション)。
+    在庫バージョンはその商品の最新 movement_id なので、在庫移動が入れば変わる。
+    カテゴリ名は行に埋め込まれるのでキーに含める（名前の変更はどのワーカーでも
+    読み取りモデル経由で反映され、古い行は使われなくなる）。
+    """
+    key = (
+        current_tenant(), item["item_id"], item["updated_at"], item["balance_version"],
+        item["category_name"], role, location_id,
+    )
+    return Markup(item_row_cache.get_or_render(
+        key,
+        lambda: render_template(
+            "item_row.html",
+            item=item,
+            role=role,
+            low_stock_threshold=LOW_STOCK_THRESHOLD,
+        ),
+    ))
+
+
+# ==== 入力補完（商品・仕入先・カテゴリ） ====
+def lookup_params():
+    q = request.args.get("q", "")
+    limit = request.args.get("limit", type=int) or LOOKUP_LIMIT
+    return q, max(1, min(limit, MAX_LOOKUP_LIMIT))
+
+
+@app.route("/api/lookup/items")
+@api_login_required
+def lookup_items():
+    q, limit = lookup_params()
+    conn = get_db_connection()
+    results = search_items(conn, q, limit)
+    conn.close()
+    return jsonify({"results": results})
+
+
+@app.route("/api/lookup/suppliers")
+@api_login_required
+def lookup_suppliers():
+    q, limit = lookup_params()
+    conn = get_db_connection()
+    results = search_by_name(conn, "SUPPLIERS", "supplier_id", q, limit)
+    conn.close()
+    return jsonify({"results": results})
+
+
+@app.route("/api/lookup/categories")
+@api_login_required
+def lookup_categories():
+    q, limit = lookup_params()
+    conn = get_db_connection()
+    results = search_by_name(conn, "CATEGORIES", "category_id", q, limit)
+    conn.close()
+    return jsonify({"results": results})
+
+
+# ==== 行キャッシュの統計（管理者用） ====
+@app.route("/admin/cache_stats")
+@login_required
+@admin_required
+def cache_stats():
+    conn = get_db_connection()
+    model = item_read_model(conn)
+    conn.close()
+    return jsonify({
+        "item_rows": item_row_cache.stats(),
+        "reports": report_cache.stats(),
+        "read_model": model.stats(),
+    })
+
+
+# ==== 読み取りモデルと DB の突き合わせ（管理者用） ====
+@app.route("/admin/read_model/check")
+@login_required
+@admin_required
+def check_read_model():
+    """メモリ上の読み取りモデルを DB から作り直したものと比べる
+
+    食い違いがあればこのワーカーのモデルは次のリクエストで全件読み直す。
+    """
+    conn = get_db_connection()
+    model = item_read_model(conn)
+    diffs = model.check_consistency(conn)
+    if diffs:
+        model.loaded = False
+    stats = model.stats()
+    conn.close()
+    return jsonify({"ok": not diffs, "differences": diffs, "stats": stats}), (200 if not diffs else 409)
+
+
+# ==== 商品登録（GET:フォーム表示 / POST:登録処理） ====
+@app.route("/items/new", methods=["GET", "POST"])
+@login_required
+def add_item():
+    conn = get_db_connection()
+
+    if request.method == "POST":
+        # フォームから取得
+        name = request.form.get("name", "").strip()
+        sku = request.form.get("sku", "").strip()
+        category_id = request.form.get("category_id") or None
+        base_price = request.form.get("base_price") or None
+        size = request.form.get("size", "").strip() or None
+        color = request.form.get("color", "").strip() or None
+        material = request.form.get("material", "").strip() or None
+        note = request.form.get("note", "").strip() or None
+        is_active = 1 if request.form.get("is_active") == "1" else 0
+
+        # 簡単なバリデーション
+        errors = []
+        if not name:
+            errors.append("商品名は必須です。")
+
+        base_price_int = None
+        if base_price:
+            try:
+                base_price_int = int(base_price)
+            except ValueError:
+                errors.append("標準価格は数字で入力してください。")
+
+        category_id_int = None
+        if category_id:
+            try:
+                category_id_int = int(category_id)
+            except ValueError:
+                errors.append("カテゴリIDが不正です。")
+        if category_id_int is not None and conn.execute(
+            "SELECT 1 FROM CATEGORIES WHERE category_id = ?", (category_id_int,)
+        ).fetchone() is None:
+            errors.append("指定されたカテゴリが見つかりません。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            category_label = selected_label(conn, "category", category_id)
+            conn.close()
+            # 入力内容を維持するため form=request.form を渡す
+            return render_template(
+                "add_item.html",
+                form=request.form,
+                category_label=category_label,
+            )
+
+        # 日付（created_at / updated_at）を現在時刻で設定
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        cur = conn.execute(
+            """
+            INSERT INTO ITEMS
+                (name, sku, category_id, base_price, size, color, material, note,
+                 created_at, updated_at, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                name,
+                sku,
+                category_id_int,
+                base_price_int,
+                size,
+                color,
+                material,
+                note,
+                now,
+                now,
+                is_active,
+            ),
+        )
+        apply_delta(conn, ZERO, contribution(conn, LOW_STOCK_THRESHOLD, [cur.lastrowid]))
+        record_prices(conn, [cur.lastrowid], now)
+        log_row(conn, "item", "ITEMS", "item_id", cur.lastrowid)
+        conn.commit()
+        conn.close()
+
+        flash("商品を登録しました。", "success")
+        return redirect(url_for("item_list"))
+
+    # GETのときは空フォーム
+    conn.close()
+    return render_template(
+        "add_item.html",
+        form={},
+        category_label="",
+    )
+
+
+# ==== 商品編集 ====
+@app.route("/items/<int:item_id>/edit", methods=["GET", "POST"])
+@login_required
+def edit_item(item_id):
+    conn = get_db_connection()
+
+    # 対象商品の取得
+    item = conn.execute(
+        "SELECT * FROM ITEMS WHERE item_id = ?",
+        (item_id,),
+    ).fetchone()
+
+    if item is None:
+        conn.close()
+        flash("指定された商品が見つかりません。", "error")
+        return redirect(url_for("item_list"))
+
+    if request.method == "POST":
+        # フォームから取得
+        name = request.form.get("name", "").strip()
+        sku = request.form.get("sku", "").strip()
+        category_id = request.form.get("category_id") or None
+        base_price = request.form.get("base_price") or None
+        size = request.form.get("size", "").strip() or None
+        color = request.form.get("color", "").strip() or None
+        material = request.form.get("material", "").strip() or None
+        note = request.form.get("note", "").strip() or None
+        is_active = 1 if request.form.get("is_active") == "1" else 0
+
+        errors = []
+        if not name:
+            errors.append("商品名は必須です。")
+
+        base_price_int = None
+        if base_price:
+            try:
+                base_price_int = int(base_price)
+            except ValueError:
+                errors.append("標準価格は数字で入力してください。")
+
+        category_id_int = None
+        if category_id:
+            try:
+                category_id_int = int(category_id)
+            except ValueError:
+                errors.append("カテゴリIDが不正です。")
+        if category_id_int is not None and conn.execute(
+            "SELECT 1 FROM CATEGORIES WHERE category_id = ?", (category_id_int,)
+        ).fetchone() is None:
+            errors.append("指定されたカテゴリが見つかりません。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            category_label = selected_label(conn, "category", category_id)
+            prices = price_history(conn, item_id)
+            conn.close()
+            # 入力内容を維持して再表示
+            return render_template(
+                "edit_item.html",
+                item_id=item_id,
+                form=request.form,
+                category_label=category_label,
+                prices=prices,
+            )
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with track_items(conn, [item_id], LOW_STOCK_THRESHOLD):
+            conn.execute(
+                """
+                UPDATE ITEMS
+                SET
+                    name = ?,
+                    sku = ?,
+                    category_id = ?,
+                    base_price = ?,
+                    size = ?,
+                    color = ?,
+                    material = ?,
+                    note = ?,
+                    updated_at = ?,
+                    is_active = ?
+                WHERE item_id = ?
+                """,
+                (
+                    name,
+                    sku,
+                    category_id_int,
+                    base_price_int,
+                    size,
+                    color,
+                    material,
+                    note,
+                    now,
+                    is_active,
+                    item_id,
+                ),
+            )
+        # 価格が変わっていれば履歴に残す（過去の出庫は変更前の価格で集計される）
+        record_prices(conn, [item_id], now)
+        log_row(conn, "item", "ITEMS", "item_id", item_id)
+        conn.commit()
+        conn.close()
+
+        flash("商品を更新しました。", "success")
+        return redirect(url_for("item_list"))
+
+    # GET のとき：現在値をフォーム用の dict に詰める
+    form_data = {
+        "name": item["name"],
+        "sku": item["sku"] or "",
+        "category_id": str(item["category_id"]) if item["category_id"] is not None else "",
+        "base_price": item["base_price"] if item["base_price"] is not None else "",
+        "size": item["size"] or "",
+        "color": item["color"] or "",
+        "material": item["material"] or "",
+        "note": item["note"] or "",
+        "is_active": "1" if item["is_active"] == 1 else "0",
+    }
+
+    category_label = selected_label(conn, "category", item["category_id"])
+    prices = price_history(conn, item_id)
+    conn.close()
+    return render_template(
+        "edit_item.html",
+        item_id=item_id,
+        form=form_data,
+        category_label=category_label,
+        prices=prices,
+    )
+
+# ==== 商品ごとの在庫履歴 ====
+@app.route("/items/<int:item_id>/history")
+@login_required
+def item_history(item_id):
+    conn = get_db_connection()
+
+    # 商品情報・ロケーション別の現在庫は読み取りモデルから
+    # （在庫のリアルタイム更新は、読み取る前の high_water_mark の次から受け取る。item_list 参照）
+    model = item_read_model(conn)
+    balance_since = model.high_water_mark
+    item = model.item_detail(item_id)
+
+    if item is None:
+        conn.close()
+        flash("指定された商品が見つかりません。", "error")
+        return redirect(url_for("item_list"))
+
+    # 在庫移動を取得（古い順）。件数が多くなるので cursor のまま 1 行ずつ描画する
+    movements = conn.execute(
+        """
+        SELECT
+            m.movement_id,
+            m.movement_type,
+            m.quantity,
+            m.memo,
+            m.created_at,
+            s.name AS supplier_name,
+            l.name AS location_name,
+            tl.name AS to_location_name
+        FROM STOCK_MOVEMENTS m
+        LEFT JOIN SUPPLIERS s ON m.supplier_id = s.supplier_id
+        LEFT JOIN LOCATIONS l ON m.location_id = l.location_id
+        LEFT JOIN LOCATIONS tl ON m.to_location_id = tl.location_id
+        WHERE m.item_id = ?
+        ORDER BY m.created_at ASC, m.movement_id ASC
+        """,
+        (item_id,),
+    )
+
+    return stream_page(
+        "item_history.html",
+        conn,
+        item=item,
+        history=history_rows(movements),
+        balances=item["balances"],
+        balance_since=balance_since,
+    )
+
+
+# ==== 商品ごとの在庫推移（グラフ用 JSON） ====
+@app.route("/api/items/<int:item_id>/stock_series")
+@api_login_required
+def api_stock_series(item_id):
+    """?start=&end=（YYYY-MM-DD）の在庫数の推移を points 点以下に間引いて返す
+
+    method は lttb（既定）か minmax、location_id を付けるとそのロケーションの在庫数。
+    """
+    start, end, sql_from, sql_to = report_date_range(STOCK_SERIES_DAYS)
+    points = request.args.get("points", default=STOCK_SERIES_POINTS, type=int)
+    points = max(2, min(points, MAX_STOCK_SERIES_POINTS))
+    method = request.args.get("method", "lttb")
+    if method not in DOWNSAMPLE_METHODS:
+        return jsonify({"error": "method must be one of " + ", ".join(DOWNSAMPLE_METHODS)}), 400
+    location_id = request.args.get("location_id", type=int)
+
+    conn = get_db_connection()
+    item = conn.execute("SELECT 1 FROM ITEMS WHERE item_id = ?", (item_id,)).fetchone()
+    if item is None:
+        conn.close()
+        return jsonify({"error": "not found"}), 404
+    # 今日を含む期間のグラフは今の時刻で終える
+    times, quantities = load_stock_series(
+        conn, item_id, sql_from, sql_to, location_id,
+        until=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    conn.close()
+
+    total_points = len(times)
+    times, quantities = downsample(times, quantities, points, method)
+    return jsonify({
+        "item_id": item_id,
+        "location_id": location_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "method": method,
+        "total_points": total_points,
+        "times": format_times(times),
+        "quantities": quantities.tolist(),
+    })
+
+
+def history_rows(movements):
+    """在庫移動を 1 行ずつ読みながら在庫推移（残高）を計算する"""
+    stock = 0
+    for m in movements:
+        if m["movement_type"] == "IN":
+            delta = m["quantity"]
+        elif m["movement_type"] == "OUT":
+            delta = -m["quantity"]
+        elif m["movement_type"] == "ADJUST":
+            # 調整はプラスもマイナスもそのまま（棚卸の差異など）
+            delta = m["quantity"]
+        else:
+            # TRANSFER（ロケーション間の移動）は全体の在庫数を変えない
+            delta = 0
+
+        stock += delta
+
+        yield {
+            "movement_id": m["movement_id"],
+            "created_at": m["created_at"],
+            "movement_type": m["movement_type"],
+            "quantity": m["quantity"],
+            "delta": delta,
+            "stock_after": stock,
+            "memo": m["memo"],
+            "supplier_name": m["supplier_name"],
+            "location_name": m["location_name"],
+            "to_location_name": m["to_location_name"],
+        }
+
+
+# ==== サイズ × 色のマトリクス ====
+# 同じ商品名の ITEMS を 1 つの商品のバリエーション（サイズ・色違い）として扱う
+
+# サイズの並び順（ここにないサイズは後ろに名前順）
+SIZE_ORDER = ["XS", "S", "M", "L", "XL", "XXL", "3L", "4L", "F", "FREE"]
+
+
+def size_sort_key(size):
+    upper = size.upper()
+    if upper in SIZE_ORDER:
+        return (0, SIZE_ORDER.index(upper), "")
+    return (1, 0, size)
+
+
+@app.route("/products")
+@login_required
+def product_list():
+    conn = get_db_connection()
+    products = conn.execute(
+        """
+        SELECT
+            i.name,
+            COUNT(*) AS variant_count,
+            COUNT(DISTINCT COALESCE(i.size, '')) AS size_count,
+            COUNT(DISTINCT COALESCE(i.color, '')) AS color_count,
+            SUM(
+                (SELECT COALESCE(SUM(b.quantity), 0)
+                 FROM STOCK_BALANCES b
+                 WHERE b.item_id = i.item_id)
+            ) AS stock_quantity,
+            MIN(i.item_id) AS first_item_id
+        FROM ITEMS i
+        GROUP BY i.name
+        ORDER BY i.name
+        """
+    ).fetchall()
+    conn.close()
+    return render_template("product_list.html", products=products)
+
+
+@app.route("/items/<int:item_id>/matrix")
+@login_required
+def variant_matrix(item_id):
+    conn = get_db_connection()
+
+    item = conn.execute(
+        "SELECT item_id, name FROM ITEMS WHERE item_id = ?",
+        (item_id,),
+    ).fetchone()
+
+    if item is None:
+        conn.close()
+        flash("指定された商品が見つかりません。", "error")
+        return redirect(url_for("item_list"))
+
+    locations = conn.execute(
+        "SELECT location_id, name FROM LOCATIONS ORDER BY location_id"
+    ).fetchall()
+    selected_location_id = request.args.get("location_id", type=int)
+
+    balance_filter = ""
+    params = []
+    if selected_location_id:
+        balance_filter = "AND b.location_id = ?"
+        params.append(selected_location_id)
+    params.append(item["name"])
+
+    # 全バリエーションの在庫を 1 回の GROUP BY で取得
+    cells = conn.execute(
+        f"""
+        SELECT
+            COALESCE(i.size, '') AS size,
+            COALESCE(i.color, '') AS color,
+            COALESCE(SUM(b.quantity), 0) AS stock_quantity,
+            COUNT(DISTINCT i.item_id) AS variant_count,
+            MIN(i.item_id) AS item_id
+        FROM ITEMS i
+        LEFT JOIN STOCK_BALANCES b
+            ON b.item_id = i.item_id {balance_filter}
+        WHERE i.name = ?
+        GROUP BY COALESCE(i.size, ''), COALESCE(i.color, '')
+        """,
+        params,
+    ).fetchall()
+    conn.close()
+
+    sizes = sorted({c["size"] for c in cells}, key=size_sort_key)
+    colors = sorted({c["color"] for c in cells})
+    matrix = {(c["size"], c["color"]): c for c in cells}
+
+    return render_template(
+        "variant_matrix.html",
+        item=item,
+        sizes=sizes,
+        colors=colors,
+        matrix=matrix,
+        size_totals={
+            size: sum(c["stock_quantity"] for c in cells if c["size"] == size)
+            for size in sizes
+        },
+        color_totals={
+            color: sum(c["stock_quantity"] for c in cells if c["color"] == color)
+            for color in colors
+        },
+        total=sum(c["stock_quantity"] for c in cells),
+        locations=locations,
+        selected_location_id=selected_location_id,
+        low_stock_threshold=LOW_STOCK_THRESHOLD,
+    )
+
+
+# ==== 商品削除 ====
+@app.route("/items/<int:item_id>/delete", methods=["POST"])
+@login_required
+@admin_required
+def delete_item(item_id):
+    conn = get_db_connection()
+
+    # 在庫移動で使用されているかチェック
+    count_row = conn.execute(
+        "SELECT COUNT(*) AS cnt FROM STOCK_MOVEMENTS WHERE item_id = ?",
+        (item_id,),
+    ).fetchone()
+
+    if count_row["cnt"] > 0:
+        conn.close()
+        flash("この商品は在庫移動の履歴があるため、削除できません。", "error")
+        return redirect(url_for("item_list"))
+
+    with track_items(conn, [item_id], LOW_STOCK_THRESHOLD):
+        conn.execute(
+            "DELETE FROM ITEMS WHERE item_id = ?",
+            (item_id,),
+        )
+    log_row(conn, "item", "ITEMS", "item_id", item_id)
+    conn.commit()
+    conn.close()
+
+    flash("商品を削除しました。", "success")
+    return redirect(url_for("item_list"))
+
+
+# ==== 商品一括編集（価格・有効/無効・カテゴリ・素材） ====
+def validate_bulk_category(conn, changes, errors):
+    """変更先のカテゴリが存在するか確認する"""
+    category_id = changes.get("category_id")
+    if category_id is None:
+        return
+    row = conn.execute(
+        "SELECT 1 FROM CATEGORIES WHERE category_id = ?",
+        (category_id,),
+    ).fetchone()
+    if row is None:
+        errors.append("変更先のカテゴリが見つかりません。")
+
+
+@app.route("/items/bulk_edit", methods=["GET", "POST"])
+@login_required
+@admin_required
+def bulk_edit_items():
+    conn = get_db_connection()
+
+    categories = conn.execute(
+        "SELECT category_id, name FROM CATEGORIES ORDER BY name"
+    ).fetchall()
+
+    preview = None
+
+    if request.method == "POST":
+        filters, changes, errors = parse_bulk_request(request.form)
+        if not errors:
+            validate_bulk_category(conn, changes, errors)
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+        elif request.form.get("action") == "apply":
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            updated = apply_bulk_edit(conn, filters, changes, now, LOW_STOCK_THRESHOLD)
+            conn.commit()
+            conn.close()
+
+            if updated:
+                flash(f"{updated}件の商品を更新しました。", "success")
+            else:
+                flash("条件に一致する商品がありませんでした。", "error")
+            return redirect(url_for("item_list"))
+        else:
+            preview = preview_bulk_edit(conn, filters, changes)
+
+    conn.close()
+    return render_template(
+        "bulk_edit_items.html",
+        categories=categories,
+        form=request.form,
+        preview=preview,
+    )
+
+
+# ==== 商品一括編集（JSON） ====
+@app.route("/api/items/bulk_edit", methods=["POST"])
+@api_login_required
+def api_bulk_edit_items():
+    if session.get("user_id") and session.get("role") != "admin":
+        return jsonify({"error": "admin only"}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"errors": ["JSON の本文が必要です。"]}), 400
+
+    conn = get_db_connection()
+    filters, changes, errors = parse_bulk_request(data)
+    if not errors:
+        validate_bulk_category(conn, changes, errors)
+    if errors:
+        conn.close()
+        return jsonify({"errors": errors}), 400
+
+    if data.get("dry_run"):
+        preview = preview_bulk_edit(conn, filters, changes)
+        conn.close()
+        return jsonify({
+            "dry_run": True,
+            "count": preview["count"],
+            "samples": [dict(row) for row in preview["samples"]],
+        })
+
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    updated = apply_bulk_edit(conn, filters, changes, now, LOW_STOCK_THRESHOLD)
+    conn.commit()
+    conn.close()
+    return jsonify({"dry_run": False, "updated": updated, "updated_at": now})
+
+
+# ==== 仕入先一覧 ====
+@app.route("/suppliers")
+@login_required
+def supplier_list():
+    conn = get_db_connection()
+    # 入荷実績（入庫数合計・取扱商品数・最終入荷日）付きの仕入先を 1 行ずつ描画する
+    suppliers = supplier_summaries(conn)
+    return stream_page("supplier_list.html", conn, suppliers=suppliers)
+
+
+# ==== 仕入先詳細（入荷実績） ====
+@app.route("/suppliers/<int:supplier_id>")
+@login_required
+def supplier_detail(supplier_id):
+    conn = get_db_connection()
+
+    supplier = conn.execute(
+        """
+        SELECT supplier_id, name, phone, email, address, note, created_at
+        FROM SUPPLIERS
+        WHERE supplier_id = ?
+        """,
+        (supplier_id,),
+    ).fetchone()
+
+    if supplier is None:
+        conn.close()
+        flash("指定された仕入先が見つかりません。", "error")
+        return redirect(url_for("supplier_list"))
+
+    monthly = supplier_monthly(conn, supplier_id)
+    items = supplier_items(conn, supplier_id)
+    conn.close()
+
+    return render_template(
+        "supplier_detail.html",
+        supplier=supplier,
+        monthly=monthly,
+        items=items,
+        last_delivery_at=max((i["last_delivery_at"] for i in items), default=None),
+    )
+
+
+# ==== 仕入先登録 ====
+@app.route("/suppliers/new", methods=["GET", "POST"])
+@login_required
+def add_supplier():
+    conn = get_db_connection()
+
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        phone = request.form.get("phone", "").strip() or None
+        email = request.form.get("email", "").strip() or None
+        address = request.form.get("address", "").strip() or None
+        note = request.form.get("note", "").strip() or None
+
+        errors = []
+        if not name:
+            errors.append("仕入先名は必須です。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            conn.close()
+            return render_template(
+                "add_supplier.html",
+                form=request.form,
+            )
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        cur = conn.execute(
+            """
+            INSERT INTO SUPPLIERS
+                (name, phone, email, address, note, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (name, phone, email, address, note, now),
+        )
+        log_row(conn, "supplier", "SUPPLIERS", "supplier_id", cur.lastrowid)
+        conn.commit()
+        conn.close()
+
+        flash("仕入先を登録しました。", "success")
+        return redirect(url_for("supplier_list"))
+
+    conn.close()
+    return render_template(
+        "add_supplier.html",
+        form={},
+    )
+
+
+# ==== 仕入先編集 ====
+@app.route("/suppliers/<int:supplier_id>/edit", methods=["GET", "POST"])
+@login_required
+def edit_supplier(supplier_id):
+    conn = get_db_connection()
+
+    supplier = conn.execute(
+        """
+        SELECT supplier_id, name, phone, email, address, note, created_at
+        FROM SUPPLIERS
+        WHERE supplier_id = ?
+        """,
+        (supplier_id,),
+    ).fetchone()
+
+    if supplier is None:
+        conn.close()
+        flash("指定された仕入先が見つかりません。", "error")
+        return redirect(url_for("supplier_list"))
+
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        phone = request.form.get("phone", "").strip() or None
+        email = request.form.get("email", "").strip() or None
+        address = request.form.get("address", "").strip() or None
+        note = request.form.get("note", "").strip() or None
+
+        errors = []
+        if not name:
+            errors.append("仕入先名は必須です。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            conn.close()
+            return render_template(
+                "edit_supplier.html",
+                supplier_id=supplier_id,
+                form=request.form,
+            )
+
+        conn.execute(
+            """
+            UPDATE SUPPLIERS
+            SET name = ?, phone = ?, email = ?, address = ?, note = ?
+            WHERE supplier_id = ?
+            """,
+            (name, phone, email, address, note, supplier_id),
+        )
+        log_row(conn, "supplier", "SUPPLIERS", "supplier_id", supplier_id)
+        conn.commit()
+        conn.close()
+
+        flash("仕入先を更新しました。", "success")
+        return redirect(url_for("supplier_list"))
+
+    # GET のとき既存データをフォームに詰める
+    form_data = {
+        "name": supplier["name"],
+        "phone": supplier["phone"] or "",
+        "email": supplier["email"] or "",
+        "address": supplier["address"] or "",
+        "note": supplier["note"] or "",
+    }
+    conn.close()
+    return render_template(
+        "edit_supplier.html",
+        supplier_id=supplier_id,
+        form=form_data,
+    )
+
+
+# ==== 仕入先削除 ====
+@app.route("/suppliers/<int:supplier_id>/delete", methods=["POST"])
+@login_required
+@admin_required
+def delete_supplier(supplier_id):
+    conn = get_db_connection()
+
+    # 在庫移動で使用されているかチェック（索引で 1 件見つかれば十分）
+    used_row = conn.execute(
+        "SELECT 1 FROM STOCK_MOVEMENTS WHERE supplier_id = ? LIMIT 1",
+        (supplier_id,),
+    ).fetchone()
+
+    if used_row is not None:
+        conn.close()
+        flash("この仕入先を使用している在庫移動があるため、削除できません。", "error")
+        return redirect(url_for("supplier_list"))
+
+    conn.execute(
+        "DELETE FROM SUPPLIERS WHERE supplier_id = ?",
+        (supplier_id,),
+    )
+    log_row(conn, "supplier", "SUPPLIERS", "supplier_id", supplier_id)
+    conn.commit()
+    conn.close()
+
+    flash("仕入先を削除しました。", "success")
+    return redirect(url_for("supplier_list"))
+
+
+# ==== ロケーション（店舗・倉庫）一覧 ====
+@app.route("/locations")
+@login_required
+def location_list():
+    conn = get_db_connection()
+    locations = conn.execute(
+        """
+        SELECT
+            l.location_id,
+            l.name,
+            l.note,
+            l.created_at,
+            COALESCE(SUM(b.quantity), 0) AS total_quantity,
+            COUNT(CASE WHEN b.quantity <> 0 THEN 1 END) AS item_count
+        FROM LOCATIONS l
+        LEFT JOIN STOCK_BALANCES b ON b.location_id = l.location_id
+        GROUP BY l.location_id
+        ORDER BY l.location_id
+        """
+    ).fetchall()
+    conn.close()
+    return render_template("location_list.html", locations=locations)
+
+
+# ==== ロケーション登録 ====
+@app.route("/locations/new", methods=["GET", "POST"])
+@login_required
+@admin_required
+def add_location():
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        note = request.form.get("note", "").strip() or None
+
+        if not name:
+            flash("ロケーション名は必須です。", "error")
+            return render_template("add_location.html", form=request.form)
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        conn = get_db_connection()
+        cur = conn.execute(
+            "INSERT INTO LOCATIONS (name, note, created_at) VALUES (?, ?, ?)",
+            (name, note, now),
+        )
+        log_row(conn, "location", "LOCATIONS", "location_id", cur.lastrowid)
+        conn.commit()
+        conn.close()
+
+        flash("ロケーションを登録しました。", "success")
+        return redirect(url_for("location_list"))
+
+    return render_template("add_location.html", form={})
+
+
+# ==== カテゴリ一括登録 ====
+@app.route("/categories/bulk_new", methods=["GET", "POST"])
+@login_required
+@admin_required
+def bulk_add_categories():
+    conn = get_db_connection()
+
+    if request.method == "POST":
+        raw_text = request.form.get("lines", "")
+        lines = raw_text.splitlines()
+
+        inserted_count = 0
+        errors = []
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        for idx, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue  # 空行はスキップ
+
+            # 「カテゴリ名, 説明」形式を想定（カンマがなければ全部カテゴリ名）
+            parts = [p.strip() for p in line.split(",", 1)]
+            name = parts[0]
+            description = parts[1] if len(parts) > 1 and parts[1] else None
+
+            if not name:
+                errors.append(f"{idx}行目：カテゴリ名が空です。")
+                continue
+
+            cur = conn.execute(
+                """
+                INSERT INTO CATEGORIES (name, description, created_at)
+                VALUES (?, ?, ?)
+                """,
+                (name, description, now),
+            )
+            log_row(conn, "category", "CATEGORIES", "category_id", cur.lastrowid)
+            inserted_count += 1
+
+        conn.commit()
+        conn.close()
+
+        if inserted_count > 0:
+            flash(f"{inserted_count}件のカテゴリを登録しました。", "success")
+        for e in errors:
+            flash(e, "error")
+
+        return redirect(url_for("category_list"))
+
+    conn.close()
+    return render_template("bulk_add_categories.html")
+
+
+# ==== カテゴリ一覧 ====
+@app.route("/categories")
+@login_required
+def category_list():
+    conn = get_db_connection()
+    categories = conn.execute(
+        """
+        SELECT
+            category_id,
+            name,
+            description,
+            created_at
+        FROM CATEGORIES
+        ORDER BY category_id DESC
+        """
+    )
+    return stream_page("category_list.html", conn, categories=categories)
+
+
+# ==== カテゴリ登録（GET:フォーム表示 / POST:登録処理） ====
+@app.route("/categories/new", methods=["GET", "POST"])
+@login_required
+def add_category():
+    conn = get_db_connection()
+
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        description = request.form.get("description", "").strip() or None
+
+        errors = []
+        if not name:
+            errors.append("カテゴリ名は必須です。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            conn.close()
+            return render_template(
+                "add_category.html",
+                form=request.form,
+            )
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        cur = conn.execute(
+            """
+            INSERT INTO CATEGORIES
+                (name, description, created_at)
+            VALUES (?, ?, ?)
+            """,
+            (name, description, now),
+        )
+        log_row(conn, "category", "CATEGORIES", "category_id", cur.lastrowid)
+        conn.commit()
+        conn.close()
+
+        flash("カテゴリを登録しました。", "success")
+        return redirect(url_for("category_list"))
+
+    conn.close()
+    return render_template(
+        "add_category.html",
+        form={},
+    )
+
+# ==== 在庫移動一覧 ====
+def fetch_movement_rows(conn, before_id=None, limit=MOVEMENT_PAGE_SIZE):
+    """在庫移動一覧の 1 ページ分を movement_id の降順で取得する"""
+    where_clause = ""
+    params = []
+    if before_id:
+        where_clause = "WHERE m.movement_id < ?"
+        params.append(before_id)
+    params.append(limit)
+
+    return conn.execute(
+        f"""
+        SELECT
+            m.movement_id,
+            m.movement_type,
+            m.quantity,
+            m.memo,
+            m.created_at,
+            i.name AS item_name,
+            s.name AS supplier_name,
+            l.name AS location_name,
+            tl.name AS to_location_name
+        FROM STOCK_MOVEMENTS m
+        LEFT JOIN ITEMS i ON m.item_id = i.item_id
+        LEFT JOIN SUPPLIERS s ON m.supplier_id = s.supplier_id
+        LEFT JOIN LOCATIONS l ON m.location_id = l.location_id
+        LEFT JOIN LOCATIONS tl ON m.to_location_id = tl.location_id
+        {where_clause}
+        ORDER BY m.movement_id DESC
+        LIMIT ?
+        """,
+        params,
+    ).fetchall()
+
+
+@app.route("/movements")
+@login_required
+def movement_list():
+    conn = get_db_connection()
+    movements = fetch_movement_rows(conn)
+    conn.close()
+    return render_template(
+        "stock_movement_list.html",
+        movements=movements,
+        row_start=0,
+        next_before_id=next_cursor(movements, "movement_id", MOVEMENT_PAGE_SIZE),
+    )
+
+
+# ==== 在庫移動一覧の続き（JSON） ====
+@app.route("/api/movements/rows")
+@api_login_required
+def api_movement_rows():
+    before_id = request.args.get("before_id", type=int)
+    row_start = request.args.get("start", default=0, type=int)
+    limit = clamp_page_size(request.args.get("limit", type=int), MOVEMENT_PAGE_SIZE)
+
+    conn = get_db_connection()
+    movements = fetch_movement_rows(conn, before_id=before_id, limit=limit)
+    conn.close()
+
+    return jsonify({
+        "html": render_template(
+            "stock_movement_rows.html",
+            movements=movements,
+            row_start=row_start,
+        ),
+        "count": len(movements),
+        "next_before_id": next_cursor(movements, "movement_id", limit),
+    })
+
+
+# ==== 在庫移動登録（入庫・出庫・調整） ====
+@app.route("/movements/new", methods=["GET", "POST"])
+@login_required
+def add_movement():
+    conn = get_db_connection()
+
+    # 商品・仕入先は全件ではなく入力補完（/api/lookup/...）で選ぶ
+    locations = conn.execute(
+        "SELECT location_id, name FROM LOCATIONS ORDER BY location_id"
+    ).fetchall()
+    default_location_id = get_default_location_id(conn)
+
+    if request.method == "POST":
+        item_id = request.form.get("item_id") or None
+        movement_type = request.form.get("movement_type", "").strip()
+        quantity = request.form.get("quantity") or None
+        supplier_id = request.form.get("supplier_id") or None
+        location_id = request.form.get("location_id") or None
+        to_location_id = request.form.get("to_location_id") or None
+        memo = request.form.get("memo", "").strip() or None
+
+        errors = []
+
+        # 必須チェック
+        if not item_id:
+            errors.append("商品は必須です。")
+
+        if not movement_type:
+            errors.append("移動種別は必須です。")
+
+        qty_int = None
+        if quantity:
+            try:
+                qty_int = int(quantity)
+                # 調整（ADJUST）だけは棚卸の差異などでマイナスも登録できる
+                if qty_int == 0 or (qty_int < 0 and movement_type != "ADJUST"):
+                    errors.append("数量は1以上の整数で入力してください（調整のみマイナス可）。")
+            except ValueError:
+                errors.append("数量は整数で入力してください。")
+        else:
+            errors.append("数量は必須です。")
+
+        item_id_int = None
+        if item_id:
+            try:
+                item_id_int = int(item_id)
+            except ValueError:
+                errors.append("商品IDが不正です。")
+
+        supplier_id_int = None
+        if supplier_id:
+            try:
+                supplier_id_int = int(supplier_id)
+            except ValueError:
+                errors.append("仕入先IDが不正です。")
+
+        # 入力補完で選んだ ID がまだ存在するか
+        if item_id_int is not None and conn.execute(
+            "SELECT 1 FROM ITEMS WHERE item_id = ? AND is_active = 1", (item_id_int,)
+        ).fetchone() is None:
+            errors.append("指定された商品が見つかりません。")
+        if supplier_id_int is not None and conn.execute(
+            "SELECT 1 FROM SUPPLIERS WHERE supplier_id = ?", (supplier_id_int,)
+        ).fetchone() is None:
+            errors.append("指定された仕入先が見つかりません。")
+
+        # movement_type の簡易チェック
+        if movement_type not in MOVEMENT_TYPES:
+            errors.append("移動種別が不正です。")
+
+        location_id_int, to_location_id_int = parse_movement_locations(
+            conn, location_id, to_location_id, movement_type, default_location_id, errors
+        )
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            item_label = selected_label(conn, "item", item_id)
+            supplier_label = selected_label(conn, "supplier", supplier_id)
+            conn.close()
+            return render_template(
+                "add_stock_movement.html",
+                locations=locations,
+                form=request.form,
+                item_label=item_label,
+                supplier_label=supplier_label,
+            )
+
+        record_movement(
+            conn,
+            item_id_int,
+            movement_type,
+            qty_int,
+            location_id_int,
+            supplier_id=supplier_id_int,
+            memo=memo,
+            to_location_id=to_location_id_int,
+        )
+        conn.commit()
+        conn.close()
+
+        flash("在庫移動を登録しました。", "success")
+        return redirect(url_for("movement_list"))
+
+    # 商品の在庫履歴などから ?item_id= 付きで開かれたときは選択済みにする
+    item_id = request.args.get("item_id", "")
+    item_label = selected_label(conn, "item", item_id)
+    conn.close()
+    return render_template(
+        "add_stock_movement.html",
+        locations=locations,
+        form={"location_id": str(default_location_id), "item_id": item_id if item_label else ""},
+        item_label=item_label,
+        supplier_label="",
+    )
+
+def parse_movement_locations(conn, location_id, to_location_id, movement_type, default_location_id, errors):
+    """フォームのロケーション指定をチェックして (location_id, to_location_id) を返す
+
+    ロケーション未指定なら既定のロケーション。TRANSFER のときだけ移動先が必須。
+    """
+    location_id_int = default_location_id
+    if location_id:
+        try:
+            location_id_int = int(location_id)
+        except ValueError:
+            errors.append("ロケーションIDが不正です。")
+
+    to_location_id_int = None
+    if movement_type == "TRANSFER":
+        if not to_location_id:
+            errors.append("店舗間移動では移動先を選択してください。")
+        else:
+            try:
+                to_location_id_int = int(to_location_id)
+            except ValueError:
+                errors.append("移動先ロケーションIDが不正です。")
+        if to_location_id_int is not None and to_location_id_int == location_id_int:
+            errors.append("移動元と移動先が同じです。")
+
+    for loc_id in (location_id_int, to_location_id_int):
+        if loc_id is None:
+            continue
+        row = conn.execute(
+            "SELECT 1 FROM LOCATIONS WHERE location_id = ?", (loc_id,)
+        ).fetchone()
+        if row is None:
+            errors.append("指定されたロケーションが見つかりません。")
+
+    return location_id_int, to_location_id_int
+
+
+# ==== 在庫クイック更新（商品一覧からの入出庫） ====
+@app.route("/movements/quick", methods=["POST"])
+@login_required
+def quick_movement():
+    conn = get_db_connection()
+
+    item_id = request.form.get("item_id") or None
+    movement_type = request.form.get("movement_type", "").strip()
+    quantity = request.form.get("quantity") or None
+    location_id = request.form.get("location_id") or None
+    memo = request.form.get("memo", "").strip() or None
+
+    errors = []
+
+    # 必須チェック
+    if not item_id:
+        errors.append("商品IDが不正です。")
+
+    if not movement_type:
+        errors.append("移動種別は必須です。")
+
+    qty_int = None
+    if quantity:
+        try:
+            qty_int = int(quantity)
+            if qty_int <= 0:
+                errors.append("数量は1以上の整数で入力してください。")
+        except ValueError:
+            errors.append("数量は整数で入力してください。")
+    else:
+        errors.append("数量は必須です。")
+
+    # ロケーション間の移動は移動先が必要なので在庫移動登録画面から行う
+    if movement_type not in ("IN", "OUT", "ADJUST"):
+        errors.append("移動種別が不正です。")
+
+    location_id_int, _ = parse_movement_locations(
+        conn, location_id, None, movement_type, get_default_location_id(conn), errors
+    )
+
+    # item_id 整数変換
+    item_id_int = None
+    if item_id:
+        try:
+            item_id_int = int(item_id)
+        except ValueError:
+            errors.append("商品IDが不正です。")
+
+    if errors:
+        for e in errors:
+            flash(e, "error")
+        conn.close()
+        return redirect(url_for("item_list"))
+
+    # 仕入先はとりあえず None（必要ならフォームに追加も可）
+    record_movement(
+        conn,
+        item_id_int,
+        movement_type,
+        qty_int,
+        location_id_int,
+        memo=memo or None,
+    )
+    conn.commit()
+    conn.close()
+
+    flash("在庫を更新しました。", "success")
+    return redirect(url_for("item_list"))
+
+
+
+# ==== 棚卸 ====
+STOCKTAKE_STATUS_LABELS = {
+    "open": "棚卸中",
+    "committed": "確定済み",
+    "cancelled": "中止",
+}
+
+
+def get_stocktake(conn, stocktake_id):
+    return conn.execute(
+        """
+        SELECT s.*, l.name AS location_name
+        FROM STOCKTAKES s
+        LEFT JOIN LOCATIONS l ON l.location_id = s.location_id
+        WHERE s.stocktake_id = ?
+        """,
+        (stocktake_id,),
+    ).fetchone()
+
+
+@app.route("/stocktakes", methods=["GET", "POST"])
+@login_required
+def stocktake_list():
+    conn = get_db_connection()
+
+    if request.method == "POST":
+        location_id = request.form.get("location_id") or None
+        note = request.form.get("note", "").strip() or None
+
+        errors = []
+        location_id_int, _ = parse_movement_locations(
+            conn, location_id, None, "ADJUST", get_default_location_id(conn), errors
+        )
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            conn.close()
+            return redirect(url_for("stocktake_list"))
+
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cur = conn.execute(
+            """
+            INSERT INTO STOCKTAKES (location_id, status, note, created_by, created_at)
+            VALUES (?, 'open', ?, ?, ?)
+            """,
+            (location_id_int, note, session.get("username"), now),
+        )
+        conn.commit()
+        conn.close()
+
+        flash("棚卸を開始しました。数えた数量を取り込んでください。", "success")
+        return redirect(url_for("stocktake_detail", stocktake_id=cur.lastrowid))
+
+    stocktakes = conn.execute(
+        """
+        SELECT
+            s.*,
+            l.name AS location_name,
+            (SELECT COUNT(*) FROM STOCKTAKE_COUNTS c
+             WHERE c.stocktake_id = s.stocktake_id) AS counted_items
+        FROM STOCKTAKES s
+        LEFT JOIN LOCATIONS l ON l.location_id = s.location_id
+        ORDER BY s.stocktake_id DESC
+        """
+    ).fetchall()
+    locations = conn.execute(
+        "SELECT location_id, name FROM LOCATIONS ORDER BY location_id"
+    ).fetchall()
+    conn.close()
+
+    return render_template(
+        "stocktake_list.html",
+        stocktakes=stocktakes,
+        locations=locations,
+        status_labels=STOCKTAKE_STATUS_LABELS,
+    )
+
+
+@app.route("/stocktakes/<int:stocktake_id>")
+@login_required
+def stocktake_detail(stocktake_id):
+    conn = get_db_connection()
+    stocktake = get_stocktake(conn, stocktake_id)
+    if stocktake is None:
+        conn.close()
+        flash("指定された棚卸が見つかりません。", "error")
+        return redirect(url_for("stocktake_list"))
+
+    if stocktake["status"] == "committed":
+        rows = committed_rows(conn, stocktake_id)
+    else:
+        rows = variance_rows(conn, stocktake_id, stocktake["location_id"])
+    summary = summarize_variance(rows)
+    summary["uncounted_items"] = count_uncounted(conn, stocktake_id, stocktake["location_id"])
+    conn.close()
+
+    show_all = request.args.get("show") == "all"
+    if not show_all:
+        rows = [r for r in rows if r["variance"]]
+
+    import_jobs = stocktake_import_jobs(stocktake_id)
+    return render_template(
+        "stocktake_detail.html",
+        stocktake=stocktake,
+        rows=rows,
+        summary=summary,
+        show_all=show_all,
+        status_labels=STOCKTAKE_STATUS_LABELS,
+        import_jobs=import_jobs,
+        job_status_labels=JOB_STATUS_LABELS,
+        has_active_import=any(j["status"] in ("queued", "running") for j in import_jobs),
+    )
+
+
+# ==== 棚卸：数えた数量の取り込み（CSV ファイル・スキャナーの読み取り結果） ====
+@app.route("/stocktakes/<int:stocktake_id>/counts", methods=["POST"])
+@login_required
+def upload_stocktake_counts(stocktake_id):
+    conn = get_db_connection()
+    stocktake = get_stocktake(conn, stocktake_id)
+    conn.close()
+    if stocktake is None or stocktake["status"] != "open":
+        flash("この棚卸には数量を取り込めません。", "error")
+        return redirect(url_for("stocktake_list"))
+
+    mode = request.form.get("mode", "replace")
+    if mode not in COUNT_MODES:
+        mode = "replace"
+
+    upload = request.files.get("file")
+    if upload and upload.filename:
+        # Excel で保存した CSV（BOM 付き UTF-8）もそのまま読めるように
+        text = upload.read().decode("utf-8-sig", errors="replace")
+    else:
+        text = request.form.get("lines", "")
+    if not text.strip():
+        flash("取り込む数量がありませんでした。", "error")
+        return redirect(url_for("stocktake_detail", stocktake_id=stocktake_id))
+
+    # 解析・商品の照合・保存はジョブ（jobs.py の stocktake_import）で行い、リクエストは待たせない
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    fd, input_path = tempfile.mkstemp(suffix=".csv", dir=JOB_UPLOAD_DIR)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    job_id = queue_job(
+        "stocktake_import",
+        {"stocktake_id": stocktake_id, "mode": mode, "input_path": input_path},
+    )
+    flash(f"数量の取り込みをジョブ #{job_id} として受け付けました。終わると下の表に反映されます。", "success")
+    return redirect(url_for("stocktake_detail", stocktake_id=stocktake_id))
+
+
+def stocktake_import_jobs(stocktake_id, limit=5):
+    """この棚卸の数量の取り込みジョブ（新しい順）。完了したものは結果（件数・エラー）も付ける"""
+    conn = get_main_db_connection()
+    rows = conn.execute(
+        """
+        SELECT * FROM JOBS
+        WHERE tenant = ? AND kind = 'stocktake_import'
+          AND json_extract(params, '$.stocktake_id') = ?
+        ORDER BY job_id DESC
+        LIMIT ?
+        """,
+        (current_tenant(), stocktake_id, limit),
+    ).fetchall()
+    conn.close()
+
+    jobs = []
+    for row in rows:
+        job = dict(row)
+        job["report"] = None
+        if job["status"] == "succeeded" and job["result_path"] and os.path.exists(job["result_path"]):
+            with open(job["result_path"], encoding="utf-8") as f:
+                job["report"] = json.load(f)
+        jobs.append(job)
+    return jobs
+
+
+# ==== 棚卸の確定（差異を ADJUST としてまとめて登録） ====
+@app.route("/stocktakes/<int:stocktake_id>/commit", methods=["POST"])
+@login_required
+@admin_required
+def commit_stocktake(stocktake_id):
+    conn = get_db_connection()
+
+    # 差異の計算から ADJUST の登録までを 1 つのトランザクションで行う
+    # （途中で在庫移動が割り込んで差異がずれないように、先に書き込みロックを取る）
+    conn.execute("BEGIN IMMEDIATE")
+
+    stocktake = get_stocktake(conn, stocktake_id)
+    if stocktake is None or stocktake["status"] != "open":
+        conn.rollback()
+        conn.close()
+        flash("この棚卸は確定できません。", "error")
+        return redirect(url_for("stocktake_list"))
+
+    location_id = stocktake["location_id"]
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    memo = f"棚卸 #{stocktake_id}"
+
+    adjusted = 0
+    results = []
+    for row in variance_rows(conn, stocktake_id, location_id):
+        movement_id = None
+        if row["variance"]:
+            movement_id = record_movement(
+                conn,
+                row["item_id"],
+                "ADJUST",
+                row["variance"],
+                location_id,
+                memo=memo,
+                now=now,
+            )
+            adjusted += 1
+        results.append((row["book_quantity"], movement_id, stocktake_id, row["item_id"]))
+
+    conn.executemany(
+        """
+        UPDATE STOCKTAKE_COUNTS
+        SET book_quantity = ?, movement_id = ?
+        WHERE stocktake_id = ? AND item_id = ?
+        """,
+        results,
+    )
+    conn.execute(
+        "UPDATE STOCKTAKES SET status = 'committed', committed_at = ? WHERE stocktake_id = ?",
+        (now, stocktake_id),
+    )
+    conn.commit()
+    conn.close()
+
+    flash(f"棚卸を確定しました（{adjusted}件の商品の在庫を調整しました）。", "success")
+    return redirect(url_for("stocktake_detail", stocktake_id=stocktake_id))
+
+
+# ==== 棚卸の中止 ====
+@app.route("/stocktakes/<int:stocktake_id>/cancel", methods=["POST"])
+@login_required
+@admin_required
+def cancel_stocktake(stocktake_id):
+    conn = get_db_connection()
+    updated = conn.execute(
+        "UPDATE STOCKTAKES SET status = 'cancelled' WHERE stocktake_id = ? AND status = 'open'",
+        (stocktake_id,),
+    ).rowcount
+    conn.commit()
+    conn.close()
+
+    if updated:
+        flash("棚卸を中止しました。", "success")
+    else:
+        flash("この棚卸は中止できません。", "error")
+    return redirect(url_for("stocktake_list"))
+
+
+# ==== カテゴリ編集 ====
+@app.route("/categories/<int:category_id>/edit", methods=["GET", "POST"])
+@login_required
+def edit_category(category_id):
+    conn = get_db_connection()
+
+    category = conn.execute(
+        "SELECT category_id, name, description, created_at FROM CATEGORIES WHERE category_id = ?",
+        (category_id,),
+    ).fetchone()
+
+    if category is None:
+        conn.close()
+        flash("指定されたカテゴリが見つかりません。", "error")
+        return redirect(url_for("category_list"))
+
+    if request.method == "POST":
+        name = request.form.get("name", "").strip()
+        description = request.form.get("description", "").strip() or None
+
+        errors = []
+        if not name:
+            errors.append("カテゴリ名は必須です。")
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+            conn.close()
+            # 入力内容を維持して再表示
+            return render_template(
+                "edit_category.html",
+                category_id=category_id,
+                form=request.form,
+            )
+
+        conn.execute(
+            """
+            UPDATE CATEGORIES
+            SET name = ?, description = ?
+            WHERE category_id = ?
+            """,
+            (name, description, category_id),
+        )
+        log_row(conn, "category", "CATEGORIES", "category_id", category_id)
+        conn.commit()
+        conn.close()
+
+        flash("カテゴリを更新しました。", "success")
+        return redirect(url_for("category_list"))
+
+    # GET のとき：現在の値をフォームに詰める
+    form_data = {
+        "name": category["name"],
+        "description": category["description"] or "",
+    }
+    conn.close()
+    return render_template(
+        "edit_category.html",
+        category_id=category_id,
+        form=form_data,
+    )
+
+
+# ==== カテゴリ削除 ====
+@app.route("/categories/<int:category_id>/delete", methods=["POST"])
+@login_required
+@admin_required
+def delete_category(category_id):
+    conn = get_db_connection()
+
+    # まずはこのカテゴリを使っている商品があるかチェック
+    count_row = conn.execute(
+        "SELECT COUNT(*) AS cnt FROM ITEMS WHERE category_id = ?",
+        (category_id,),
+    ).fetchone()
+
+    if count_row["cnt"] > 0:
+        conn.close()
+        flash("このカテゴリを使用している商品があるため、削除できません。", "error")
+        return redirect(url_for("category_list"))
+
+    # 商品に使われていなければ削除
+    conn.execute(
+        "DELETE FROM CATEGORIES WHERE category_id = ?",
+        (category_id,),
+    )
+    log_row(conn, "category", "CATEGORIES", "category_id", category_id)
+    conn.commit()
+    conn.close()
+
+    flash("カテゴリを削除しました。", "success")
+    return redirect(url_for("category_list"))
+
+# ==== 変更フィード（POS・EC サイト連携用） ====
+@app.route("/api/changes")
+@api_login_required
+def api_changes():
+    since = request.args.get("since", default=0, type=int)
+    limit = request.args.get("limit", type=int)
+    if not limit or limit <= 0:
+        limit = CHANGE_FEED_PAGE_SIZE
+    limit = min(limit, CHANGE_FEED_PAGE_SIZE)
+
+    conn = get_db_connection()
+    feed = fetch_changes(conn, since, limit)
+    conn.close()
+    return jsonify(feed)
+
+
+# ==== 在庫のリアルタイム更新（Server-Sent Events） ====
+@app.route("/api/stream/balances")
+@api_login_required
+def stream_balances():
+    """在庫残高の変更を SSE で流す
+
+    DB の CHANGE_LOG を seq で追いかけるだけなので、どの gunicorn ワーカーで
+    登録された在庫移動も届く。1 接続あたりのコストは「1 秒に 1 回の主キー範囲検索」で、
+    接続は SSE_MAX_SECONDS で切ってブラウザの自動再接続（Last-Event-ID）に任せる。
+    最初の接続では、ページを描画した時点の CHANGE_LOG の seq を since で受け取る
+    （描画から接続までの間の変更も届くように）。since がなければ今の最新から。
+    """
+    if not sse_slots.acquire(blocking=False):
+        return Response(
+            "retry: 5000\n\n",
+            status=503,
+            mimetype="text/event-stream",
+        )
+
+    # 枠は generate() の finally で返す。そこまでに例外（DB のロック待ちなど）が出たらここで返す
+    try:
+        tenant = current_tenant()
+        last_seq = request.headers.get("Last-Event-ID", type=int)
+        if last_seq is None:
+            last_seq = request.args.get("since", type=int)
+        if last_seq is None:
+            conn = get_db_connection(tenant)
+            row = conn.execute("SELECT MAX(seq) AS seq FROM CHANGE_LOG").fetchone()
+            conn.close()
+            last_seq = row["seq"] or 0
+    except BaseException:
+        sse_slots.release()
+        raise
+
+    def generate(last_seq):
+        try:
+            yield "retry: 1000\n\n"
+            started = time.monotonic()
+            last_sent = started
+            while time.monotonic() - started < SSE_MAX_SECONDS:
+                conn = get_db_connection(tenant)
+                rows = conn.execute(
+                    """
+                    SELECT seq, payload
+                    FROM CHANGE_LOG
+                    WHERE seq > ? AND entity = 'balance'
+                    ORDER BY seq
+                    LIMIT ?
+                    """,
+                    (last_seq, SSE_BATCH_SIZE),
+                ).fetchall()
+                conn.close()
+
+                for row in rows:
+                    last_seq = row["seq"]
+                    yield f"id: {row['seq']}\nevent: balance\ndata: {row['payload']}\n\n"
+
+                now = time.monotonic()
+                if rows:
+                    last_sent = now
+                elif now - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    # 途中のプロキシに接続を切られないように
+                    yield ": keep-alive\n\n"
+                    last_sent = now
+
+                if len(rows) < SSE_BATCH_SIZE:
+                    time.sleep(SSE_POLL_SECONDS)
+        finally:
+            sse_slots.release()
+
+    return Response(
+        stream_with_context(generate(last_seq)),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@app.cli.command("compact-changes")
+def compact_changes_command():
+    """変更ログの保持期間を過ぎた行を整理する（cron などで 1 日 1 回程度。全店舗）"""
+    for tenant in migrate_all_tenants():
+        conn = get_db_connection(tenant["slug"])
+        result = compact_change_log(conn)
+        conn.commit()
+        conn.close()
+        print(
+            f"[{tenant['slug']}] 古い変更 {result['superseded']} 件、"
+            f"削除記録 {result['tombstones']} 件を整理しました。"
+        )
+
+
+@app.cli.command("rebuild-kpis")
+def rebuild_kpis_command():
+    """ダッシュボードの KPI カウンターを全データから数え直す（修復用。全店舗）"""
+    for tenant in migrate_all_tenants():
+        conn = get_db_connection(tenant["slug"])
+        totals = rebuild_kpis(conn, LOW_STOCK_THRESHOLD)
+        conn.commit()
+        conn.close()
+        print(
+            f"[{tenant['slug']}] KPI を数え直しました：商品 {totals['sku_count']} 件、"
+            f"在庫 {totals['units_on_hand']} 点、在庫金額 {totals['stock_value']} 円、"
+            f"在庫僅少 {totals['low_stock_count']} 件"
+        )
+
+
+# ==== バックアップ（管理者用） ====
+def tenant_backup_dir(tenant):
+    """店舗ごとのバックアップの保存先（既定の店舗は今までどおり BACKUP_DIR の直下）"""
+    if tenant == DEFAULT_TENANT:
+        return BACKUP_DIR
+    return os.path.join(BACKUP_DIR, tenant)
+
+
+@app.route("/admin/backup", methods=["GET", "POST"])
+@login_required
+@admin_required
+def admin_backup():
+    tenant = current_tenant()
+    backup_dir = tenant_backup_dir(tenant)
+    if request.method == "POST":
+        try:
+            result = run_backup(
+                tenant_db_file(tenant),
+                dest_dir=backup_dir,
+                compress=BACKUP_COMPRESS,
+                keep=BACKUP_KEEP,
+            )
+        except (sqlite3.Error, OSError, RuntimeError) as e:
+            flash(f"バックアップに失敗しました：{e}", "error")
+        else:
+            flash(
+                f"バックアップを作成しました（{os.path.basename(result['path'])}、"
+                f"{result['elapsed_sec']} 秒、検証: {result['integrity']}）。",
+                "success",
+            )
+        return redirect(url_for("admin_backup"))
+
+    backups = [
+        {
+            "name": os.path.basename(path),
+            "size_bytes": os.path.getsize(path),
+        }
+        for path in list_backups(backup_dir)
+    ]
+    return render_template("backup.html", backups=backups)
+
+
+@app.route("/admin/backup/<name>/verify", methods=["POST"])
+@login_required
+@admin_required
+def verify_backup_file(name):
+    # 一覧にあるファイル名だけを受け付ける（パスの指定は不可）
+    backup_dir = tenant_backup_dir(current_tenant())
+    if name not in {os.path.basename(p) for p in list_backups(backup_dir)}:
+        flash("指定されたバックアップが見つかりません。", "error")
+        return redirect(url_for("admin_backup"))
+
+    ok, detail = verify_backup(os.path.join(backup_dir, name))
+    if ok:
+        flash(f"{name} は正常です（integrity_check: {detail}）。", "success")
+    else:
+        flash(f"{name} に問題があります：{detail}", "error")
+    return redirect(url_for("admin_backup"))
+
+
+@app.cli.command("backup")
+def backup_command():
+    """DB のオンラインバックアップを作成する（全店舗）"""
+    for tenant in migrate_all_tenants():
+        result = run_backup(
+            tenant_db_file(tenant["slug"]),
+            dest_dir=tenant_backup_dir(tenant["slug"]),
+            compress=BACKUP_COMPRESS,
+            keep=BACKUP_KEEP,
+        )
+        print(
+            f"[{tenant['slug']}] バックアップを作成しました: {result['path']}"
+            f"（{result['elapsed_sec']} 秒）"
+        )
+
+
+# ==== 店舗（テナント）の管理・全店舗の横断集計 ====
+def validate_new_tenant(conn, slug, name, admin_username, admin_password):
+    errors = []
+    if not is_valid_slug(slug):
+        errors.append("店舗 ID は英小文字・数字・「-」「_」で 32 文字以内にしてください。")
+    elif conn.execute("SELECT 1 FROM TENANTS WHERE slug = ?", (slug,)).fetchone():
+        errors.append("その店舗 ID はすでに使われています。")
+    if not name:
+        errors.append("店舗名は必須です。")
+    if not admin_username or not admin_password:
+        errors.append("店舗の管理者のユーザー名とパスワードを入力してください。")
+    elif conn.execute("SELECT 1 FROM USERS WHERE username = ?", (admin_username,)).fetchone():
+        errors.append("そのユーザー名はすでに使われています。")
+    return errors
+
+
+def provision_tenant(conn, slug, name, admin_username, admin_password, api_token=None):
+    """店舗と店舗の管理者を登録し、店舗の DB を作る（conn は既定の DB）"""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    create_tenant(conn, slug, name, now, api_token=api_token)
+    conn.execute(
+        """
+        INSERT INTO USERS (username, password_hash, created_at, role, tenant)
+        VALUES (?, ?, ?, 'admin', ?)
+        """,
+        (admin_username, generate_password_hash(admin_password), now, slug),
+    )
+    conn.commit()
+    migrate_tenant(slug)
+
+
+def load_tenant_report():
+    conn = get_main_db_connection()
+    tenants = list_tenants(conn)
+    conn.close()
+    since = (datetime.now() - timedelta(days=TENANT_REPORT_DAYS - 1)).strftime("%Y-%m-%d")
+    return cross_tenant_report(tenants, tenant_db_file, since)
+
+
+@app.route("/admin/tenants", methods=["GET", "POST"])
+@login_required
+@admin_required
+def admin_tenants():
+    """店舗の一覧・追加と、全店舗の在庫・入出庫の横断集計（既定の店舗の管理者のみ）"""
+    if current_tenant() != DEFAULT_TENANT:
+        flash("店舗の管理は本部（既定の店舗）の管理者のみ利用できます。", "error")
+        return redirect(url_for("index"))
+
+    form_data = {}
+    if request.method == "POST":
+        form_data = {
+            "slug": request.form.get("slug", "").strip(),
+            "name": request.form.get("name", "").strip(),
+            "admin_username": request.form.get("admin_username", "").strip(),
+        }
+        admin_password = request.form.get("admin_password", "")
+
+        conn = get_main_db_connection()
+        errors = validate_new_tenant(
+            conn, form_data["slug"], form_data["name"],
+            form_data["admin_username"], admin_password,
+        )
+        if not errors:
+            provision_tenant(
+                conn, form_data["slug"], form_data["name"],
+                form_data["admin_username"], admin_password,
+            )
+        conn.close()
+
+        if errors:
+            for e in errors:
+                flash(e, "error")
+        else:
+            flash(f"店舗「{form_data['name']}」を追加しました。", "success")
+            return redirect(url_for("admin_tenants"))
+
+    rows, totals = load_tenant_report()
+    return render_template(
+        "tenant_list.html",
+        rows=rows,
+        totals=totals,
+        report_days=TENANT_REPORT_DAYS,
+        form_data=form_data,
+    )
+
+
+@app.cli.command("create-tenant")
+@click.argument("slug")
+@click.argument("name")
+@click.option("--admin-user", required=True, help="店舗の管理者のユーザー名")
+@click.option("--admin-password", required=True, help="店舗の管理者のパスワード")
+@click.option("--api-token", default=None, help="この店舗として API を使うトークン")
+def create_tenant_command(slug, name, admin_user, admin_password, api_token):
+    """店舗を追加して、店舗の DB と管理者ユーザーを作る"""
+    conn = get_main_db_connection()
+    errors = validate_new_tenant(conn, slug, name, admin_user, admin_password)
+    if errors:
+        conn.close()
+        raise click.ClickException(" ".join(errors))
+    provision_tenant(conn, slug, name, admin_user, admin_password, api_token=api_token)
+    conn.close()
+    print(f"店舗「{name}」（{slug}）を追加しました: {tenant_db_file(slug)}")
+
+
+@app.cli.command("migrate-tenants")
+def migrate_tenants_command():
+    """全店舗の DB にスキーマの更新を流す（デプロイ時に 1 回）"""
+    for tenant in migrate_all_tenants():
+        print(f"[{tenant['slug']}] {tenant_db_file(tenant['slug'])}")
+
+
+@app.cli.command("tenant-report")
+def tenant_report_command():
+    """全店舗の在庫・入出庫の横断集計を表示する"""
+    rows, totals = load_tenant_report()
+    for r in rows + [dict(totals, slug="合計", name="", error=None)]:
+        if r["error"]:
+            print(f"{r['slug']}\t{r['name']}\tエラー: {r['error']}")
+            continue
+        print(
+            f"{r['slug']}\t{r['name']}\t商品 {r['sku_count']}\t在庫 {r['units_on_hand']}\t"
+            f"在庫金額 {r['stock_value']}\t入庫 {r['in_quantity']}\t出庫 {r['out_quantity']}"
+        )
+
+
+# ==== 需要予測（出庫ペース・在庫日数・推奨発注数） ====
+def forecast_params(args=None):
+    """クエリパラメータ（args）から予測条件を取得（範囲外は既定値に戻す）"""
+    args = request.args if args is None else args
+
+    def days(name, default, max_value=365):
+        value = args.get(name, type=int)
+        if value is None or value <= 0 or value > max_value:
+            return default
+        return value
+
+    return {
+        "window_days": days("window_days", 28),
+        "lead_time_days": days("lead_time_days", 14),
+        "review_days": days("review_days", 7),
+        "safety_days": days("safety_days", 7),
+    }
+
+
+@app.route("/reports/forecast")
+@login_required
+def forecast_report():
+    params = forecast_params()
+
+    conn = get_db_connection()
+    rows = build_forecast(conn, **params)
+    conn.close()
+
+    return render_template("forecast.html", rows=rows, params=params)
+
+
+@app.route("/reports/forecast.csv")
+@login_required
+def forecast_csv():
+    params = forecast_params()
+
+    conn = get_db_connection()
+    rows = build_forecast(conn, **params)
+    conn.close()
+
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=FORECAST_CSV_COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+
+    # Excel で文字化けしないよう BOM 付き UTF-8
+    return Response(
+        "\ufeff" + buf.getvalue(),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=forecast.csv"},
+    )
+
+
+# ==== 分析レポート用：期間の取得 ====
+def report_date_range(default_days=365, args=None):
+    """?start=YYYY-MM-DD&end=YYYY-MM-DD を取得する（end はその日を含む）
+
+    戻り値は (画面表示用の start, end, SQL 用の [from, to) の文字列)。
+    """
+    today = datetime.now().date()
+    args = request.args if args is None else args
+
+    def parse(name, default):
+        value = args.get(name, "")
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").date()
+        except ValueError:
+            return default
+
+    end = parse("end", today)
+    start = parse("start", end - timedelta(days=default_days - 1))
+    if start > end:
+        start, end = end, start
+
+    sql_from = start.strftime("%Y-%m-%d 00:00:00")
+    sql_to = (end + timedelta(days=1)).strftime("%Y-%m-%d 00:00:00")
+    return start, end, sql_from, sql_to
+
+
+# ==== ABC 分析・消化率 ====
+@app.route("/reports/abc")
+@login_required
+def abc_report():
+    start, end, sql_from, sql_to = report_date_range()
+    dimension = request.args.get("dimension", "item")
+    if dimension not in ABC_DIMENSIONS:
+        dimension = "item"
+
+    conn = get_db_connection()
+    key = ("abc", current_tenant(), sql_from, sql_to, dimension, data_version(conn))
+    rows = report_cache.get_or_render(
+        key, lambda: abc_sell_through(conn, sql_from, sql_to, dimension)
+    )
+    conn.close()
+
+    class_summary = {
+        abc_class: {
+            "count": sum(1 for r in rows if r["abc_class"] == abc_class),
+            "out_value": sum(r["out_value"] for r in rows if r["abc_class"] == abc_class),
+        }
+        for abc_class in ("A", "B", "C")
+    }
+
+    return render_template(
+        "abc_report.html",
+        rows=rows,
+        class_summary=class_summary,
+        start=start,
+        end=end,
+        dimension=dimension,
+        dimensions=ABC_DIMENSIONS,
+    )
+
+
+# ==== 売上（出庫時点の価格で値付け） ====
+@app.route("/reports/revenue")
+@login_required
+def revenue_report_view():
+    start, end, sql_from, sql_to = report_date_range(30)
+    group = request.args.get("group", "item")
+    if group not in REVENUE_GROUPS:
+        group = "item"
+
+    conn = get_db_connection()
+    # 価格の変更は ITEMS.updated_at も進めるので data_version で足りる
+    key = ("revenue", current_tenant(), sql_from, sql_to, group, data_version(conn))
+    rows = report_cache.get_or_render(
+        key, lambda: revenue_report(conn, sql_from, sql_to, group)
+    )
+    conn.close()
+
+    totals = {
+        name: sum(r[name] for r in rows)
+        for name in ("out_qty", "revenue", "current_value")
+    }
+
+    return render_template(
+        "revenue_report.html",
+        rows=rows,
+        totals=totals,
+        start=start,
+        end=end,
+        group=group,
+        groups=REVENUE_GROUPS,
+    )
+
+
+# ==== バックグラウンドジョブ（CSV 出力・集計・チェック） ====
+job_runner = JobRunner(
+    DB_NAME,
+    tenant_db_file,
+    JOB_RESULT_DIR,
+    max_concurrency=JOB_MAX_CONCURRENCY,
+    time_limit=JOB_TIME_LIMIT_SECONDS,
+    memory_limit_mb=JOB_MEMORY_LIMIT_MB,
+)
+
+
+@app.before_request
+def start_job_runner():
+    # CLI（flask backup など）では動かさず、リクエストを受けるワーカーでだけ起こす
+    job_runner.start()
+
+
+def job_params(kind, args):
+    """ジョブの種類ごとに、画面・API の入力から実行条件を作る（範囲外は既定値）"""
+    if kind == "forecast_csv":
+        return forecast_params(args)
+    if kind == "abc_csv":
+        start, end, sql_from, sql_to = report_date_range(args=args)
+        dimension = args.get("dimension", "item")
+        if dimension not in ABC_DIMENSIONS:
+            dimension = "item"
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "sql_from": sql_from,
+            "sql_to": sql_to,
+            "dimension": dimension,
+        }
+    return {}
+
+
+def enqueue_job(kind, args):
+    """画面・API から受けたジョブを登録して (job_id, エラーメッセージ) を返す"""
+    if kind not in JOB_KINDS or JOB_KINDS[kind]["upload"]:
+        return None, "ジョブの種類が不正です。"
+    if JOB_KINDS[kind]["admin_only"] and session.get("user_id") and session.get("role") != "admin":
+        return None, "このジョブは管理者のみ実行できます。"
+    return queue_job(kind, job_params(kind, args)), None
+
+
+def queue_job(kind, params):
+    """このリクエストの店舗のジョブを待ち行列に入れ、ディスパッチャーを起こして job_id を返す"""
+    conn = get_main_db_connection()
+    job_id = submit_job(
+        conn,
+        current_tenant(),
+        kind,
+        params,
+        session.get("username") or "api",
+        datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    conn.commit()
+    conn.close()
+
+    job_runner.start()
+    job_runner.wake()
+    return job_id
+
+
+def get_tenant_job(job_id):
+    """このリクエストの店舗のジョブ（ほかの店舗のものは見せない）"""
+    conn = get_main_db_connection()
+    job = conn.execute(
+        "SELECT * FROM JOBS WHERE job_id = ? AND tenant = ?",
+        (job_id, current_tenant()),
+    ).fetchone()
+    conn.close()
+    return job
+
+
+def job_to_dict(job):
+    return {
+        "job_id": job["job_id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "params": json.loads(job["params"]),
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "result_rows": job["result_rows"],
+        "error": job["error"],
+        "download_url": (
+            url_for("download_job_result", job_id=job["job_id"])
+            if job["status"] == "succeeded" else None
+        ),
+    }
+
+
+@app.route("/jobs", methods=["GET", "POST"])
+@login_required
+def job_list():
+    if request.method == "POST":
+        job_id, error = enqueue_job(request.form.get("kind", ""), request.form)
+        if error:
+            flash(error, "error")
+        else:
+            flash(
+                f"ジョブ #{job_id} を受け付けました。終わるとこの画面からダウンロードできます。",
+                "success",
+            )
+        return redirect(url_for("job_list"))
+
+    conn = get_main_db_connection()
+    jobs = conn.execute(
+        """
+        SELECT * FROM JOBS
+        WHERE tenant = ?
+        ORDER BY job_id DESC
+        LIMIT 50
+        """,
+        (current_tenant(),),
+    ).fetchall()
+    conn.close()
+
+    return render_template(
+        "job_list.html",
+        jobs=jobs,
+        job_kinds=JOB_KINDS,
+        status_labels=JOB_STATUS_LABELS,
+        has_active=any(j["status"] in ("queued", "running") for j in jobs),
+        max_concurrency=JOB_MAX_CONCURRENCY,
+        keep_days=JOB_KEEP_DAYS,
+    )
+
+
+@app.route("/jobs/<int:job_id>/download")
+@login_required
+def download_job_result(job_id):
+    job = get_tenant_job(job_id)
+    if job is None or job["status"] != "succeeded" or not job["result_path"] \
+            or not os.path.exists(job["result_path"]):
+        flash("ダウンロードできる結果がありません。", "error")
+        return redirect(url_for("job_list"))
+
+    kind = JOB_KINDS[job["kind"]]
+    return send_file(
+        os.path.abspath(job["result_path"]),
+        mimetype=kind["mimetype"],
+        as_attachment=True,
+        download_name=f"{job['kind']}-{job_id}.{kind['ext']}",
+    )
+
+
+@app.route("/api/jobs", methods=["POST"])
+@api_login_required
+def api_submit_job():
+    """{"kind": ..., "params": {...}} でジョブを登録し、すぐに job_id を返す（202）"""
+    data = request.get_json(silent=True) or {}
+    params = data.get("params") or {}
+    if not isinstance(params, dict):
+        return jsonify({"error": "params must be an object"}), 400
+
+    job_id, error = enqueue_job(data.get("kind", ""), MultiDict(params))
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": url_for("api_job_status", job_id=job_id),
+    }), 202
+
+
+@app.route("/api/jobs/<int:job_id>")
+@api_login_required
+def api_job_status(job_id):
+    job = get_tenant_job(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job_to_dict(job))
+
+
+@app.cli.command("purge-jobs")
+def purge_jobs_command():
+    """保存期間（JOB_KEEP_DAYS）を過ぎたジョブと結果ファイルを消す"""
+    conn = get_main_db_connection()
+    count = purge_old_jobs(conn, JOB_KEEP_DAYS, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    conn.close()
+    print(f"古いジョブ {count} 件を削除しました。")
+
+
+# ==== テンプレートの事前コンパイル ====
+def warm_templates():
+    """全テンプレートを読み込んで Jinja のメモリ上のキャッシュに載せる（件数を返す）
+
+    バイトコードキャッシュにあればそれを読み、なければコンパイルしてキャッシュに書く。
+    """
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+@app.cli.command("precompile-templates")
+def precompile_templates_command():
+    """全テンプレートをコンパイルし直してバイトコードキャッシュに書く（デプロイのビルド時などに）"""
+    app.jinja_env.bytecode_cache.clear()
+    app.jinja_env.cache.clear()
+    started = time.perf_counter()
+    count = warm_templates()
+    print(
+        f"テンプレート {count} 件をコンパイルしました"
+        f"（{(time.perf_counter() - started) * 1000:.0f} ms）: {TEMPLATE_CACHE_DIR}"
+    )
+
+
+# ==== 起動時の準備と所要時間 ====
+def run_startup():
+    """テーブル作成・admin 作成・全店舗のスキーマ更新と、テンプレートの読み込みを行う
+
+    再起動直後の最初のリクエストでテンプレートをコンパイルしないよう、ここで全部読んでおく
+    （gunicorn の --preload ではマスターで 1 回だけ行い、各ワーカーはそれを引き継ぐ）。
+    段階ごとの所要時間を startup_profile に記録する。
+    """
+    def migrate():
+        ensure_users_table()
+        migrate_all_tenants()
+
+    startup_profile["imports_ms"] = round((IMPORTS_FINISHED - STARTUP_STARTED) * 1000, 1)
+    last = time.perf_counter()
+    for name, step in (("db_setup_ms", migrate), ("templates_ms", warm_templates)):
+        step()
+        now = time.perf_counter()
+        startup_profile[name] = round((now - last) * 1000, 1)
+        last = now
+    startup_profile["total_ms"] = round((last - STARTUP_STARTED) * 1000, 1)
+    startup_profile["templates"] = len(app.jinja_env.cache)
+    startup_profile["pid"] = os.getpid()
+
+
+@app.route("/admin/startup_profile")
+@login_required
+@admin_required
+def startup_profile_view():
+    return jsonify(startup_profile)
+
+
+@app.cli.command("startup-profile")
+def startup_profile_command():
+    """このプロセスの起動にかかった時間（import・DB の準備・テンプレートの読み込み）を表示する"""
+    for name, value in startup_profile.items():
+        print(f"{name}\t{value}")
+
+
+# ==== アプリ起動時に一度だけ実行 ====
+run_startup()
+
+if __name__ == "__main__":
+    app.run(debug=True)
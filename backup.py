@@ -0,0 +1,185 @@
+"""DB のオンラインバックアップ（SQLite のバックアップ API を使用）
+
+使い方:
+    python backup.py --db cloth_stock.db --dest backups --compress --keep 14
+    python backup.py --verify backups/cloth_stock-20250101-120000.db.gz
+
+アプリを動かしたままファイルをコピーすると壊れたコピーになることがあるので、
+sqlite3.Connection.backup で少しずつ（pages ページずつ）コピーし、
+1 ステップごとに sleep して在庫移動の登録などの書き込みを待たせないようにする。
+DB は WAL モードにしておく（アプリも接続時に WAL にしている）。コピーの前に
+PASSIVE のチェックポイントで WAL の内容を DB ファイルに書き戻し、コピー元の接続で
+読み取りトランザクションを開いたままにして、開始時点のスナップショットを全ステップで読む。
+WAL では読み取りが書き込みを止めないので、コピー中も書き込みは待たされず、
+途中の書き込みでバックアップ API が最初からやり直すこともない。
+それでもやり直しが max_restarts 回を超えたら失敗として中止する。
+バックアップのファイルは WAL を使わない 1 ファイルの DB にして残す。
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BACKUP_PREFIX = "cloth_stock-"
+
+
+def verify_backup(path):
+    """バックアップを開いて PRAGMA integrity_check を実行する（.gz は展開して確認）"""
+    if path.endswith(".gz"):
+        with tempfile.NamedTemporaryFile(suffix=".db", delete=False) as tmp:
+            tmp_path = tmp.name
+            with gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, tmp)
+        try:
+            return verify_backup(tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+    return result == "ok", result
+
+
+def list_backups(dest_dir):
+    """バックアップファイルを新しい順に返す"""
+    if not os.path.isdir(dest_dir):
+        return []
+    names = [
+        name for name in os.listdir(dest_dir)
+        if name.startswith(BACKUP_PREFIX) and (name.endswith(".db") or name.endswith(".db.gz"))
+    ]
+    return [os.path.join(dest_dir, name) for name in sorted(names, reverse=True)]
+
+
+def rotate_backups(dest_dir, keep):
+    """新しいものから keep 件を残して古いバックアップを削除する"""
+    removed = []
+    for path in list_backups(dest_dir)[keep:]:
+        os.remove(path)
+        removed.append(path)
+    return removed
+
+
+def run_backup(db_path, dest_dir="backups", pages=256, step_sleep=0.05, compress=False, keep=7,
+               max_restarts=10):
+    """バックアップを 1 回作成し、検証・圧縮・ローテーションまで行う
+
+    戻り値は結果の dict。やり直しが多すぎたときと、検証に失敗したときは
+    作りかけのバックアップを残さずに例外（RuntimeError）を出す。
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    final_path = os.path.join(dest_dir, f"{BACKUP_PREFIX}{stamp}.db")
+    partial_path = final_path + ".partial"
+
+    steps = 0
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        # 残りページ数が増えた＝書き込みがあって最初からやり直しになった
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise RuntimeError(
+                    f"書き込みが多く、バックアップが {max_restarts} 回やり直しになったため中止しました"
+                )
+        last_remaining = remaining
+        # 1 ステップごとにロックを手放して書き込みを通す
+        if remaining:
+            time.sleep(step_sleep)
+
+    src = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        src.execute("PRAGMA journal_mode=WAL")
+        # WAL にたまっている分を DB ファイルに書き戻す（読み書き中のページは飛ばすので待たない）
+        src.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        # 読み取りトランザクションを開いて、コピーの間ずっと同じスナップショットを読む
+        src.execute("BEGIN")
+        src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+        dst = sqlite3.connect(partial_path)
+        try:
+            src.backup(dst, pages=pages, progress=progress)
+            dst.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            dst.close()
+            src.execute("COMMIT")
+    except RuntimeError:
+        os.remove(partial_path)
+        raise
+    finally:
+        src.close()
+
+    ok, detail = verify_backup(partial_path)
+    if not ok:
+        os.remove(partial_path)
+        raise RuntimeError(f"バックアップの検証に失敗しました: {detail}")
+
+    os.replace(partial_path, final_path)
+
+    if compress:
+        with open(final_path, "rb") as f_in, gzip.open(final_path + ".gz", "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(final_path)
+        final_path += ".gz"
+
+    removed = rotate_backups(dest_dir, keep)
+
+    return {
+        "path": final_path,
+        "size_bytes": os.path.getsize(final_path),
+        "steps": steps,
+        "restarts": restarts,
+        "integrity": detail,
+        "elapsed_sec": round(time.perf_counter() - started, 3),
+        "removed": removed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在庫 DB のオンラインバックアップ")
+    parser.add_argument("--db", default="cloth_stock.db", help="バックアップ元の SQLite DB")
+    parser.add_argument("--dest", default="backups", help="バックアップの保存先ディレクトリ")
+    parser.add_argument("--pages", type=int, default=256, help="1 ステップでコピーするページ数")
+    parser.add_argument("--sleep", type=float, default=0.05, help="ステップ間の待ち時間（秒）")
+    parser.add_argument("--max-restarts", type=int, default=10,
+                        help="書き込みでやり直しになってよい回数（超えたら中止する）")
+    parser.add_argument("--compress", action="store_true", help="gzip で圧縮する")
+    parser.add_argument("--keep", type=int, default=7, help="残すバックアップの数")
+    parser.add_argument("--verify", metavar="FILE", help="既存のバックアップを検証するだけ")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        ok, detail = verify_backup(args.verify)
+        print(f"{args.verify}: {detail}")
+        return 0 if ok else 1
+
+    result = run_backup(
+        args.db,
+        dest_dir=args.dest,
+        pages=args.pages,
+        step_sleep=args.sleep,
+        max_restarts=args.max_restarts,
+        compress=args.compress,
+        keep=args.keep,
+    )
+    print(f"バックアップを作成しました: {result['path']}（{result['size_bytes']} bytes, {result['elapsed_sec']} 秒）")
+    for path in result["removed"]:
+        print(f"古いバックアップを削除しました: {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""商品の一括編集（価格・有効/無効・カテゴリ・素材）
+
+対象の絞り込み（カテゴリ・キーワード・ID 指定）に一致する商品を、
+1 本の UPDATE でまとめて更新する。変更ログ（CHANGE_LOG）も INSERT ... SELECT で
+まとめて書くので、対象が何千件あっても SQL の実行回数は変わらない。
+"""
+import json
+import re
+
+from kpi import track_items
+from price_history import record_prices
+
+# 価格の変更方法 → 新しい base_price を計算する SQL 式（? の数だけ値を渡す）
+PRICE_MODES = {
+    "set": ("?", 1),
+    "percent": ("CAST(ROUND(base_price * (100 + ?) / 100.0) AS INTEGER)", 1),
+    "round": ("CAST(ROUND(base_price * 1.0 / ?) * ? AS INTEGER)", 2),
+}
+
+PREVIEW_SAMPLE_SIZE = 20
+
+
+def parse_bulk_request(data):
+    """フォーム（request.form）または JSON の dict から絞り込み条件と変更内容を取り出す
+
+    戻り値は (filters, changes, errors)。
+    """
+    errors = []
+
+    def text(name):
+        value = data.get(name)
+        if value is None:
+            return ""
+        return str(value).strip()
+
+    filters = {}
+
+    category_id = text("filter_category_id")
+    if category_id:
+        try:
+            filters["category_id"] = int(category_id)
+        except ValueError:
+            errors.append("絞り込みのカテゴリIDが不正です。")
+
+    keyword = text("filter_q")
+    if keyword:
+        filters["q"] = keyword
+
+    raw_ids = data.get("filter_item_ids")
+    if isinstance(raw_ids, list):
+        raw_ids = " ".join(str(v) for v in raw_ids)
+    raw_ids = (raw_ids or "").strip()
+    if raw_ids:
+        try:
+            filters["item_ids"] = sorted({int(v) for v in re.split(r"[\s,、]+", raw_ids) if v})
+        except ValueError:
+            errors.append("商品IDはカンマまたは空白区切りの数字で入力してください。")
+
+    if not filters and not errors:
+        errors.append("対象を絞り込む条件（カテゴリ・キーワード・商品ID）を 1 つ以上指定してください。")
+
+    changes = {}
+
+    price_mode = text("price_mode")
+    if price_mode:
+        if price_mode not in PRICE_MODES:
+            errors.append("価格の変更方法が不正です。")
+        else:
+            try:
+                price_value = float(text("price_value"))
+            except ValueError:
+                errors.append("価格の変更値は数字で入力してください。")
+            else:
+                if price_mode == "set" and (price_value < 0 or not price_value.is_integer()):
+                    errors.append("価格は 0 以上の整数で入力してください。")
+                elif price_mode == "percent" and not (-99 <= price_value <= 1000):
+                    errors.append("価格の増減率は -99〜1000（%）で入力してください。")
+                elif price_mode == "round" and (price_value <= 0 or not price_value.is_integer()):
+                    errors.append("端数処理の単位は 1 以上の整数で入力してください。")
+                else:
+                    changes["price"] = (price_mode, price_value)
+
+    is_active = text("set_is_active")
+    if is_active in ("0", "1"):
+        changes["is_active"] = int(is_active)
+
+    new_category = text("set_category_id")
+    if new_category == "none":
+        changes["category_id"] = None
+    elif new_category:
+        try:
+            changes["category_id"] = int(new_category)
+        except ValueError:
+            errors.append("変更先のカテゴリIDが不正です。")
+
+    if data.get("set_material_enabled") in ("1", True, 1):
+        changes["material"] = text("set_material") or None
+
+    if not changes and not errors:
+        errors.append("変更する項目を 1 つ以上指定してください。")
+
+    return filters, changes, errors
+
+
+def build_where(filters):
+    conditions = []
+    params = []
+    if "category_id" in filters:
+        conditions.append("category_id = ?")
+        params.append(filters["category_id"])
+    if "q" in filters:
+        conditions.append("(name LIKE ? OR sku LIKE ?)")
+        like = f"%{filters['q']}%"
+        params.extend([like, like])
+    if "item_ids" in filters:
+        conditions.append("item_id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(filters["item_ids"]))
+    return " AND ".join(conditions), params
+
+
+def build_set_clause(changes, now):
+    assignments = []
+    params = []
+    if "price" in changes:
+        mode, value = changes["price"]
+        expr, n_params = PRICE_MODES[mode]
+        assignments.append(f"base_price = {expr}")
+        value = int(value) if mode in ("set", "round") else value
+        params.extend([value] * n_params)
+    for column in ("is_active", "category_id", "material"):
+        if column in changes:
+            assignments.append(f"{column} = ?")
+            params.append(changes[column])
+    assignments.append("updated_at = ?")
+    params.append(now)
+    return ", ".join(assignments), params
+
+
+def preview_bulk_edit(conn, filters, changes):
+    """対象件数と、先頭 PREVIEW_SAMPLE_SIZE 件の変更前後の価格を返す"""
+    where, params = build_where(filters)
+
+    count = conn.execute(
+        f"SELECT COUNT(*) AS cnt FROM ITEMS WHERE {where}",
+        params,
+    ).fetchone()["cnt"]
+
+    new_price = "base_price"
+    price_params = []
+    if "price" in changes:
+        mode, value = changes["price"]
+        expr, n_params = PRICE_MODES[mode]
+        new_price = expr
+        value = int(value) if mode in ("set", "round") else value
+        price_params = [value] * n_params
+
+    samples = conn.execute(
+        f"""
+        SELECT item_id, name, sku, category_id, material, is_active,
+               base_price, {new_price} AS new_price
+        FROM ITEMS
+        WHERE {where}
+        ORDER BY item_id DESC
+        LIMIT ?
+        """,
+        price_params + params + [PREVIEW_SAMPLE_SIZE],
+    ).fetchall()
+
+    return {"count": count, "samples": samples}
+
+
+def apply_bulk_edit(conn, filters, changes, now, low_stock_threshold):
+    """一括更新を実行して更新件数を返す（commit は呼び出し側）
+
+    対象の確定・UPDATE・KPI カウンター・価格の履歴の更新・変更ログの追記を
+    同じトランザクションで行う。
+    カテゴリで絞り込んでカテゴリ自体を変える場合もあるので、
+    先に対象の ID を確定させてから更新する。
+    """
+    where, params = build_where(filters)
+
+    conn.execute("BEGIN IMMEDIATE")
+
+    target_ids = [
+        row["item_id"]
+        for row in conn.execute(f"SELECT item_id FROM ITEMS WHERE {where}", params)
+    ]
+    if not target_ids:
+        return 0
+    targets = json.dumps(target_ids)
+
+    set_clause, set_params = build_set_clause(changes, now)
+    with track_items(conn, target_ids, low_stock_threshold):
+        conn.execute(
+            f"""
+            UPDATE ITEMS
+            SET {set_clause}
+            WHERE item_id IN (SELECT value FROM json_each(?))
+            """,
+            set_params + [targets],
+        )
+    if "price" in changes:
+        record_prices(conn, target_ids, now)
+
+    # 変更ログ：change_log.log_row と同じ形（ITEMS の全列）の payload をまとめて書く
+    columns = [row["name"] for row in conn.execute("PRAGMA table_info(ITEMS)")]
+    payload = ", ".join(f"'{c}', {c}" for c in columns)
+    conn.execute(
+        f"""
+        INSERT INTO CHANGE_LOG (entity, entity_key, op, payload, created_at)
+        SELECT 'item', CAST(item_id AS TEXT), 'upsert', json_object({payload}), ?
+        FROM ITEMS
+        WHERE item_id IN (SELECT value FROM json_each(?))
+        ORDER BY item_id
+        """,
+        (now, targets),
+    )
+
+    return len(target_ids)
@@ -0,0 +1,174 @@
+"""変更ログ（CHANGE_LOG）：POS・EC サイト連携用の差分フィード
+
+app.py の書き込み処理と同じトランザクションで 1 行ずつ追記し、
+連携先は /api/changes?since=<seq> で前回以降の差分だけを取りに来る。
+
+entity / entity_key の組み合わせごとに「最新の状態」を payload に持つので、
+古い行は同じキーの新しい行があれば消してよい（コンパクション）。
+"""
+import json
+from datetime import datetime, timedelta
+
+# 同じキーの新しい行がある古い行を、何日経ったら消すか
+CHANGE_LOG_RETAIN_DAYS = 7
+# 削除（op = "delete"）の行を何日残すか。これより遅れている連携先は全件取り直しが必要
+CHANGE_LOG_TOMBSTONE_DAYS = 30
+
+
+def log_change(conn, entity, entity_key, op, payload=None, now=None):
+    """変更を 1 件追記する（commit は呼び出し側）"""
+    now = now or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    cur = conn.execute(
+        """
+        INSERT INTO CHANGE_LOG (entity, entity_key, op, payload, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            entity,
+            str(entity_key),
+            op,
+            json.dumps(payload, ensure_ascii=False) if payload is not None else None,
+            now,
+        ),
+    )
+    return cur.lastrowid
+
+
+def log_row(conn, entity, table, id_column, row_id):
+    """テーブルの現在の行をそのまま payload にして記録する（行がなければ削除として記録）"""
+    row = conn.execute(
+        f"SELECT * FROM {table} WHERE {id_column} = ?",
+        (row_id,),
+    ).fetchone()
+    if row is None:
+        return log_change(conn, entity, row_id, "delete", {id_column: row_id})
+    return log_change(conn, entity, row_id, "upsert", dict(row))
+
+
+def log_balance(conn, item_id, location_id, movement_id):
+    """商品 × ロケーションの残高と商品全体の在庫数を記録する"""
+    row = conn.execute(
+        """
+        SELECT
+            (SELECT quantity FROM STOCK_BALANCES
+             WHERE item_id = ? AND location_id = ?) AS quantity,
+            (SELECT COALESCE(SUM(quantity), 0) FROM STOCK_BALANCES
+             WHERE item_id = ?) AS total_quantity
+        """,
+        (item_id, location_id, item_id),
+    ).fetchone()
+    return log_change(
+        conn,
+        "balance",
+        f"{item_id}:{location_id}",
+        "upsert",
+        {
+            "item_id": item_id,
+            "location_id": location_id,
+            "quantity": row["quantity"] or 0,
+            "total_quantity": row["total_quantity"],
+            "movement_id": movement_id,
+        },
+    )
+
+
+def get_state(conn, key, default=None):
+    row = conn.execute("SELECT value FROM APP_STATE WHERE key = ?", (key,)).fetchone()
+    return row["value"] if row is not None else default
+
+
+def set_state(conn, key, value):
+    conn.execute(
+        """
+        INSERT INTO APP_STATE (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+        """,
+        (key, str(value)),
+    )
+
+
+def fetch_changes(conn, since, limit):
+    """seq > since の変更を最大 limit 件返す
+
+    since が削除済み（トゥームストーン期限切れ）の範囲にかかっていると
+    削除を取りこぼしている可能性があるので reset_required を True にする。
+    """
+    rows = conn.execute(
+        """
+        SELECT seq, entity, entity_key, op, payload, created_at
+        FROM CHANGE_LOG
+        WHERE seq > ?
+        ORDER BY seq
+        LIMIT ?
+        """,
+        (since, limit + 1),
+    ).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    purged_through = int(get_state(conn, "change_log_purged_through", 0))
+    last_seq = conn.execute("SELECT MAX(seq) AS seq FROM CHANGE_LOG").fetchone()["seq"]
+
+    return {
+        "changes": [
+            {
+                "seq": row["seq"],
+                "entity": row["entity"],
+                "key": row["entity_key"],
+                "op": row["op"],
+                "data": json.loads(row["payload"]) if row["payload"] else None,
+                "created_at": row["created_at"],
+            }
+            for row in rows
+        ],
+        "next_since": rows[-1]["seq"] if rows else since,
+        "has_more": has_more,
+        "last_seq": last_seq or 0,
+        "reset_required": since < purged_through,
+    }
+
+
+def compact_change_log(conn, retain_days=CHANGE_LOG_RETAIN_DAYS, tombstone_days=CHANGE_LOG_TOMBSTONE_DAYS, now=None):
+    """保持期間を過ぎた行を整理する（commit は呼び出し側）
+
+    1. retain_days より古く、同じキーにもっと新しい行がある行を削除
+       （キーごとの最新状態は残るので、遅れている連携先も最終状態には追いつける）
+    2. tombstone_days より古い削除行を削除し、その seq を記録
+       （それより前から追いかけている連携先には reset_required を返す）
+    戻り値は削除した行数の dict。
+    """
+    now = now or datetime.now()
+    retain_cutoff = (now - timedelta(days=retain_days)).strftime("%Y-%m-%d %H:%M:%S")
+    tombstone_cutoff = (now - timedelta(days=tombstone_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+    superseded = conn.execute(
+        """
+        DELETE FROM CHANGE_LOG
+        WHERE created_at < ?
+          AND seq < (
+              SELECT MAX(c2.seq) FROM CHANGE_LOG c2
+              WHERE c2.entity = CHANGE_LOG.entity
+                AND c2.entity_key = CHANGE_LOG.entity_key
+          )
+        """,
+        (retain_cutoff,),
+    ).rowcount
+
+    row = conn.execute(
+        """
+        SELECT MAX(seq) AS seq FROM CHANGE_LOG
+        WHERE op = 'delete' AND created_at < ?
+        """,
+        (tombstone_cutoff,),
+    ).fetchone()
+    tombstones = 0
+    if row["seq"] is not None:
+        tombstones = conn.execute(
+            "DELETE FROM CHANGE_LOG WHERE op = 'delete' AND seq <= ?",
+            (row["seq"],),
+        ).rowcount
+        purged_through = max(int(get_state(conn, "change_log_purged_through", 0)), row["seq"])
+        set_state(conn, "change_log_purged_through", purged_through)
+
+    return {"superseded": superseded, "tombstones": tombstones}
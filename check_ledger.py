@@ -0,0 +1,289 @@
+"""在庫移動（STOCK_MOVEMENTS）の整合性チェック
+
+使い方:
+    python check_ledger.py --db cloth_stock.db --output ledger_report.json
+
+item_id の範囲ごとにチャンクに分け、プロセスプールで並列に走査する。
+見つけるもの:
+    - orphan_item      : 存在しない商品を指している移動
+    - orphan_supplier  : 存在しない仕入先を指している移動
+    - orphan_location  : 存在しないロケーションを指している（移動先のない TRANSFER を含む）移動
+    - invalid_type     : IN / OUT / ADJUST / TRANSFER 以外の movement_type
+    - invalid_quantity : 0 以下（または整数でない）の数量（ADJUST は 0 以外ならマイナスも可）
+    - negative_balance : 在庫の残高がマイナスになっていた期間
+    - balance_mismatch : STOCK_BALANCES（商品 × ロケーションの残高）と履歴の合計の食い違い
+問題が 1 件でもあれば終了コード 1 を返す。
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from multiprocessing import Pool
+
+VALID_TYPES = ("IN", "OUT", "ADJUST", "TRANSFER")
+ISSUE_KINDS = (
+    "orphan_item",
+    "orphan_supplier",
+    "orphan_location",
+    "invalid_type",
+    "invalid_quantity",
+    "negative_balance",
+    "balance_mismatch",
+)
+
+# ワーカープロセスごとの状態（initializer で設定）
+_db_path = None
+_supplier_ids = None
+_location_ids = None
+_max_samples = None
+
+
+def connect_readonly(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    # 読み取り専用・大量走査なので一時領域はメモリに
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def init_worker(db_path, max_samples):
+    global _db_path, _supplier_ids, _location_ids, _max_samples
+    _db_path = db_path
+    _max_samples = max_samples
+    conn = connect_readonly(db_path)
+    _supplier_ids = {row[0] for row in conn.execute("SELECT supplier_id FROM SUPPLIERS")}
+    _location_ids = {row[0] for row in conn.execute("SELECT location_id FROM LOCATIONS")}
+    conn.close()
+
+
+def movement_delta(movement_type, quantity):
+    """app.py の在庫集計と同じルールで在庫の増減を返す（TRANSFER は全体では 0）"""
+    if movement_type == "IN":
+        return quantity
+    if movement_type == "OUT":
+        return -quantity
+    if movement_type == "ADJUST":
+        return quantity
+    return 0
+
+
+def check_range(bounds):
+    """item_id が [lo, hi) の移動をチェックし、件数と問題点を返す"""
+    lo, hi = bounds
+    conn = connect_readonly(_db_path)
+
+    item_ids = {
+        row[0]
+        for row in conn.execute(
+            "SELECT item_id FROM ITEMS WHERE item_id >= ? AND item_id < ?",
+            (lo, hi),
+        )
+    }
+
+    counts = dict.fromkeys(ISSUE_KINDS, 0)
+    samples = {kind: [] for kind in ISSUE_KINDS}
+
+    def report(kind, detail):
+        counts[kind] += 1
+        if len(samples[kind]) < _max_samples:
+            samples[kind].append(detail)
+
+    # (item_id, location_id) → 履歴から計算した残高
+    expected = {}
+
+    def add_expected(item_id, location_id, delta):
+        key = (item_id, location_id)
+        expected[key] = expected.get(key, 0) + delta
+
+    scanned = 0
+    current_item = None
+    balance = 0
+    negative = None  # マイナス期間の途中ならその情報
+
+    def close_negative(end_row):
+        if end_row is None:
+            negative["ended_movement_id"] = None
+            negative["ended_at"] = None
+        else:
+            negative["ended_movement_id"] = end_row[0]
+            negative["ended_at"] = end_row[5]
+        report("negative_balance", negative)
+
+    cursor = conn.execute(
+        """
+        SELECT movement_id, item_id, movement_type, quantity, supplier_id, created_at,
+               location_id, to_location_id
+        FROM STOCK_MOVEMENTS
+        WHERE item_id >= ? AND item_id < ?
+        ORDER BY item_id, created_at, movement_id
+        """,
+        (lo, hi),
+    )
+    for row in cursor:
+        (movement_id, item_id, movement_type, quantity, supplier_id, created_at,
+         location_id, to_location_id) = row
+        scanned += 1
+
+        if item_id != current_item:
+            if negative is not None:
+                close_negative(None)
+                negative = None
+            current_item = item_id
+            balance = 0
+
+        if item_id not in item_ids:
+            report("orphan_item", {"movement_id": movement_id, "item_id": item_id})
+
+        if supplier_id is not None and supplier_id not in _supplier_ids:
+            report("orphan_supplier", {"movement_id": movement_id, "supplier_id": supplier_id})
+
+        if location_id not in _location_ids or (
+            movement_type == "TRANSFER" and to_location_id not in _location_ids
+        ):
+            report("orphan_location", {
+                "movement_id": movement_id,
+                "location_id": location_id,
+                "to_location_id": to_location_id,
+            })
+
+        if movement_type not in VALID_TYPES:
+            report("invalid_type", {"movement_id": movement_id, "movement_type": movement_type})
+
+        if not isinstance(quantity, int) or quantity == 0 \
+                or (quantity < 0 and movement_type != "ADJUST"):
+            report("invalid_quantity", {"movement_id": movement_id, "quantity": quantity})
+            continue
+
+        balance += movement_delta(movement_type, quantity)
+
+        if movement_type == "TRANSFER":
+            add_expected(item_id, location_id, -quantity)
+            add_expected(item_id, to_location_id, quantity)
+        elif movement_type in VALID_TYPES:
+            add_expected(item_id, location_id, movement_delta(movement_type, quantity))
+
+        if balance < 0:
+            if negative is None:
+                negative = {
+                    "item_id": item_id,
+                    "started_movement_id": movement_id,
+                    "started_at": created_at,
+                    "min_balance": balance,
+                }
+            else:
+                negative["min_balance"] = min(negative["min_balance"], balance)
+        elif negative is not None:
+            close_negative(row)
+            negative = None
+
+    if negative is not None:
+        close_negative(None)
+
+    # 保持している残高と履歴から計算した残高を突き合わせる
+    actual = {
+        (row[0], row[1]): row[2]
+        for row in conn.execute(
+            """
+            SELECT item_id, location_id, quantity
+            FROM STOCK_BALANCES
+            WHERE item_id >= ? AND item_id < ?
+            """,
+            (lo, hi),
+        )
+    }
+    for key in sorted(set(expected) | set(actual), key=lambda k: (k[0], k[1] or 0)):
+        want = expected.get(key, 0)
+        have = actual.get(key, 0)
+        if want != have:
+            report("balance_mismatch", {
+                "item_id": key[0],
+                "location_id": key[1],
+                "ledger_quantity": want,
+                "balance_quantity": have,
+            })
+
+    conn.close()
+    return scanned, counts, samples
+
+
+def build_ranges(db_path, chunk_items):
+    conn = connect_readonly(db_path)
+    lo, hi = conn.execute(
+        """
+        SELECT MIN(lo), MAX(hi) FROM (
+            SELECT MIN(item_id) AS lo, MAX(item_id) AS hi FROM STOCK_MOVEMENTS
+            UNION ALL
+            SELECT MIN(item_id), MAX(item_id) FROM STOCK_BALANCES
+        )
+        """
+    ).fetchone()
+    conn.close()
+    if lo is None:
+        return []
+    return [(start, min(start + chunk_items, hi + 1)) for start in range(lo, hi + 1, chunk_items)]
+
+
+def run_check(db_path, workers=None, chunk_items=2000, max_samples=1000):
+    started = time.perf_counter()
+    ranges = build_ranges(db_path, chunk_items)
+
+    scanned = 0
+    counts = dict.fromkeys(ISSUE_KINDS, 0)
+    samples = {kind: [] for kind in ISSUE_KINDS}
+
+    if ranges:
+        with Pool(
+            processes=workers or os.cpu_count(),
+            initializer=init_worker,
+            initargs=(db_path, max_samples),
+        ) as pool:
+            for n, chunk_counts, chunk_samples in pool.imap_unordered(check_range, ranges):
+                scanned += n
+                for kind in ISSUE_KINDS:
+                    counts[kind] += chunk_counts[kind]
+                    room = max_samples - len(samples[kind])
+                    if room > 0:
+                        samples[kind].extend(chunk_samples[kind][:room])
+
+    return {
+        "db": os.path.abspath(db_path),
+        "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "elapsed_sec": round(time.perf_counter() - started, 3),
+        "chunks": len(ranges),
+        "movements_scanned": scanned,
+        "summary": counts,
+        "issues": samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="在庫移動の整合性チェック")
+    parser.add_argument("--db", default="cloth_stock.db", help="SQLite DB ファイル")
+    parser.add_argument("--output", default="ledger_report.json", help="レポート（JSON）の出力先")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定: CPU 数）")
+    parser.add_argument("--chunk-items", type=int, default=2000, help="1 チャンクあたりの item_id の幅")
+    parser.add_argument("--max-samples", type=int, default=1000, help="種類ごとにレポートへ載せる最大件数")
+    args = parser.parse_args(argv)
+
+    report = run_check(
+        args.db,
+        workers=args.workers,
+        chunk_items=args.chunk_items,
+        max_samples=args.max_samples,
+    )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{report['movements_scanned']} 件の在庫移動をチェックしました（{report['elapsed_sec']} 秒）")
+    for kind in ISSUE_KINDS:
+        print(f"- {kind}: {report['summary'][kind]}")
+    print(f"レポート: {args.output}")
+
+    return 1 if any(report["summary"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
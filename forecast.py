@@ -0,0 +1,178 @@
+"""出庫ペース（需要速度）と在庫日数の予測
+
+STOCK_MOVEMENTS の OUT をまとめて NumPy 配列に読み込み、
+商品ごとの集計は np.bincount で全商品まとめて計算する（商品ごとのループはしない）。
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# 昨年同時期との比率（季節係数）の上下限
+SEASONAL_FACTOR_MIN = 0.5
+SEASONAL_FACTOR_MAX = 2.0
+
+DAYS_PER_YEAR = 365
+
+
+def _julian_day(dt):
+    # SQLite の julianday() と同じ基準（ユリウス日）。
+    # created_at はタイムゾーンなしの文字列なので、こちらもそのまま数える
+    return (dt - datetime(1970, 1, 1)).total_seconds() / 86400.0 + 2440587.5
+
+
+def load_item_balances(conn):
+    """商品マスタと現在庫（全ロケーション合計）を item_id 昇順で返す"""
+    return conn.execute(
+        """
+        SELECT
+            i.item_id,
+            i.name,
+            i.sku,
+            i.size,
+            i.color,
+            COALESCE(b.quantity, 0) AS stock_quantity
+        FROM ITEMS i
+        LEFT JOIN (
+            SELECT item_id, SUM(quantity) AS quantity
+            FROM STOCK_BALANCES
+            GROUP BY item_id
+        ) b ON b.item_id = i.item_id
+        WHERE i.is_active = 1
+        ORDER BY i.item_id
+        """
+    ).fetchall()
+
+
+def load_out_movements(conn, since):
+    """since 以降の OUT を (item_id, julianday, quantity) の配列で返す"""
+    rows = conn.execute(
+        """
+        SELECT item_id, julianday(created_at), quantity
+        FROM STOCK_MOVEMENTS
+        WHERE movement_type = 'OUT' AND created_at >= ?
+        """,
+        (since.strftime("%Y-%m-%d %H:%M:%S"),),
+    ).fetchall()
+
+    if not rows:
+        return (
+            np.empty(0, dtype=np.int64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+        )
+
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0].astype(np.int64), data[:, 1], data[:, 2]
+
+
+def build_forecast(
+    conn,
+    as_of=None,
+    window_days=28,
+    short_days=7,
+    lead_time_days=14,
+    review_days=7,
+    safety_days=7,
+):
+    """全商品の出庫ペース・在庫日数・推奨発注数を計算して行のリストで返す
+
+    - velocity        : 直近 window_days 日の 1 日あたり出庫数
+    - short_velocity  : 直近 short_days 日の 1 日あたり出庫数（参考）
+    - seasonal_factor : 昨年の「これからの期間」÷「直前の期間」の出庫ペース比
+    - adjusted_velocity = velocity × seasonal_factor
+    - days_of_cover   : 現在庫 ÷ adjusted_velocity（出庫なしなら None）
+    - reorder_qty     : 次の入荷までの需要 + 安全在庫 − 現在庫（0 未満は 0）
+    """
+    as_of = as_of or datetime.now()
+    horizon_days = lead_time_days + review_days
+
+    items = load_item_balances(conn)
+    if not items:
+        return []
+
+    item_ids = np.array([row["item_id"] for row in items], dtype=np.int64)
+    stock = np.array([row["stock_quantity"] for row in items], dtype=np.float64)
+    n_items = len(item_ids)
+
+    # 昨年の比較期間まで含めて一度に読み込む
+    oldest_age = max(window_days, DAYS_PER_YEAR + window_days)
+    since = as_of - timedelta(days=oldest_age)
+    out_item_ids, out_days, out_qty = load_out_movements(conn, since)
+
+    # 商品マスタにない（無効・削除済み）商品の出庫は除外して、配列の添字に変換
+    pos = np.searchsorted(item_ids, out_item_ids)
+    pos_clipped = np.minimum(pos, n_items - 1)
+    known = item_ids[pos_clipped] == out_item_ids
+    idx = pos_clipped[known]
+    qty = out_qty[known]
+    age = _julian_day(as_of) - out_days[known]  # 何日前の出庫か
+
+    def rate(min_age, max_age):
+        """age が [min_age, max_age) の出庫を商品ごとに合計して 1 日あたりにする"""
+        mask = (age >= min_age) & (age < max_age)
+        total = np.bincount(idx[mask], weights=qty[mask], minlength=n_items)
+        return total / float(max_age - min_age)
+
+    velocity = rate(0, window_days)
+    short_velocity = rate(0, short_days)
+
+    # 季節係数：昨年の同じ時期に、直前の期間と比べて売れ行きがどう変わったか
+    last_year_ahead = rate(DAYS_PER_YEAR - horizon_days, DAYS_PER_YEAR)
+    last_year_before = rate(DAYS_PER_YEAR, DAYS_PER_YEAR + window_days)
+    seasonal_factor = np.ones(n_items)
+    has_history = last_year_before > 0
+    seasonal_factor[has_history] = np.clip(
+        last_year_ahead[has_history] / last_year_before[has_history],
+        SEASONAL_FACTOR_MIN,
+        SEASONAL_FACTOR_MAX,
+    )
+
+    adjusted_velocity = velocity * seasonal_factor
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(
+            adjusted_velocity > 0,
+            np.maximum(stock, 0) / adjusted_velocity,
+            np.nan,
+        )
+
+    target = adjusted_velocity * (horizon_days + safety_days)
+    reorder_qty = np.ceil(np.maximum(target - stock, 0)).astype(np.int64)
+
+    results = []
+    for i, row in enumerate(items):
+        cover = days_of_cover[i]
+        results.append({
+            "item_id": row["item_id"],
+            "name": row["name"],
+            "sku": row["sku"],
+            "size": row["size"],
+            "color": row["color"],
+            "stock_quantity": row["stock_quantity"],
+            "velocity": round(float(velocity[i]), 2),
+            "short_velocity": round(float(short_velocity[i]), 2),
+            "seasonal_factor": round(float(seasonal_factor[i]), 2),
+            "adjusted_velocity": round(float(adjusted_velocity[i]), 2),
+            "days_of_cover": None if np.isnan(cover) else round(float(cover), 1),
+            "reorder_qty": int(reorder_qty[i]),
+        })
+
+    # 在庫日数の短い順（出庫のない商品は最後）
+    results.sort(key=lambda r: (r["days_of_cover"] is None, r["days_of_cover"] or 0))
+    return results
+
+
+FORECAST_CSV_COLUMNS = [
+    "item_id",
+    "name",
+    "sku",
+    "size",
+    "color",
+    "stock_quantity",
+    "velocity",
+    "short_velocity",
+    "seasonal_factor",
+    "adjusted_velocity",
+    "days_of_cover",
+    "reorder_qty",
+]
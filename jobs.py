@@ -0,0 +1,430 @@
+"""バックグラウンドジョブ（重い CSV 出力・集計・チェック・取り込みをリクエストの外で実行する）
+
+リクエストでは JOBS に 1 行入れて job_id を返すだけにし、実行は各ワーカープロセスの
+JobRunner（ディスパッチャーのスレッド 1 本）が引き受ける。
+    - 同時実行数 : JOBS の running の数で数えるので、gunicorn のワーカーをまたいで max_concurrency まで
+                   （待ちのジョブを見るのは読み取りだけ。取るときは status = 'queued' を条件にした
+                   UPDATE 1 文で取るので、ほかのワーカーと同じジョブを取り合っても片方しか取れない）
+    - メモリ     : ジョブごとに子プロセスを起こし、RLIMIT_AS で上限をかける
+                   （上限は import を終えた時点のアドレス空間 ＋ memory_limit_mb）
+    - 時間       : time_limit 秒を過ぎたら子プロセスを止めて失敗にする
+子プロセスは spawn で起こす（スレッドを持つ gunicorn ワーカーを fork しない）ので、
+このモジュールと各ジョブの処理は app.py を import しないこと。
+
+結果は result_dir/<job_id>.<拡張子> に保存し、ダウンロード画面から取り出す。
+ファイルの取り込み（upload が True の種類）は、アップロードされた内容をファイルに保存して
+params の input_path で渡す。/jobs・/api/jobs からは登録できない（パスを指定させない）。
+"""
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import traceback
+from datetime import datetime, timedelta
+
+# 子プロセスでは、メモリの上限をかける前にここで読み込んでおく。numpy（OpenBLAS）は
+# import 時に CPU コア数に応じたバッファを確保するので、その分は上限の外で測ってから足す
+# （run_job_process 参照。コア 1 のマシンで約 100 MB）
+from analytics import abc_sell_through
+from check_ledger import run_check
+from forecast import FORECAST_CSV_COLUMNS, build_forecast
+from stocktake import MAX_REPORTED_ERRORS, parse_counts, resolve_codes, save_counts
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+JOB_STATUS_LABELS = {
+    "queued": "待ち",
+    "running": "実行中",
+    "succeeded": "完了",
+    "failed": "失敗",
+}
+
+# 中断されたジョブ（ワーカーが落ちたなど）を失敗扱いにするまでの猶予（time_limit に足す秒数）
+STALE_GRACE_SECONDS = 60
+
+
+def now_text():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+# ==== ジョブの処理（子プロセスで実行。conn はジョブの店舗の DB） ====
+def run_forecast_csv(conn, params, out_path, db_path):
+    rows = build_forecast(conn, **params)
+    # Excel で文字化けしないよう BOM 付き UTF-8
+    with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=FORECAST_CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+ABC_CSV_COLUMNS = (
+    "abc_class", "item_id", "name", "sku", "size", "color",
+    "in_qty", "out_qty", "out_value", "cumulative_share", "sell_through",
+)
+
+
+def run_abc_csv(conn, params, out_path, db_path):
+    rows = abc_sell_through(conn, params["sql_from"], params["sql_to"], params["dimension"])
+    with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=ABC_CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+
+def run_ledger_check(conn, params, out_path, db_path):
+    # 同時実行数・メモリの上限はジョブ単位なので、チェック自体は 1 プロセスで走らせる
+    report = run_check(db_path, workers=1)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report["movements_scanned"]
+
+
+def run_stocktake_import(conn, params, out_path, db_path):
+    """棚卸の数えた数量の取り込み（CSV・スキャナーの読み取り結果）。結果は件数とエラーの一覧"""
+    try:
+        with open(params["input_path"], encoding="utf-8") as f:
+            text = f.read()
+    finally:
+        if os.path.exists(params["input_path"]):
+            os.remove(params["input_path"])
+
+    counts, errors = parse_counts(text)
+
+    # 取り込む前に確定・中止されていないかを、書き込みと同じトランザクションで確かめる
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        stocktake = conn.execute(
+            "SELECT status FROM STOCKTAKES WHERE stocktake_id = ?",
+            (params["stocktake_id"],),
+        ).fetchone()
+        if stocktake is None or stocktake["status"] != "open":
+            raise ValueError("棚卸が確定・中止されたため取り込めませんでした。")
+        item_counts, unknown = resolve_codes(conn, counts)
+        saved = 0
+        if item_counts:
+            saved = save_counts(conn, params["stocktake_id"], item_counts, params["mode"], now_text())
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    errors.extend(f"コード「{code}」の商品が見つかりません。" for code in unknown)
+    report = {
+        "stocktake_id": params["stocktake_id"],
+        "mode": params["mode"],
+        "saved": saved,
+        "error_count": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return saved
+
+
+# kind → 表示名・結果の形式・処理
+# （upload はアップロードしたファイルの取り込み。画面・API のジョブの登録からは受け付けない）
+JOB_KINDS = {
+    "forecast_csv": {
+        "label": "需要予測 CSV",
+        "ext": "csv",
+        "mimetype": "text/csv",
+        "run": run_forecast_csv,
+        "admin_only": False,
+        "upload": False,
+    },
+    "abc_csv": {
+        "label": "ABC 分析 CSV",
+        "ext": "csv",
+        "mimetype": "text/csv",
+        "run": run_abc_csv,
+        "admin_only": False,
+        "upload": False,
+    },
+    "ledger_check": {
+        "label": "在庫移動の整合性チェック",
+        "ext": "json",
+        "mimetype": "application/json",
+        "run": run_ledger_check,
+        "admin_only": True,
+        "upload": False,
+    },
+    "stocktake_import": {
+        "label": "棚卸の数量の取り込み",
+        "ext": "json",
+        "mimetype": "application/json",
+        "run": run_stocktake_import,
+        "admin_only": False,
+        "upload": True,
+    },
+}
+
+
+# ==== JOBS テーブルの操作 ====
+def submit_job(conn, tenant, kind, params, created_by, now):
+    """ジョブを待ち行列に入れて job_id を返す（commit は呼び出し側）"""
+    cur = conn.execute(
+        """
+        INSERT INTO JOBS (tenant, kind, params, status, created_by, created_at)
+        VALUES (?, ?, ?, 'queued', ?, ?)
+        """,
+        (tenant, kind, json.dumps(params, ensure_ascii=False), created_by, now),
+    )
+    return cur.lastrowid
+
+
+def claim_next_job(conn, max_concurrency, now):
+    """実行中が max_concurrency 未満なら、いちばん古い待ちのジョブを running にして返す
+
+    待ちのジョブを探すのは読み取りだけ（何もないときは書き込みロックを取らない）。
+    取るときは「まだ queued で、実行中が max_concurrency 未満なら」を条件にした UPDATE 1 文で
+    取るので、ほかのワーカーが先に取ったときや上限に達したときは何も変えずに None を返す。
+    """
+    job = conn.execute(
+        "SELECT job_id FROM JOBS WHERE status = 'queued' ORDER BY job_id LIMIT 1"
+    ).fetchone()
+    if job is None:
+        return None
+
+    cur = conn.execute(
+        """
+        UPDATE JOBS SET status = 'running', started_at = ?, worker_pid = ?
+        WHERE job_id = ?
+          AND status = 'queued'
+          AND (SELECT COUNT(*) FROM JOBS WHERE status = 'running') < ?
+        """,
+        (now, os.getpid(), job["job_id"], max_concurrency),
+    )
+    conn.commit()
+    if cur.rowcount == 0:
+        return None
+    return conn.execute("SELECT * FROM JOBS WHERE job_id = ?", (job["job_id"],)).fetchone()
+
+
+def finish_job(conn, job_id, status, now, result_path=None, result_rows=None, error=None):
+    """ジョブを完了・失敗にする（running のものだけ。commit もここで行う）"""
+    conn.execute(
+        """
+        UPDATE JOBS
+        SET status = ?, finished_at = ?, result_path = ?, result_rows = ?, error = ?
+        WHERE job_id = ? AND status = 'running'
+        """,
+        (status, now, result_path, result_rows, error, job_id),
+    )
+    conn.commit()
+
+
+def fail_stale_jobs(conn, time_limit, now):
+    """時間の上限を大きく過ぎても running のまま（実行していたワーカーが落ちた）ジョブを失敗にする"""
+    cutoff = (
+        datetime.strptime(now, "%Y-%m-%d %H:%M:%S")
+        - timedelta(seconds=time_limit + STALE_GRACE_SECONDS)
+    ).strftime("%Y-%m-%d %H:%M:%S")
+    # ふだんは何もないので、まず読み取りだけで確かめる（ポーリングのたびに書き込まない）
+    stale = conn.execute(
+        "SELECT COUNT(*) AS cnt FROM JOBS WHERE status = 'running' AND started_at < ?",
+        (cutoff,),
+    ).fetchone()["cnt"]
+    if not stale:
+        return 0
+    cur = conn.execute(
+        """
+        UPDATE JOBS SET status = 'failed', finished_at = ?, error = ?
+        WHERE status = 'running' AND started_at < ?
+        """,
+        (now, "実行中に中断されました。", cutoff),
+    )
+    conn.commit()
+    return cur.rowcount
+
+
+def purge_old_jobs(conn, keep_days, now):
+    """keep_days より前に終わったジョブの行と結果ファイルを消す"""
+    cutoff = (
+        datetime.strptime(now, "%Y-%m-%d %H:%M:%S") - timedelta(days=keep_days)
+    ).strftime("%Y-%m-%d %H:%M:%S")
+    rows = conn.execute(
+        """
+        SELECT job_id, params, result_path FROM JOBS
+        WHERE status IN ('succeeded', 'failed') AND finished_at < ?
+        """,
+        (cutoff,),
+    ).fetchall()
+    for row in rows:
+        # 取り込みの元ファイルは処理が始まれば消えるが、始まる前に失敗したものは残っている
+        input_path = json.loads(row["params"]).get("input_path")
+        for path in (row["result_path"], input_path):
+            if path and os.path.exists(path):
+                os.remove(path)
+    conn.executemany("DELETE FROM JOBS WHERE job_id = ?", [(row["job_id"],) for row in rows])
+    conn.commit()
+    return len(rows)
+
+
+# ==== 子プロセス ====
+def error_summary(e, max_length=500):
+    """画面に出す失敗の理由（例外の最後の 1 行だけ）"""
+    lines = [line.strip() for line in str(e).splitlines() if line.strip()]
+    return f"{type(e).__name__}: {lines[-1] if lines else ''}"[:max_length]
+
+
+def address_space_bytes():
+    """このプロセスの今のアドレス空間（/proc/self/statm の VmSize。読めなければ 0）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+def run_job_process(job_id, kind, params, db_path, main_db, result_path, memory_limit_mb):
+    """子プロセスの入口：メモリの上限をかけて処理を実行し、結果を JOBS に書く
+
+    memory_limit_mb は処理そのものが使ってよい量。RLIMIT_AS は import 済み（numpy など）の
+    アドレス空間を測り、それに memory_limit_mb を足した値にする。
+    """
+    if memory_limit_mb:
+        import resource
+
+        limit = address_space_bytes() + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    status, rows, error = "succeeded", None, None
+    try:
+        conn = connect(db_path)
+        try:
+            rows = JOB_KINDS[kind]["run"](conn, params, result_path, db_path)
+        finally:
+            conn.close()
+    except MemoryError:
+        status, error = "failed", f"メモリの上限（{memory_limit_mb} MB）を超えたため中止しました。"
+    except Exception as e:
+        status, error = "failed", error_summary(e)
+        traceback.print_exc()
+
+    if status == "failed" and os.path.exists(result_path):
+        os.remove(result_path)
+
+    main = connect(main_db)
+    finish_job(
+        main, job_id, status, now_text(),
+        result_path=result_path if status == "succeeded" else None,
+        result_rows=rows,
+        error=error,
+    )
+    main.close()
+
+
+class JobRunner:
+    """ワーカープロセスごとのディスパッチャー
+
+    待ちのジョブを見つけたら子プロセスで実行し、見張りのスレッドで時間の上限を守らせる。
+    ほかのワーカーで登録されたジョブも拾えるように poll_seconds ごとに JOBS を見る
+    （見るだけなら読み取りなので、在庫移動の登録などの書き込みを待たせない）。
+    """
+
+    def __init__(self, main_db, db_path_of, result_dir, max_concurrency=2,
+                 time_limit=300, memory_limit_mb=1024, poll_seconds=2.0):
+        self.main_db = main_db
+        self.db_path_of = db_path_of
+        self.result_dir = result_dir
+        self.max_concurrency = max_concurrency
+        self.time_limit = time_limit
+        self.memory_limit_mb = memory_limit_mb
+        self.poll_seconds = poll_seconds
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._context = multiprocessing.get_context("spawn")
+
+    def start(self):
+        """ディスパッチャーのスレッドを起こす（何度呼んでもよい）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="job-runner", daemon=True
+                )
+                self._thread.start()
+
+    def wake(self):
+        """ジョブを登録した直後に呼ぶ（次のポーリングを待たずに拾う）"""
+        self._wakeup.set()
+
+    def _loop(self):
+        while True:
+            try:
+                while self._dispatch_one():
+                    pass
+            except sqlite3.Error:
+                traceback.print_exc()
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+
+    def _dispatch_one(self):
+        conn = connect(self.main_db)
+        try:
+            now = now_text()
+            fail_stale_jobs(conn, self.time_limit, now)
+            job = claim_next_job(conn, self.max_concurrency, now)
+        finally:
+            conn.close()
+        if job is None:
+            return False
+
+        threading.Thread(
+            target=self._run, args=(job,), name=f"job-{job['job_id']}", daemon=True
+        ).start()
+        return True
+
+    def _run(self, job):
+        job_id = job["job_id"]
+        kind = JOB_KINDS[job["kind"]]
+        os.makedirs(self.result_dir, exist_ok=True)
+        result_path = os.path.join(self.result_dir, f"{job_id}.{kind['ext']}")
+
+        error = None
+        try:
+            proc = self._context.Process(
+                target=run_job_process,
+                args=(
+                    job_id, job["kind"], json.loads(job["params"]),
+                    self.db_path_of(job["tenant"]), self.main_db, result_path,
+                    self.memory_limit_mb,
+                ),
+                name=f"job-{job_id}",
+            )
+            proc.start()
+            proc.join(self.time_limit)
+            if proc.is_alive():
+                proc.terminate()
+                proc.join(5)
+                if proc.is_alive():
+                    proc.kill()
+                    proc.join()
+                error = f"時間の上限（{self.time_limit} 秒）を超えたため中止しました。"
+            elif proc.exitcode != 0:
+                error = f"ジョブのプロセスが異常終了しました（終了コード {proc.exitcode}）。"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        if error:
+            if os.path.exists(result_path):
+                os.remove(result_path)
+            # 子プロセスが先に結果を書いていれば running ではないので上書きされない
+            conn = connect(self.main_db)
+            finish_job(conn, job_id, "failed", now_text(), error=error)
+            conn.close()
+
+        # 空きができたので次のジョブを拾う
+        self.wake()
@@ -0,0 +1,144 @@
+"""ダッシュボード用の KPI カウンター
+
+商品数・在庫数・在庫金額・在庫僅少の商品数は KPI_COUNTERS に、
+日ごとの入庫・出庫・調整の合計は KPI_DAILY に、書き込みと同じトランザクションで足し引きする。
+ダッシュボードはこの 2 つの小さなテーブルを読むだけなので、データが増えても速さは変わらない。
+
+商品 1 件が各カウンターにどれだけ寄与しているか（contribution）を
+書き込みの前後で計算して、その差だけを足す。
+"""
+import json
+from contextlib import contextmanager
+
+# KPI_COUNTERS の name
+COUNTER_NAMES = ("sku_count", "units_on_hand", "stock_value", "low_stock_count")
+
+ZERO = {name: 0 for name in COUNTER_NAMES}
+
+
+def contribution(conn, low_stock_threshold, item_ids=None):
+    """商品（item_ids。None なら全商品）のカウンターへの寄与の合計を dict で返す
+
+    - sku_count       : 有効な商品の数
+    - units_on_hand   : 全ロケーションの在庫数の合計
+    - stock_value     : 在庫数 × 標準価格（base_price）の合計
+    - low_stock_count : 有効な商品のうち在庫数が low_stock_threshold 以下の数
+    """
+    if item_ids is None:
+        item_filter = ""
+        balance_filter = ""
+        params = [low_stock_threshold]
+    else:
+        targets = json.dumps(list(item_ids))
+        item_filter = "WHERE i.item_id IN (SELECT value FROM json_each(?))"
+        balance_filter = "WHERE item_id IN (SELECT value FROM json_each(?))"
+        params = [low_stock_threshold, targets, targets]
+
+    row = conn.execute(
+        f"""
+        SELECT
+            COALESCE(SUM(i.is_active = 1), 0) AS sku_count,
+            COALESCE(SUM(COALESCE(b.quantity, 0)), 0) AS units_on_hand,
+            COALESCE(SUM(COALESCE(b.quantity, 0) * COALESCE(i.base_price, 0)), 0) AS stock_value,
+            COALESCE(SUM(i.is_active = 1 AND COALESCE(b.quantity, 0) <= ?), 0) AS low_stock_count
+        FROM ITEMS i
+        LEFT JOIN (
+            SELECT item_id, SUM(quantity) AS quantity
+            FROM STOCK_BALANCES
+            {balance_filter}
+            GROUP BY item_id
+        ) b ON b.item_id = i.item_id
+        {item_filter}
+        """,
+        params,
+    ).fetchone()
+    return {name: row[name] for name in COUNTER_NAMES}
+
+
+def apply_delta(conn, before, after):
+    """寄与の前後の差をカウンターに足す（commit は呼び出し側）"""
+    for name in COUNTER_NAMES:
+        delta = after[name] - before[name]
+        if delta:
+            conn.execute(
+                "UPDATE KPI_COUNTERS SET value = value + ? WHERE name = ?",
+                (delta, name),
+            )
+
+
+@contextmanager
+def track_items(conn, item_ids, low_stock_threshold):
+    """with ブロック内の書き込み（在庫移動・商品の更新・削除）の前後で寄与の差を反映する"""
+    before = contribution(conn, low_stock_threshold, item_ids)
+    yield
+    apply_delta(conn, before, contribution(conn, low_stock_threshold, item_ids))
+
+
+def count_movement(conn, created_at, movement_type, quantity):
+    """在庫移動 1 件を日別の集計に足す（created_at の日付単位）"""
+    conn.execute(
+        """
+        INSERT INTO KPI_DAILY (day, movement_type, quantity, movements)
+        VALUES (?, ?, ?, 1)
+        ON CONFLICT (day, movement_type) DO UPDATE SET
+            quantity = quantity + excluded.quantity,
+            movements = movements + 1
+        """,
+        (created_at[:10], movement_type, quantity),
+    )
+
+
+def rebuild_kpis(conn, low_stock_threshold):
+    """KPI_COUNTERS と KPI_DAILY を全データから作り直す（初回作成時・修復用）"""
+    totals = contribution(conn, low_stock_threshold)
+    conn.executemany(
+        """
+        INSERT INTO KPI_COUNTERS (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        """,
+        [(name, totals[name]) for name in COUNTER_NAMES]
+        + [("low_stock_threshold", low_stock_threshold)],
+    )
+
+    conn.execute("DELETE FROM KPI_DAILY")
+    conn.execute(
+        """
+        INSERT INTO KPI_DAILY (day, movement_type, quantity, movements)
+        SELECT substr(created_at, 1, 10), movement_type, SUM(quantity), COUNT(*)
+        FROM STOCK_MOVEMENTS
+        GROUP BY substr(created_at, 1, 10), movement_type
+        """
+    )
+    return totals
+
+
+def load_dashboard(conn, today, week_start):
+    """ダッシュボードの数値を返す（today / week_start は "YYYY-MM-DD"）"""
+    counters = {
+        row["name"]: row["value"]
+        for row in conn.execute("SELECT name, value FROM KPI_COUNTERS")
+    }
+
+    def period_totals(start):
+        totals = {t: {"quantity": 0, "movements": 0} for t in ("IN", "OUT", "ADJUST", "TRANSFER")}
+        rows = conn.execute(
+            """
+            SELECT movement_type, SUM(quantity) AS quantity, SUM(movements) AS movements
+            FROM KPI_DAILY
+            WHERE day >= ? AND day <= ?
+            GROUP BY movement_type
+            """,
+            (start, today),
+        ).fetchall()
+        for row in rows:
+            totals[row["movement_type"]] = {
+                "quantity": row["quantity"],
+                "movements": row["movements"],
+            }
+        return totals
+
+    return {
+        "counters": {name: counters.get(name, 0) for name in COUNTER_NAMES},
+        "today": period_totals(today),
+        "week": period_totals(week_start),
+    }
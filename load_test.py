@@ -0,0 +1,429 @@
+"""同時に操作する店員の数を増やしながら負荷をかけ、応答時間とロック待ちを測る
+
+使い方:
+    python load_test.py --workers 1,2,4 --users 5,10,20 --duration 30
+    python load_test.py --users 40 --duration 60 --output load_report.json
+
+作業用ディレクトリに合成データの DB を作り、ワーカー数ごとに gunicorn
+（Procfile と同じ gthread）で app を起動して、店員役のスレッドに次の操作を繰り返させる。
+    - ログイン（開始時に 1 回）
+    - 商品一覧（/items）と続きの読み込み（/api/items/rows）
+    - 在庫履歴（/items/<id>/history）
+    - 在庫クイック更新（/movements/quick）の連続登録
+設定（ワーカー数 × 店員数）ごとに、スループット、画面ごとの p50/p95/p99、
+SQLITE_BUSY（app が 503 で返す "database is locked"）とエラーの割合を表示する。
+1 回ごとに DB はコピーし直すので、設定どうしの条件は同じになる。
+
+負荷をかける側も Python のスレッドなので、店員数を大きくしたときは
+このスクリプト自体の CPU 使用率も確認すること。
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = "cloth_stock.db"   # app.DB_NAME と同じ（作業用ディレクトリ内に作る）
+
+CLERK_PASSWORD = "clerkpass"
+
+# 店員の操作 → 重み
+ACTIONS = {
+    "items": 35,
+    "items_more": 10,
+    "history": 25,
+    "quick_burst": 30,
+}
+
+# 集計する画面（表示順）
+ENDPOINTS = ("login", "items", "items_more", "history", "quick_movement")
+
+# 在庫クイック更新が集中する「売れ筋」商品の数（同じ行の取り合いを起こすため）
+HOT_ITEMS = 20
+
+SIZES = ("XS", "S", "M", "L", "XL")
+COLORS = ("白", "黒", "紺", "藍", "生成り", "灰")
+
+
+# ==== 合成データの DB ====
+def run_app_snippet(workdir, code):
+    """作業用ディレクトリで app を import してコードを実行する（テーブル作成・残高の再計算）"""
+    env = dict(os.environ, PYTHONPATH=APP_DIR)
+    subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, check=True)
+
+
+def build_synthetic_db(workdir, n_items, n_movements, n_clerks, seed=1):
+    """商品・在庫移動・店員ユーザーを入れた DB を作り、そのパスを返す"""
+    rng = random.Random(seed)
+    run_app_snippet(workdir, "import app")
+
+    import sqlite3
+    db_path = os.path.join(workdir, DB_FILE)
+    conn = sqlite3.connect(db_path)
+    now = datetime.now()
+    stamp = now.strftime("%Y-%m-%d %H:%M:%S")
+
+    conn.executemany(
+        "INSERT INTO CATEGORIES (name, description, created_at) VALUES (?, NULL, ?)",
+        [(f"カテゴリ{n}", stamp) for n in range(1, 11)],
+    )
+    conn.executemany(
+        "INSERT INTO SUPPLIERS (name, created_at) VALUES (?, ?)",
+        [(f"仕入先{n}", stamp) for n in range(1, 6)],
+    )
+    conn.executemany(
+        """
+        INSERT INTO ITEMS
+            (name, sku, category_id, base_price, size, color, created_at, updated_at, is_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+        """,
+        [
+            (
+                f"商品{n // 30}",
+                f"SKU-{n:06d}",
+                rng.randint(1, 10),
+                rng.randrange(1000, 20000, 100),
+                rng.choice(SIZES),
+                rng.choice(COLORS),
+                stamp,
+                stamp,
+            )
+            for n in range(n_items)
+        ],
+    )
+    location_id = conn.execute(
+        "SELECT location_id FROM LOCATIONS ORDER BY location_id LIMIT 1"
+    ).fetchone()[0]
+
+    def movements():
+        for _ in range(n_movements):
+            movement_type = "IN" if rng.random() < 0.4 else "OUT"
+            created_at = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            yield (
+                rng.randint(1, n_items),
+                movement_type,
+                rng.randint(1, 10) if movement_type == "IN" else rng.randint(1, 3),
+                rng.randint(1, 5) if movement_type == "IN" else None,
+                created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                location_id,
+            )
+
+    conn.executemany(
+        """
+        INSERT INTO STOCK_MOVEMENTS
+            (item_id, movement_type, quantity, supplier_id, created_at, location_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        movements(),
+    )
+
+    # ハッシュの計算は重いので全員同じパスワードにする
+    password_hash = generate_password_hash(CLERK_PASSWORD)
+    conn.executemany(
+        "INSERT INTO USERS (username, password_hash, created_at, role) VALUES (?, ?, ?, 'staff')",
+        [(f"clerk{n}", password_hash, stamp) for n in range(1, n_clerks + 1)],
+    )
+    conn.commit()
+    conn.close()
+
+    run_app_snippet(
+        workdir,
+        "import app\n"
+        "conn = app.get_db_connection()\n"
+        "app.rebuild_stock_balances(conn)\n"
+        "app.rebuild_kpis(conn, app.LOW_STOCK_THRESHOLD)\n"
+        "app.backfill_prices(conn)\n"
+        "conn.commit()\n",
+    )
+    return db_path
+
+
+# ==== gunicorn の起動・停止 ====
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(rundir, workers, threads, port):
+    log_path = os.path.join(rundir, "gunicorn.log")
+    proc = subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn", "app:app",
+            "--worker-class", "gthread",
+            "--threads", str(threads),
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{port}",
+            "--chdir", rundir,
+            "--pythonpath", APP_DIR,
+            "--error-logfile", log_path,
+            "--log-level", "warning",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn が起動しませんでした（ログ: {log_path}）")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1):
+                return proc
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            time.sleep(0.2)
+
+    stop_server(proc)
+    raise RuntimeError(f"gunicorn の起動待ちがタイムアウトしました（ログ: {log_path}）")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+# ==== 店員 1 人分の操作 ====
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """POST 後のリダイレクト先（商品一覧）を取りに行かず、302 をそのまま結果にする"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Clerk:
+    def __init__(self, base_url, username, item_ids, hot_item_ids, think_time, rng, timeout):
+        self.base_url = base_url
+        self.username = username
+        self.item_ids = item_ids
+        self.hot_item_ids = hot_item_ids
+        self.think_time = think_time
+        self.rng = rng
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            NoRedirect(),
+        )
+        self.samples = []   # (endpoint, 秒, ステータス, 期待どおりか)
+
+    def call(self, endpoint, path, form=None, expect=200):
+        data = urllib.parse.urlencode(form).encode() if form is not None else None
+        started = time.perf_counter()
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=self.timeout) as res:
+                res.read()
+                status = res.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            status = 0
+        elapsed = time.perf_counter() - started
+        self.samples.append((endpoint, elapsed, status, status == expect))
+        return status
+
+    def think(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, self.think_time))
+
+    def run(self, deadline):
+        self.call(
+            "login", "/login",
+            {"username": self.username, "password": CLERK_PASSWORD},
+            expect=302,
+        )
+        actions = list(ACTIONS)
+        weights = [ACTIONS[a] for a in actions]
+
+        while time.monotonic() < deadline:
+            action = self.rng.choices(actions, weights)[0]
+            if action == "items":
+                self.call("items", "/items")
+            elif action == "items_more":
+                before_id = self.rng.choice(self.item_ids)
+                self.call("items_more", f"/api/items/rows?before_id={before_id}")
+            elif action == "history":
+                item_id = self.rng.choice(self.item_ids)
+                self.call("history", f"/items/{item_id}/history")
+            else:
+                # レジで続けて何点か売る・入荷を続けて登録する、という連続書き込み
+                item_id = self.rng.choice(self.hot_item_ids)
+                movement_type = self.rng.choice(("OUT", "OUT", "IN"))
+                for _ in range(self.rng.randint(3, 8)):
+                    if time.monotonic() >= deadline:
+                        break
+                    self.call(
+                        "quick_movement", "/movements/quick",
+                        {"item_id": item_id, "movement_type": movement_type, "quantity": 1},
+                        expect=302,
+                    )
+            self.think()
+
+
+# ==== 集計 ====
+def percentile(sorted_values, pct):
+    """最近傍順位法のパーセンタイル"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for endpoint in ENDPOINTS:
+        rows = [s for s in samples if s[0] == endpoint]
+        if not rows:
+            continue
+        times = sorted(s[1] for s in rows)
+        busy = sum(1 for s in rows if s[2] == 503)
+        errors = sum(1 for s in rows if not s[3] and s[2] != 503)
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "p50_ms": round(percentile(times, 50) * 1000, 1),
+            "p95_ms": round(percentile(times, 95) * 1000, 1),
+            "p99_ms": round(percentile(times, 99) * 1000, 1),
+            "max_ms": round(times[-1] * 1000, 1),
+            "busy": busy,
+            "errors": errors,
+        }
+
+    total = len(samples)
+    busy = sum(e["busy"] for e in endpoints.values())
+    errors = sum(e["errors"] for e in endpoints.values())
+    return {
+        "requests": total,
+        "elapsed_sec": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+        "busy_rate": round(busy / total * 100, 2) if total else 0,
+        "error_rate": round(errors / total * 100, 2) if total else 0,
+        "endpoints": endpoints,
+    }
+
+
+def run_scenario(template_db, workdir, workers, users, args, item_ids):
+    rundir = tempfile.mkdtemp(prefix=f"w{workers}-u{users}-", dir=workdir)
+    shutil.copy(template_db, os.path.join(rundir, DB_FILE))
+
+    port = free_port()
+    proc = start_server(rundir, workers, args.threads, port)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        hot_item_ids = item_ids[:HOT_ITEMS]
+        clerks = [
+            Clerk(
+                base_url,
+                f"clerk{n}",
+                item_ids,
+                hot_item_ids,
+                args.think_time,
+                random.Random(args.seed * 1000 + n),
+                args.timeout,
+            )
+            for n in range(1, users + 1)
+        ]
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [threading.Thread(target=clerk.run, args=(deadline,)) for clerk in clerks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        stop_server(proc)
+
+    samples = [s for clerk in clerks for s in clerk.samples]
+    result = summarize(samples, elapsed)
+    result.update({"workers": workers, "users": users, "threads": args.threads})
+    return result
+
+
+def print_result(result):
+    print(
+        f"\n== workers={result['workers']} threads={result['threads']} users={result['users']} : "
+        f"{result['requests']} req / {result['elapsed_sec']} 秒 = {result['throughput_rps']} req/s, "
+        f"BUSY {result['busy_rate']}%, エラー {result['error_rate']}%"
+    )
+    print(f"  {'画面':<16}{'件数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'BUSY':>7}{'エラー':>7}")
+    for endpoint, e in result["endpoints"].items():
+        print(
+            f"  {endpoint:<16}{e['requests']:>8}{e['p50_ms']:>10}{e['p95_ms']:>10}"
+            f"{e['p99_ms']:>10}{e['max_ms']:>10}{e['busy']:>7}{e['errors']:>7}"
+        )
+
+
+def int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時に操作する店員数を増やしながらの負荷試験")
+    parser.add_argument("--workers", type=int_list, default=[1, 2, 4], help="gunicorn のワーカー数（カンマ区切り）")
+    parser.add_argument("--users", type=int_list, default=[5, 10, 20], help="同時に操作する店員数（カンマ区切り）")
+    parser.add_argument("--threads", type=int, default=8, help="ワーカーごとのスレッド数（Procfile と同じ 8）")
+    parser.add_argument("--duration", type=float, default=30, help="1 設定あたりの実行時間（秒）")
+    parser.add_argument("--think-time", type=float, default=0.2, help="操作の間の待ち時間の上限（秒）")
+    parser.add_argument("--timeout", type=float, default=30, help="1 リクエストのタイムアウト（秒）")
+    parser.add_argument("--items", type=int, default=5000, help="合成データの商品数")
+    parser.add_argument("--movements", type=int, default=200000, help="合成データの在庫移動数")
+    parser.add_argument("--seed", type=int, default=1, help="乱数の種")
+    parser.add_argument("--workdir", help="作業用ディレクトリ（省略時は一時ディレクトリ。実行後に削除）")
+    parser.add_argument("--output", help="結果を JSON で書き出すファイル")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="load_test-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        template_dir = os.path.join(workdir, "template")
+        os.makedirs(template_dir, exist_ok=True)
+        print(f"合成データを作成しています（商品 {args.items} 件・在庫移動 {args.movements} 件）...")
+        template_db = build_synthetic_db(
+            template_dir, args.items, args.movements, max(args.users), seed=args.seed
+        )
+        item_ids = list(range(1, args.items + 1))
+
+        results = []
+        for workers in args.workers:
+            for users in args.users:
+                result = run_scenario(template_db, workdir, workers, users, args, item_ids)
+                print_result(result)
+                results.append(result)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "results": results},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        print(f"\n結果を書き出しました: {args.output}")
+
+    failed = any(r["error_rate"] > 0 for r in results)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""フォームの入力補完（商品・仕入先・カテゴリの検索）
+
+全件を <select> に並べる代わりに、入力された文字で上位 N 件だけを返す。
+    1. 商品ID の完全一致（数字のとき）
+    2. 名前・SKU の前方一致（索引の範囲検索）
+    3. 足りなければ部分一致（LIKE。見つかった時点で打ち切る）
+前方一致は LIKE ではなく「q 以上 q + U+10FFFF 未満」の範囲で比べるので、
+大文字・小文字を区別する代わりに通常の（BINARY 照合の）索引がそのまま使える。
+"""
+
+LOOKUP_LIMIT = 20
+MAX_LOOKUP_LIMIT = 50
+
+# 前方一致の範囲の上端（q のあとにこれを付けた文字列より小さいものが前方一致）
+PREFIX_END = "\U0010ffff"
+
+
+def like_pattern(q):
+    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def item_label(row):
+    """商品名（サイズ / 色）SKU の形の表示名（同じ商品名のサイズ・色違いを見分けるため）"""
+    variant = " / ".join(v for v in (row["size"], row["color"]) if v)
+    label = row["name"]
+    if variant:
+        label += f"（{variant}）"
+    if row["sku"]:
+        label += f" {row['sku']}"
+    return label
+
+
+def _collect(results, rows, limit):
+    seen = {r["id"] for r in results}
+    for row in rows:
+        if len(results) >= limit:
+            break
+        if row["id"] not in seen:
+            results.append(row)
+            seen.add(row["id"])
+
+
+def search_items(conn, q, limit=LOOKUP_LIMIT):
+    """有効な商品を検索して [{id, label, name, sku, size, color}] を返す"""
+    q = q.strip()
+    if not q:
+        return []
+
+    columns = "item_id, name, sku, size, color"
+    found = []
+
+    if q.isdigit():
+        found += conn.execute(
+            f"SELECT {columns} FROM ITEMS WHERE item_id = ? AND is_active = 1",
+            (int(q),),
+        ).fetchall()
+
+    # 部分索引 idx_items_active_name / idx_items_active_sku の範囲検索
+    found += conn.execute(
+        f"""
+        SELECT {columns} FROM ITEMS
+        WHERE is_active = 1 AND name >= ? AND name < ?
+        ORDER BY name, item_id
+        LIMIT ?
+        """,
+        (q, q + PREFIX_END, limit),
+    ).fetchall()
+    for sku_q in dict.fromkeys((q, q.upper())):
+        found += conn.execute(
+            f"""
+            SELECT {columns} FROM ITEMS
+            WHERE is_active = 1 AND sku >= ? AND sku < ?
+            ORDER BY sku
+            LIMIT ?
+            """,
+            (sku_q, sku_q + PREFIX_END, limit),
+        ).fetchall()
+
+    results = []
+    _collect(results, [_item_result(row) for row in found], limit)
+
+    if len(results) < limit:
+        pattern = like_pattern(q)
+        rows = conn.execute(
+            f"""
+            SELECT {columns} FROM ITEMS
+            WHERE is_active = 1
+              AND (name LIKE ? ESCAPE '\\' OR sku LIKE ? ESCAPE '\\')
+            LIMIT ?
+            """,
+            (pattern, pattern, limit + len(results)),
+        ).fetchall()
+        _collect(results, [_item_result(row) for row in rows], limit)
+
+    return results
+
+
+def _item_result(row):
+    return {
+        "id": row["item_id"],
+        "label": item_label(row),
+        "name": row["name"],
+        "sku": row["sku"],
+        "size": row["size"],
+        "color": row["color"],
+    }
+
+
+def search_by_name(conn, table, id_column, q, limit=LOOKUP_LIMIT):
+    """仕入先・カテゴリなど name 列だけで探すもの（前方一致 → 部分一致）"""
+    q = q.strip()
+    if not q:
+        return []
+
+    rows = conn.execute(
+        f"""
+        SELECT {id_column} AS id, name AS label FROM {table}
+        WHERE name >= ? AND name < ?
+        ORDER BY name
+        LIMIT ?
+        """,
+        (q, q + PREFIX_END, limit),
+    ).fetchall()
+    results = []
+    _collect(results, [dict(row) for row in rows], limit)
+
+    if len(results) < limit:
+        rows = conn.execute(
+            f"""
+            SELECT {id_column} AS id, name AS label FROM {table}
+            WHERE name LIKE ? ESCAPE '\\'
+            ORDER BY name
+            LIMIT ?
+            """,
+            (like_pattern(q), limit + len(results)),
+        ).fetchall()
+        _collect(results, [dict(row) for row in rows], limit)
+
+    return results
+
+
+def selected_label(conn, kind, value):
+    """フォームで選択済みの ID の表示名（再表示・編集画面の初期値用）"""
+    if value in (None, ""):
+        return ""
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return ""
+
+    if kind == "item":
+        row = conn.execute(
+            "SELECT item_id, name, sku, size, color FROM ITEMS WHERE item_id = ?",
+            (value,),
+        ).fetchone()
+        return item_label(row) if row else ""
+
+    table, id_column = {
+        "supplier": ("SUPPLIERS", "supplier_id"),
+        "category": ("CATEGORIES", "category_id"),
+    }[kind]
+    row = conn.execute(
+        f"SELECT name FROM {table} WHERE {id_column} = ?",
+        (value,),
+    ).fetchone()
+    return row["name"] if row else ""
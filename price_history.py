@@ -0,0 +1,157 @@
+"""価格の履歴（ITEM_PRICES）と、出庫時点の価格での売上の集計
+
+ITEMS.base_price は上書きされるので、過去の出庫を今の価格で数えてしまう。
+価格が変わるたびに (item_id, effective_from, price) を 1 行残しておき、
+売上は「出庫の日時を含む価格の期間」と結合して求める。
+
+    - 価格の期間は ITEM_PRICES から LAG / LEAD（ウィンドウ関数）で [valid_from, valid_to) にする
+      （商品ごとの最初の期間は過去に向かって開いておく。履歴を取り始める前の出庫も数えられるように）
+    - 出庫はその期間との範囲結合 1 回で値付けし、SQL の GROUP BY で集計する
+ITEM_PRICES の主キーが (item_id, effective_from) なので、同じ秒の変更は最後の価格で上書きする。
+"""
+import json
+
+# 期間の終わりがない（今も有効な）価格の valid_to
+OPEN_END = "9999-12-31 23:59:59"
+
+# 集計の単位 → 出庫を束ねるキー（bucket）と、表示用の列・GROUP BY・並び順
+REVENUE_GROUPS = {
+    "item": {
+        "label": "商品",
+        "bucket": "''",
+        "columns": "i.item_id AS item_id, i.name AS name, i.sku AS sku, i.size AS size, i.color AS color",
+        "group_by": "i.item_id",
+        "order_by": "revenue DESC, i.item_id",
+    },
+    "month": {
+        "label": "月",
+        "bucket": "substr(m.created_at, 1, 7)",
+        "columns": "NULL AS item_id, s.bucket AS name, NULL AS sku, NULL AS size, NULL AS color",
+        "group_by": "s.bucket",
+        "order_by": "s.bucket",
+    },
+    "day": {
+        "label": "日",
+        "bucket": "substr(m.created_at, 1, 10)",
+        "columns": "NULL AS item_id, s.bucket AS name, NULL AS sku, NULL AS size, NULL AS color",
+        "group_by": "s.bucket",
+        "order_by": "s.bucket",
+    },
+}
+
+
+def record_prices(conn, item_ids, now):
+    """ITEMS の今の base_price を、直前の履歴と違う商品だけ ITEM_PRICES に追記する
+
+    商品の登録・編集・一括編集の UPDATE のあとに同じトランザクションで呼ぶ（commit は呼び出し側）。
+    戻り値は追記した行数。
+    """
+    cur = conn.execute(
+        """
+        INSERT INTO ITEM_PRICES (item_id, price, effective_from)
+        SELECT i.item_id, i.base_price, ?
+        FROM ITEMS i
+        WHERE i.item_id IN (SELECT value FROM json_each(?))
+          AND NOT EXISTS (
+              SELECT 1
+              FROM (
+                  SELECT p.price
+                  FROM ITEM_PRICES p
+                  WHERE p.item_id = i.item_id
+                  ORDER BY p.effective_from DESC
+                  LIMIT 1
+              ) AS latest
+              WHERE latest.price IS i.base_price
+          )
+        ON CONFLICT (item_id, effective_from) DO UPDATE SET price = excluded.price
+        """,
+        (now, json.dumps(list(item_ids))),
+    )
+    return cur.rowcount
+
+
+def backfill_prices(conn):
+    """履歴のない商品に、今の価格を登録日時から有効な 1 行として入れる（ITEM_PRICES を作った直後に）"""
+    conn.execute(
+        """
+        INSERT INTO ITEM_PRICES (item_id, price, effective_from)
+        SELECT i.item_id, i.base_price, i.created_at
+        FROM ITEMS i
+        WHERE NOT EXISTS (SELECT 1 FROM ITEM_PRICES p WHERE p.item_id = i.item_id)
+        """
+    )
+
+
+def price_history(conn, item_id):
+    """商品の価格の履歴を新しい順に [{price, effective_from}] で返す"""
+    rows = conn.execute(
+        """
+        SELECT price, effective_from
+        FROM ITEM_PRICES
+        WHERE item_id = ?
+        ORDER BY effective_from DESC
+        """,
+        (item_id,),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def revenue_report(conn, start, end, group="item"):
+    """期間 [start, end) の出庫を、出庫した時点の価格で値付けして集計する
+
+    - revenue       : Σ 出庫数 × その時点の価格（価格の履歴から）
+    - current_value : Σ 出庫数 × 今の標準価格（ITEMS.base_price。比較用）
+    start / end は "YYYY-MM-DD HH:MM:SS" 形式の文字列。
+    """
+    g = REVENUE_GROUPS[group]
+
+    # 1. 価格の期間（LAG / LEAD）のうち集計期間に重なるものだけ残す
+    # 2. 出庫を索引（movement_type, created_at, item_id, quantity）で拾い、期間と範囲結合して
+    #    (bucket, item_id) ごとに値付けする
+    # 3. ITEMS との結合は集計後の行数分だけ
+    rows = conn.execute(
+        f"""
+        WITH periods AS (
+            SELECT
+                item_id,
+                price,
+                CASE WHEN LAG(effective_from) OVER w IS NULL THEN ''
+                     ELSE effective_from END AS valid_from,
+                LEAD(effective_from, 1, :open_end) OVER w AS valid_to
+            FROM ITEM_PRICES
+            WINDOW w AS (PARTITION BY item_id ORDER BY effective_from)
+        ),
+        active AS (
+            SELECT item_id, price, valid_from, valid_to
+            FROM periods
+            WHERE valid_to > :start AND valid_from < :end
+        ),
+        sold AS (
+            SELECT
+                {g["bucket"]} AS bucket,
+                m.item_id AS item_id,
+                SUM(m.quantity) AS out_qty,
+                SUM(m.quantity * COALESCE(p.price, 0)) AS revenue
+            FROM STOCK_MOVEMENTS m
+            LEFT JOIN active p
+                ON p.item_id = m.item_id
+               AND m.created_at >= p.valid_from
+               AND m.created_at < p.valid_to
+            WHERE m.movement_type = 'OUT'
+              AND m.created_at >= :start
+              AND m.created_at < :end
+            GROUP BY bucket, m.item_id
+        )
+        SELECT
+            {g["columns"]},
+            SUM(s.out_qty) AS out_qty,
+            SUM(s.revenue) AS revenue,
+            SUM(s.out_qty * COALESCE(i.base_price, 0)) AS current_value
+        FROM sold s
+        JOIN ITEMS i ON i.item_id = s.item_id
+        GROUP BY {g["group_by"]}
+        ORDER BY {g["order_by"]}
+        """,
+        {"start": start, "end": end, "open_end": OPEN_END},
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,313 @@
+"""商品の読み取りモデル（ワーカーごとのメモリ上の表）
+
+商品一覧・在庫履歴で毎回 JOIN・集計していた「商品名・カテゴリ名・現在庫」と
+ロケーション名をメモリに持っておく。
+
+    - 最初に使うときに DB から全件読み込む（1 つの読み取りトランザクションで）
+    - 以降はリクエストごとに CHANGE_LOG（change_log.py）の seq > high_water_mark の行だけを反映する
+      （商品・カテゴリ・ロケーションの行と、商品 × ロケーションの残高）
+    - CHANGE_LOG は書き込みと同じトランザクションで追記され、書き込みは 1 本ずつなので
+      seq の順に当てれば DB と同じ状態になる
+    - 追いかけている位置より前の削除行が整理されていたら（change_log_purged_through）全件読み直す
+
+商品は __slots__ の ItemRecord、並び順（item_id の昇順）は array で持つ。
+カテゴリでの絞り込み用に、カテゴリごとの item_id の昇順の array（category_item_ids）も持つ。
+check_consistency() で DB から作り直したものと突き合わせられる。
+"""
+import json
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from change_log import get_state
+
+ITEM_COLUMNS = (
+    "item_id", "name", "sku", "category_id", "base_price", "size", "color",
+    "material", "is_active", "updated_at",
+)
+
+
+class ItemRecord:
+    """商品 1 件
+
+    balances は {location_id: (在庫数, 最後の movement_id)}。全ロケーションの合計
+    （total_quantity / total_version）は残高を変えるたびに足し引きしておく。
+    """
+
+    __slots__ = ITEM_COLUMNS + ("balances", "total_quantity", "total_version")
+
+    def __init__(self, row):
+        for column in ITEM_COLUMNS:
+            setattr(self, column, row[column])
+        self.balances = {}
+        self.total_quantity = 0
+        self.total_version = None
+
+    def update(self, row):
+        for column in ITEM_COLUMNS:
+            setattr(self, column, row.get(column))
+
+    def set_balance(self, location_id, quantity, movement_id):
+        old = self.balances.get(location_id)
+        self.balances[location_id] = (quantity, movement_id)
+        self.total_quantity += quantity - (old[0] if old else 0)
+        if movement_id is not None and (self.total_version is None or movement_id > self.total_version):
+            self.total_version = movement_id
+
+    def stock_quantity(self, location_id=None):
+        if location_id:
+            entry = self.balances.get(location_id)
+            return entry[0] if entry else 0
+        return self.total_quantity
+
+    def balance_version(self, location_id=None):
+        """行キャッシュのキーに使う最新の movement_id（残高がなければ None）"""
+        if location_id:
+            entry = self.balances.get(location_id)
+            return entry[1] if entry else None
+        return self.total_version
+
+
+class ItemReadModel:
+    """1 店舗分の読み取りモデル。スレッド間で共有するので操作は lock の中で行う"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.high_water_mark = 0
+        self.items = {}
+        self.item_ids = array("q")   # item_id の昇順
+        self.category_item_ids = {}  # category_id → その商品の item_id の昇順
+        self.categories = {}
+        self.locations = {}
+        self.applied_changes = 0
+        self.full_loads = 0
+
+    # ==== 読み込み・差分の反映 ====
+    def refresh(self, conn):
+        """DB の変更に追いつく（初回は全件読み込み）。反映した変更の件数を返す"""
+        with self._lock:
+            if not self.loaded or self._needs_reload(conn):
+                self._load(conn)
+                return 0
+            return self._apply_changes(conn)
+
+    def _needs_reload(self, conn):
+        purged_through = int(get_state(conn, "change_log_purged_through", 0))
+        return self.high_water_mark < purged_through
+
+    def _load(self, conn):
+        # 全部の SELECT が同じ時点の DB を見るように 1 つの読み取りトランザクションで読む
+        conn.execute("BEGIN")
+        try:
+            self.high_water_mark = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM CHANGE_LOG"
+            ).fetchone()[0]
+            items = {
+                row["item_id"]: ItemRecord(row)
+                for row in conn.execute(f"SELECT {', '.join(ITEM_COLUMNS)} FROM ITEMS")
+            }
+            for item_id, location_id, quantity, last_movement_id in conn.execute(
+                "SELECT item_id, location_id, quantity, last_movement_id FROM STOCK_BALANCES"
+            ):
+                if item_id in items:
+                    items[item_id].set_balance(location_id, quantity, last_movement_id)
+            self.categories = dict(conn.execute("SELECT category_id, name FROM CATEGORIES"))
+            self.locations = dict(conn.execute("SELECT location_id, name FROM LOCATIONS"))
+        finally:
+            conn.rollback()
+
+        self.items = items
+        self.item_ids = array("q", sorted(items))
+        self.category_item_ids = {}
+        for item_id in self.item_ids:
+            category_id = items[item_id].category_id
+            self.category_item_ids.setdefault(category_id, array("q")).append(item_id)
+        self.loaded = True
+        self.full_loads += 1
+
+    def _apply_changes(self, conn, upto=None):
+        """high_water_mark より後の変更を seq の順に当てる（upto を渡すとその seq まで）"""
+        rows = conn.execute(
+            """
+            SELECT seq, entity, op, payload
+            FROM CHANGE_LOG
+            WHERE seq > ? AND seq <= ?
+            ORDER BY seq
+            """,
+            (self.high_water_mark, upto if upto is not None else 2 ** 63 - 1),
+        ).fetchall()
+
+        for row in rows:
+            apply = getattr(self, f"_apply_{row['entity']}", None)
+            if apply is not None:
+                apply(row["op"], json.loads(row["payload"]) if row["payload"] else {})
+            self.high_water_mark = row["seq"]
+
+        self.applied_changes += len(rows)
+        return len(rows)
+
+    def _apply_item(self, op, data):
+        item_id = data["item_id"]
+        record = self.items.get(item_id)
+        if op == "delete":
+            if record is not None:
+                del self.items[item_id]
+                _remove_id(self.item_ids, item_id)
+                self._remove_from_category(record.category_id, item_id)
+            return
+        if record is None:
+            record = self.items[item_id] = ItemRecord(data)
+            insort(self.item_ids, item_id)
+            insort(self.category_item_ids.setdefault(record.category_id, array("q")), item_id)
+        else:
+            old_category_id = record.category_id
+            record.update(data)
+            if record.category_id != old_category_id:
+                self._remove_from_category(old_category_id, item_id)
+                insort(self.category_item_ids.setdefault(record.category_id, array("q")), item_id)
+
+    def _remove_from_category(self, category_id, item_id):
+        ids = self.category_item_ids.get(category_id)
+        if ids is not None:
+            _remove_id(ids, item_id)
+            if not ids:
+                del self.category_item_ids[category_id]
+
+    def _apply_balance(self, op, data):
+        record = self.items.get(data["item_id"])
+        if record is not None:
+            record.set_balance(data["location_id"], data["quantity"], data["movement_id"])
+
+    def _apply_names(self, names, id_column, op, data):
+        if op == "delete":
+            names.pop(data[id_column], None)
+        else:
+            names[data[id_column]] = data["name"]
+
+    def _apply_category(self, op, data):
+        self._apply_names(self.categories, "category_id", op, data)
+
+    def _apply_location(self, op, data):
+        self._apply_names(self.locations, "location_id", op, data)
+
+    # ==== 読み取り ====
+    def item_row(self, record, location_id=None):
+        """商品一覧の 1 行（fetch_item_rows と同じ列）"""
+        return {
+            "item_id": record.item_id,
+            "name": record.name,
+            "sku": record.sku,
+            "category_name": self.categories.get(record.category_id),
+            "base_price": record.base_price,
+            "size": record.size,
+            "color": record.color,
+            "material": record.material,
+            "is_active": record.is_active,
+            "updated_at": record.updated_at,
+            "balance_version": record.balance_version(location_id),
+            "stock_quantity": record.stock_quantity(location_id),
+        }
+
+    def item_page(self, category_id=None, location_id=None, before_id=None, limit=100):
+        """商品一覧の 1 ページ分を item_id の降順で返す（before_id より小さい ID から）
+
+        カテゴリの指定があればそのカテゴリの item_id の列だけをたどる。
+        """
+        with self._lock:
+            if category_id:
+                ids = self.category_item_ids.get(category_id, array("q"))
+            else:
+                ids = self.item_ids
+            end = bisect_left(ids, before_id) if before_id else len(ids)
+            return [
+                self.item_row(self.items[ids[index]], location_id)
+                for index in range(end - 1, max(end - limit, 0) - 1, -1)
+            ]
+
+    def item_detail(self, item_id):
+        """在庫履歴の見出し用：商品名・カテゴリ名とロケーション別の現在庫（なければ None）"""
+        with self._lock:
+            record = self.items.get(item_id)
+            if record is None:
+                return None
+            balances = [
+                {
+                    "location_id": location_id,
+                    "location_name": self.locations.get(location_id),
+                    "quantity": qty,
+                }
+                for location_id, (qty, _) in sorted(record.balances.items())
+                if location_id in self.locations
+            ]
+            return {
+                "item_id": record.item_id,
+                "name": record.name,
+                "category_name": self.categories.get(record.category_id),
+                "balances": balances,
+            }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "items": len(self.items),
+                "categories": len(self.categories),
+                "locations": len(self.locations),
+                "high_water_mark": self.high_water_mark,
+                "applied_changes": self.applied_changes,
+                "full_loads": self.full_loads,
+            }
+
+    # ==== DB との突き合わせ ====
+    def check_consistency(self, conn, max_samples=20):
+        """DB から作り直したモデルと比べて、食い違いを [{kind, key, memory, db}] で返す"""
+        diffs = []
+
+        def report(kind, key, memory, db):
+            if len(diffs) < max_samples:
+                diffs.append({"kind": kind, "key": key, "memory": memory, "db": db})
+
+        # 読み直した時点（seq）までちょうど追いついた状態で比べる。
+        # 比べる前にほかのスレッドがそれより先まで進めていたら読み直す
+        self.refresh(conn)
+        for _ in range(3):
+            fresh = ItemReadModel()
+            fresh._load(conn)
+            self._lock.acquire()
+            if self.high_water_mark <= fresh.high_water_mark:
+                break
+            self._lock.release()
+        else:
+            self._lock.acquire()
+
+        try:
+            self._apply_changes(conn, upto=fresh.high_water_mark)
+            if fresh.high_water_mark != self.high_water_mark:
+                report("high_water_mark", None, self.high_water_mark, fresh.high_water_mark)
+
+            for item_id in set(self.items) | set(fresh.items):
+                mine, theirs = self.items.get(item_id), fresh.items.get(item_id)
+                if mine is None or theirs is None:
+                    report("item", item_id, mine is not None, theirs is not None)
+                    continue
+                for column in ITEM_COLUMNS + ("balances", "total_quantity", "total_version"):
+                    if getattr(mine, column) != getattr(theirs, column):
+                        report(column, item_id, getattr(mine, column), getattr(theirs, column))
+            if list(self.item_ids) != list(fresh.item_ids):
+                report("item_order", None, len(self.item_ids), len(fresh.item_ids))
+            if self.category_item_ids != fresh.category_item_ids:
+                report("category_index", None, len(self.category_item_ids), len(fresh.category_item_ids))
+            for name in ("categories", "locations"):
+                if getattr(self, name) != getattr(fresh, name):
+                    report(name, None, len(getattr(self, name)), len(getattr(fresh, name)))
+        finally:
+            self._lock.release()
+
+        return diffs
+
+
+def _remove_id(ids, item_id):
+    """昇順の array から item_id を取り除く"""
+    index = bisect_left(ids, item_id)
+    if index < len(ids) and ids[index] == item_id:
+        del ids[index]
@@ -0,0 +1,57 @@
+"""描画済み HTML 断片などのキャッシュ（商品一覧の行・レポートの集計結果）"""
+from collections import OrderedDict
+from threading import Lock
+
+
+class FragmentCache:
+    """キー → 描画済み HTML（または計算済みの結果）を LRU で保持するキャッシュ
+
+    gunicorn のワーカーごと（プロセスごと）に 1 つ持つ想定。
+    キーには「内容が変わったら必ず変わる値」（更新日時・在庫バージョンなど）を
+    含めるので、明示的な無効化はほぼ不要。古いキーは LRU で自然に追い出される。
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_render(self, key, render):
+        """キャッシュにあればそれを返し、なければ render() の結果を保存して返す"""
+        with self._lock:
+            html = self._data.get(key)
+            if html is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        # 描画はロックの外で行う（同じ行を二重に描画しても結果は同じ）
+        html = render()
+
+        with self._lock:
+            self._data[key] = html
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
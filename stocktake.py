@@ -0,0 +1,252 @@
+"""棚卸（実地棚卸の数量をまとめて取り込み、差異を ADJUST として登録する）
+
+流れ:
+    1. ロケーションを選んで棚卸を開始する
+    2. 数えた数量を CSV またはスキャナーの読み取り結果で取り込む（何回かに分けてよい）
+    3. 差異レポートを確認して確定する → 差異のある商品だけ ADJUST を 1 トランザクションで登録
+
+帳簿在庫との比較は「数えた時点」の残高で行う。取り込むたびにその時点の最大 movement_id を
+記録しておき、それより後の在庫移動（数えている間の販売など）は現在の残高から差し引いて比べる。
+こうすると確定時の ADJUST が、数えた後の移動を打ち消してしまうことがない。
+"""
+import csv
+import io
+import json
+
+# 取り込み方法：上書き（CSV の再取り込みなど）／加算（スキャナーで 1 点ずつ読んだ結果など）
+COUNT_MODES = ("replace", "add")
+
+# 取り込みエラーを画面に出す最大件数
+MAX_REPORTED_ERRORS = 20
+
+
+def parse_counts(text):
+    """「コード[,数量]」の行（CSV・スキャナーの出力）を {コード: 数量} にまとめる
+
+    - コードは SKU または商品ID
+    - 数量がない行は 1 点として数える（スキャナーで 1 点ずつ読んだ場合）
+    - 同じコードが何度も出てきたら合計する
+    - 1 行目が見出し（数量が数字でない）なら読み飛ばす
+    戻り値は (counts, errors)。
+    """
+    counts = {}
+    errors = []
+
+    reader = csv.reader(io.StringIO(text.replace("\t", ",")))
+    for line_no, cols in enumerate(reader, start=1):
+        cols = [c.strip() for c in cols]
+        if not cols or not cols[0]:
+            continue
+
+        code = cols[0]
+        raw_qty = cols[1] if len(cols) > 1 and cols[1] else None
+        if raw_qty is None:
+            qty = 1
+        else:
+            try:
+                qty = int(raw_qty)
+            except ValueError:
+                if line_no == 1:
+                    continue   # 見出し行
+                errors.append(f"{line_no}行目：数量「{raw_qty}」が整数ではありません。")
+                continue
+            if qty < 0:
+                errors.append(f"{line_no}行目：数量はマイナスにできません。")
+                continue
+
+        counts[code] = counts.get(code, 0) + qty
+
+    return counts, errors
+
+
+def resolve_codes(conn, counts):
+    """{コード: 数量} を {item_id: 数量} に変換する（SKU を優先し、なければ商品ID）
+
+    戻り値は (item_counts, unknown_codes)。
+    """
+    codes = list(counts)
+    sku_ids = {
+        row["sku"]: row["item_id"]
+        for row in conn.execute(
+            "SELECT item_id, sku FROM ITEMS WHERE sku IN (SELECT value FROM json_each(?))",
+            (json.dumps(codes),),
+        )
+    }
+
+    numeric = [int(c) for c in codes if c not in sku_ids and c.isdigit()]
+    known_ids = {
+        row["item_id"]
+        for row in conn.execute(
+            "SELECT item_id FROM ITEMS WHERE item_id IN (SELECT value FROM json_each(?))",
+            (json.dumps(numeric),),
+        )
+    }
+
+    item_counts = {}
+    unknown = []
+    for code, qty in counts.items():
+        if code in sku_ids:
+            item_id = sku_ids[code]
+        elif code.isdigit() and int(code) in known_ids:
+            item_id = int(code)
+        else:
+            unknown.append(code)
+            continue
+        item_counts[item_id] = item_counts.get(item_id, 0) + qty
+
+    return item_counts, unknown
+
+
+def save_counts(conn, stocktake_id, item_counts, mode, now):
+    """数えた数量を保存する（commit は呼び出し側）
+
+    その時点の最大 movement_id を「数えた時点」として一緒に記録する。
+    加算のときは最初に数えた時点のままにする（続きを数えているだけなので）。
+    """
+    snapshot = conn.execute(
+        "SELECT COALESCE(MAX(movement_id), 0) AS id FROM STOCK_MOVEMENTS"
+    ).fetchone()["id"]
+
+    if mode == "add":
+        on_conflict = """
+            counted_quantity = counted_quantity + excluded.counted_quantity,
+            counted_at = excluded.counted_at
+        """
+    else:
+        on_conflict = """
+            counted_quantity = excluded.counted_quantity,
+            snapshot_movement_id = excluded.snapshot_movement_id,
+            counted_at = excluded.counted_at
+        """
+
+    conn.executemany(
+        f"""
+        INSERT INTO STOCKTAKE_COUNTS
+            (stocktake_id, item_id, counted_quantity, snapshot_movement_id, counted_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (stocktake_id, item_id) DO UPDATE SET {on_conflict}
+        """,
+        [
+            (stocktake_id, item_id, qty, snapshot, now)
+            for item_id, qty in item_counts.items()
+        ],
+    )
+    return len(item_counts)
+
+
+def variance_rows(conn, stocktake_id, location_id, only_diff=False):
+    """数えた商品ごとに、数えた時点の帳簿在庫と差異を返す（1 本の SQL でまとめて計算）
+
+    - current_quantity : 今のロケーション残高（STOCK_BALANCES）
+    - later_delta      : 数えた後に入った、このロケーションの在庫移動の増減
+    - book_quantity    : 数えた時点の帳簿在庫 = current_quantity − later_delta
+    - variance         : counted_quantity − book_quantity（これを ADJUST で登録する）
+    数えた後の移動は movement_id（= rowid）の範囲で読むので、最近の移動だけを見る。
+    """
+    rows = conn.execute(
+        f"""
+        WITH later AS (
+            SELECT
+                m.item_id,
+                SUM(
+                    CASE
+                        WHEN m.movement_type = 'TRANSFER' THEN
+                            (CASE WHEN m.to_location_id = :loc THEN m.quantity ELSE 0 END)
+                            - (CASE WHEN m.location_id = :loc THEN m.quantity ELSE 0 END)
+                        WHEN m.location_id = :loc THEN
+                            CASE WHEN m.movement_type = 'OUT' THEN -m.quantity ELSE m.quantity END
+                        ELSE 0
+                    END
+                ) AS delta
+            FROM STOCK_MOVEMENTS m
+            JOIN STOCKTAKE_COUNTS c
+              ON c.stocktake_id = :stocktake_id
+             AND c.item_id = m.item_id
+            WHERE m.movement_id > (
+                    SELECT COALESCE(MIN(snapshot_movement_id), 0)
+                    FROM STOCKTAKE_COUNTS WHERE stocktake_id = :stocktake_id
+                  )
+              AND m.movement_id > c.snapshot_movement_id
+            GROUP BY m.item_id
+        )
+        SELECT *
+        FROM (
+            SELECT
+                c.item_id,
+                i.name,
+                i.sku,
+                i.size,
+                i.color,
+                c.counted_quantity,
+                c.counted_at,
+                COALESCE(b.quantity, 0) AS current_quantity,
+                COALESCE(l.delta, 0) AS later_delta,
+                COALESCE(b.quantity, 0) - COALESCE(l.delta, 0) AS book_quantity,
+                c.counted_quantity - (COALESCE(b.quantity, 0) - COALESCE(l.delta, 0)) AS variance,
+                COALESCE(i.base_price, 0) AS base_price
+            FROM STOCKTAKE_COUNTS c
+            LEFT JOIN ITEMS i ON i.item_id = c.item_id
+            LEFT JOIN STOCK_BALANCES b
+              ON b.item_id = c.item_id AND b.location_id = :loc
+            LEFT JOIN later l ON l.item_id = c.item_id
+            WHERE c.stocktake_id = :stocktake_id
+        )
+        {"WHERE variance <> 0" if only_diff else ""}
+        ORDER BY ABS(variance) DESC, item_id
+        """,
+        {"stocktake_id": stocktake_id, "loc": location_id},
+    ).fetchall()
+    return rows
+
+
+def committed_rows(conn, stocktake_id):
+    """確定済みの棚卸の結果（確定時に保存した帳簿在庫・差異）を返す"""
+    return conn.execute(
+        """
+        SELECT
+            c.item_id,
+            i.name,
+            i.sku,
+            i.size,
+            i.color,
+            c.counted_quantity,
+            c.counted_at,
+            c.book_quantity,
+            c.counted_quantity - c.book_quantity AS variance,
+            COALESCE(i.base_price, 0) AS base_price,
+            c.movement_id
+        FROM STOCKTAKE_COUNTS c
+        LEFT JOIN ITEMS i ON i.item_id = c.item_id
+        WHERE c.stocktake_id = ?
+        ORDER BY ABS(c.counted_quantity - c.book_quantity) DESC, c.item_id
+        """,
+        (stocktake_id,),
+    ).fetchall()
+
+
+def count_uncounted(conn, stocktake_id, location_id):
+    """ロケーションに在庫があるのに、まだ数えていない商品の数"""
+    return conn.execute(
+        """
+        SELECT COUNT(*) AS cnt
+        FROM STOCK_BALANCES b
+        WHERE b.location_id = ?
+          AND b.quantity <> 0
+          AND NOT EXISTS (
+              SELECT 1 FROM STOCKTAKE_COUNTS c
+              WHERE c.stocktake_id = ? AND c.item_id = b.item_id
+          )
+        """,
+        (location_id, stocktake_id),
+    ).fetchone()["cnt"]
+
+
+def summarize_variance(rows):
+    """数えた商品数・差異のある商品数・差異の数量と金額の合計"""
+    return {
+        "counted_items": len(rows),
+        "diff_items": sum(1 for r in rows if r["variance"]),
+        "plus_quantity": sum(r["variance"] for r in rows if r["variance"] > 0),
+        "minus_quantity": sum(r["variance"] for r in rows if r["variance"] < 0),
+        "variance_value": sum(r["variance"] * r["base_price"] for r in rows),
+    }
@@ -0,0 +1,119 @@
+"""店舗（テナント）ごとの DB の振り分けと、全店舗の横断集計
+
+1 つのデプロイで複数の店舗を動かすため、店舗ごとに別の SQLite ファイルを使う。
+    - 既定の店舗（DEFAULT_TENANT）は今までどおり DB_NAME を使う（既存の DB はそのまま動く）
+    - それ以外の店舗は TENANT_DB_DIR/<slug>.db
+店舗の一覧（TENANTS）とユーザー（USERS）は既定の DB に置き、
+ログインしたユーザーの店舗の DB にリクエストごとに接続する。
+ファイルが別なので、ある店舗の書き込みが混んでも他の店舗の書き込みはロックされない。
+
+横断集計は各店舗の KPI_COUNTERS / KPI_DAILY（kpi.py）だけを読むので、
+店舗数が増えても 1 店舗あたり小さな読み取り 2 回で済む。店舗ごとに読み取り専用で開き、
+スレッドプールで並列に読む（sqlite3 は問い合わせ中 GIL を手放す）。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from kpi import COUNTER_NAMES
+
+DEFAULT_TENANT = "default"
+
+# 店舗 ID（URL・ファイル名に使うので英小文字・数字・-・_ のみ）
+TENANT_SLUG_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+# 横断集計で同時に開く DB の数
+TENANT_REPORT_WORKERS = 8
+
+
+def is_valid_slug(slug):
+    return bool(slug) and TENANT_SLUG_RE.match(slug) is not None
+
+
+def tenant_db_path(slug, default_db, tenant_dir):
+    """店舗の DB ファイルのパス"""
+    if slug == DEFAULT_TENANT:
+        return default_db
+    if not is_valid_slug(slug):
+        raise ValueError(f"店舗 ID が不正です: {slug!r}")
+    return os.path.join(tenant_dir, f"{slug}.db")
+
+
+def hash_api_token(token):
+    """店舗ごとの API トークンはハッシュだけを保存する（照合はハッシュの一致で行う）"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def list_tenants(conn):
+    """登録済みの店舗（既定の店舗が先頭）を [{slug, name, created_at}] で返す"""
+    rows = conn.execute(
+        """
+        SELECT slug, name, created_at FROM TENANTS
+        ORDER BY slug <> ?, slug
+        """,
+        (DEFAULT_TENANT,),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def create_tenant(conn, slug, name, now, api_token=None):
+    """TENANTS に店舗を登録する（commit・DB ファイルの作成は呼び出し側）"""
+    conn.execute(
+        "INSERT INTO TENANTS (slug, name, api_token_hash, created_at) VALUES (?, ?, ?, ?)",
+        (slug, name, hash_api_token(api_token) if api_token else None, now),
+    )
+
+
+def tenant_summary(db_path, since):
+    """1 店舗分の KPI（在庫数・在庫金額など）と since 以降の入出庫の合計
+
+    読み取り専用で開くので、DB がまだない店舗はエラーとして返す。
+    """
+    summary = {name: 0 for name in COUNTER_NAMES}
+    summary.update({"in_quantity": 0, "out_quantity": 0, "movements": 0, "error": None})
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=5)
+    except sqlite3.Error as e:
+        summary["error"] = str(e)
+        return summary
+
+    try:
+        for row in conn.execute("SELECT name, value FROM KPI_COUNTERS"):
+            if row[0] in summary:
+                summary[row[0]] = row[1]
+        row = conn.execute(
+            """
+            SELECT
+                COALESCE(SUM(CASE WHEN movement_type = 'IN' THEN quantity END), 0),
+                COALESCE(SUM(CASE WHEN movement_type = 'OUT' THEN quantity END), 0),
+                COALESCE(SUM(movements), 0)
+            FROM KPI_DAILY
+            WHERE day >= ?
+            """,
+            (since,),
+        ).fetchone()
+        summary["in_quantity"], summary["out_quantity"], summary["movements"] = row
+    except sqlite3.Error as e:
+        summary["error"] = str(e)
+    finally:
+        conn.close()
+    return summary
+
+
+def cross_tenant_report(tenants, db_path_of, since, workers=TENANT_REPORT_WORKERS):
+    """全店舗の集計をスレッドプールで並列に読み、店舗ごとの行と合計を返す
+
+    tenants は list_tenants() の結果、db_path_of は slug → DB パスの関数。
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tenants)))) as pool:
+        summaries = list(pool.map(
+            lambda t: tenant_summary(db_path_of(t["slug"]), since),
+            tenants,
+        ))
+
+    rows = [dict(tenant, **summary) for tenant, summary in zip(tenants, summaries)]
+    keys = COUNTER_NAMES + ("in_quantity", "out_quantity", "movements")
+    totals = {key: sum(r[key] for r in rows if not r["error"]) for key in keys}
+    return rows, totals
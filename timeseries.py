@@ -0,0 +1,145 @@
+"""商品の在庫数の推移（グラフ用の時系列）と間引き
+
+在庫移動ごとの増減は SQL の CASE で、期間の開始時点の残高は SQL の SUM で求め、
+推移は np.cumsum でまとめて計算する（1 行ずつの Python のループはしない）。
+よく動く商品は数万点になるので、ブラウザに送る前に指定の点数まで間引く。
+    - lttb   : Largest-Triangle-Three-Buckets（見た目の形を保つ）
+    - minmax : 区間ごとの最小・最大（欠品や急な増減を必ず残す）
+"""
+import numpy as np
+
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+# 在庫の増減（全ロケーション合計では TRANSFER は 0）
+TOTAL_DELTA_SQL = """
+    CASE movement_type
+        WHEN 'IN' THEN quantity
+        WHEN 'OUT' THEN -quantity
+        WHEN 'ADJUST' THEN quantity
+        ELSE 0
+    END
+"""
+
+# ロケーション別では TRANSFER は移動元でマイナス・移動先でプラス
+LOCATION_DELTA_SQL = """
+    CASE
+        WHEN movement_type = 'TRANSFER' THEN
+            (CASE WHEN to_location_id = :loc THEN quantity ELSE 0 END)
+            - (CASE WHEN location_id = :loc THEN quantity ELSE 0 END)
+        WHEN location_id = :loc THEN
+            CASE WHEN movement_type = 'OUT' THEN -quantity ELSE quantity END
+        ELSE 0
+    END
+"""
+
+
+def load_stock_series(conn, item_id, start, end, location_id=None, until=None):
+    """期間 [start, end) の在庫数の推移を (時刻[秒], 在庫数) の 2 つの配列で返す
+
+    先頭は start 時点の残高、末尾は end 時点（until を渡すと end と until の早いほう）の
+    残高（＝最後の移動のあとの残高）。日時は "YYYY-MM-DD HH:MM:SS" 形式の文字列。
+    """
+    delta_sql = LOCATION_DELTA_SQL if location_id else TOTAL_DELTA_SQL
+    params = {"item_id": item_id, "start": start, "end": end, "loc": location_id}
+
+    opening = conn.execute(
+        f"""
+        SELECT COALESCE(SUM({delta_sql}), 0)
+        FROM STOCK_MOVEMENTS
+        WHERE item_id = :item_id AND created_at < :start
+        """,
+        params,
+    ).fetchone()[0]
+
+    # 件数が多いので sqlite3.Row ではなくタプルで受け取る
+    cur = conn.cursor()
+    cur.row_factory = None
+    rows = cur.execute(
+        f"""
+        SELECT created_at, {delta_sql}
+        FROM STOCK_MOVEMENTS
+        WHERE item_id = :item_id AND created_at >= :start AND created_at < :end
+        ORDER BY created_at, movement_id
+        """,
+        params,
+    ).fetchall()
+
+    # 日時の文字列は numpy でまとめて解釈する（SQL の strftime より速い）
+    created = np.array([row[0] for row in rows], dtype="datetime64[s]").astype(np.int64)
+    deltas = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    times = np.concatenate(([_epoch(start)], created, [_epoch(min(end, until or end))]))
+    steps = np.cumsum(deltas) + opening
+    quantities = np.concatenate(([opening], steps, [steps[-1] if len(steps) else opening]))
+    return times, quantities
+
+
+def _epoch(text):
+    return int(np.datetime64(text, "s").astype(np.int64))
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets で n_out 点に間引いたときの添字を返す
+
+    先頭と末尾は必ず残し、間を n_out - 2 個の区間に分けて、
+    「前に選んだ点」と「次の区間の平均」と作る三角形が最大になる点を区間ごとに選ぶ。
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # 区間 [edges[i], edges[i+1])
+
+    # 次の区間の平均（最後の区間の次は末尾の点）
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    avg_x = np.append(sums_x / counts, x[-1])
+    avg_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        bx, by = x[lo:hi], y[lo:hi]
+        area = np.abs(
+            (x[prev] - avg_x[i + 1]) * (by - y[prev])
+            - (x[prev] - bx) * (avg_y[i + 1] - y[prev])
+        )
+        prev = lo + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def minmax(x, y, n_out):
+    """n_out / 2 個の区間に分け、区間ごとの最小と最大の点の添字を返す（先頭・末尾も残す）"""
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    buckets = n_out // 2 - 1
+    bucket = (np.arange(n - 2) * buckets) // (n - 2)
+    # 区間ごとに y で並べると、各区間の先頭が最小・末尾が最大
+    order = np.lexsort((y[1:n - 1], bucket)) + 1
+    sorted_bucket = bucket[order - 1]
+    first = np.flatnonzero(np.r_[True, sorted_bucket[1:] != sorted_bucket[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+    return np.unique(np.concatenate(([0, n - 1], order[first], order[last])))
+
+
+def downsample(times, quantities, n_out, method="lttb"):
+    """method で n_out 点以下に間引いた (時刻, 在庫数) を返す"""
+    pick = lttb if method == "lttb" else minmax
+    index = pick(times, quantities, n_out)
+    return times[index], quantities[index]
+
+
+def format_times(times):
+    """時刻[秒] の配列を "YYYY-MM-DD HH:MM:SS" の文字列のリストにする"""
+    return [
+        t.replace("T", " ")
+        for t in np.datetime_as_string(times.astype("datetime64[s]"), unit="s")
+    ]